@@ -0,0 +1,946 @@
+"""This module benchmarks the editing engine of tVIM without a window.
+
+Each benchmark drives a HeadlessEditor (or the objects behind it) and runs
+in a process of its own, so the peak memory it reports is its own. The
+results are written as JSON, and a run can be compared against the JSON of
+an earlier run to catch performance regressions:
+
+    python -m my_modules.Benchmarks --output before.json
+    ... change the code ...
+    python -m my_modules.Benchmarks --output after.json --compare before.json
+
+The search, open and save benchmarks run once per size of synthetic file,
+from 1MB up to 1GB with '--sizes 1MB,64MB,1GB'. Files of LARGE_FILE_SIZE or
+more are opened read-only as a LargeFile, like the 'Open' menu does.
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# resource only exists on Unix, peak memory is left out elsewhere
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Import our modules
+from my_modules.Headless import * # Runs the commands without a window
+from my_modules.Remote import * # Sends files to a running tVIM
+from my_modules.Gutter import status_text # Shows the cursor's line and column
+import my_modules.FileCache # Remembers files between sessions
+
+
+# The sizes of the synthetic files used by default
+DEFAULT_SIZES = "1MB,16MB,128MB"
+
+# The size of the text edited by the insert, delete and command benchmarks
+EDIT_SIZE = 1 << 20
+# The number of edits or commands timed by each of those benchmarks
+EDIT_COUNT = 10000
+COMMAND_COUNT = 1000
+
+# The number of lines of the text of the typing_status benchmark
+STATUS_LINES = 1000000
+
+# The number of lines of the Python file of the syntax benchmarks, and the
+# number of lines in view that are lexed after every key
+SYNTAX_LINES = 100000
+VIEW_LINES = 23
+
+# A few lines of Python, repeated to make the file of the syntax benchmarks
+PYTHON_BLOCK = '''@decorator
+def function_%d(argument, other=None):
+    """Returns the argument, unless other is given.
+
+    other: a value used instead of argument.
+    """
+    if other is None:  # The common case
+        return len(str(argument)) + 0x1f
+    return other * 1.5e3
+
+'''
+
+# The number of files in the index of the find benchmark, and the queries
+# it times
+FIND_FILES = 500000
+FIND_QUERIES = ("main", "parsrhelp", "test_lexer", "xyzzy", "cfgldr.py",
+                "srcviewidx")
+
+# The number of files opened in turn by the edit_many benchmark
+FILE_COUNT = 50
+
+# The number and size of the files searched by the grep benchmark
+GREP_FILES = 1000
+GREP_SIZE = 1 << 16
+
+# The number of batches appended to the log followed by the follow
+# benchmark, the lines in each batch and the most lines kept
+FOLLOW_BATCHES = 200
+FOLLOW_BATCH_LINES = 1000
+FOLLOW_LINES = 100000
+
+# The folder the startup benchmarks start Python in, so my_modules imports
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script of the first_paint benchmark: it opens a window, and prints
+# once the window has been laid out and drawn
+FIRST_PAINT_SCRIPT = """
+from my_modules.MainModule import *
+session = tk_session()
+
+def painted():
+    session.root.update_idletasks()
+    print("painted", flush=True)
+    session.windows[0].close()
+
+session.root.after(0, painted)
+tVIM()
+"""
+
+# The number of keys sent at once by the held_key benchmark
+HELD_KEYS = 1000
+
+# The benchmarks that open a window, skipped where there is no display
+DISPLAY_BENCHMARKS = {"first_paint", "held_key"}
+
+# A run slower than the one compared against by this fraction is flagged
+DEFAULT_THRESHOLD = 0.2
+
+# Words the synthetic files are made of, with a rare word and dates to find
+WORDS = ("the quick brown fox jumps over lazy dog lorem ipsum dolor sit amet "
+         "tVIM buffer piece table search pattern editor").split()
+RARE_WORD = "needle"
+DATE_PATTERN = "\\v\\d{4}-\\d\\d-\\d\\d"
+
+
+def parse_size(size):
+    """Returns the number of bytes in a size like '512KB', '16MB' or '1GB'."""
+
+    units = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+    size = size.strip().upper()
+    if size[-2:] in units:
+        return int(float(size[:-2]) * units[size[-2:]])
+
+    return int(size)
+
+
+def synthetic_text(size, seed=0):
+    """Returns size bytes of lines of words, with a RARE_WORD about every
+    1000 lines and a date about every 100 lines.
+
+    Parameters
+    ----------
+    size: an int, the number of bytes (all chars are ASCII).
+    seed: an int, the seed of the random words, defaults to 0.
+    """
+
+    generator = random.Random(seed)
+    lines = []
+    length = 0
+    # A block of 64KB is made once and repeated up to the size
+    while length < min(size, 1 << 16):
+        words = generator.choices(WORDS, k=generator.randint(0, 14))
+        if generator.random() < 0.001:
+            words.insert(generator.randint(0, len(words)), RARE_WORD)
+        if generator.random() < 0.01:
+            words.append("%04d-%02d-%02d" % (generator.randint(1970, 2030),
+                                             generator.randint(1, 12),
+                                             generator.randint(1, 28)))
+        line = " ".join(words) + "\n"
+        lines.append(line)
+        length += len(line)
+    block = "".join(lines)
+
+    text = block * (size // len(block)) + block[:size % len(block)]
+
+    return text[:-1] + "\n" if text else text
+
+
+def synthetic_file(folder, size):
+    """Returns the path of a synthetic file of size bytes in a folder,
+    writing it only if it is not there yet."""
+
+    filename = os.path.join(folder, "tvim-bench-%d.txt" % size)
+    if not os.path.exists(filename) or os.path.getsize(filename) != size:
+        block = synthetic_text(min(size, 1 << 24))
+        with open(filename, "wt") as file:
+            for _ in range(size // len(block)):
+                file.write(block)
+            file.write(block[:size % len(block)])
+
+    return filename
+
+
+"""The code below provides the benchmarks.
+
+Each benchmark takes the folder with the synthetic files and a size in bytes
+(ignored by the ones that do not use files), runs the work it times once and
+returns the (seconds, operations) it measured. Setup is not timed.
+"""
+
+
+def synthetic_crlf_file(folder, size):
+    """Returns the path of the synthetic file of size bytes with '\r\n'
+    line endings, writing it only if it is not there yet."""
+
+    filename = os.path.join(folder, "tvim-bench-crlf-%d.txt" % size)
+    if not os.path.exists(filename):
+        with open(synthetic_file(folder, size), "rb") as source, \
+                open(filename, "wb") as target:
+            for line in source:
+                target.write(line.replace(b"\n", b"\r\n"))
+
+    return filename
+
+
+def synthetic_gzip_file(folder, size):
+    """Returns the path of the synthetic file of size bytes compressed with
+    gzip, writing it only if it is not there yet."""
+
+    filename = os.path.join(folder, "tvim-bench-%d.txt.gz" % size)
+    if not os.path.exists(filename):
+        with open(synthetic_file(folder, size), "rb") as source, \
+                gzip.open(filename, "wb", compresslevel=GZIP_LEVEL) as target:
+            shutil.copyfileobj(source, target)
+
+    return filename
+
+
+def synthetic_python(folder):
+    """Returns the path of a Python file of about SYNTAX_LINES lines in a
+    folder, writing it only if it is not there yet."""
+
+    filename = os.path.join(folder, "tvim-bench-syntax.py")
+    if not os.path.exists(filename):
+        count = SYNTAX_LINES // PYTHON_BLOCK.count("\n")
+        with open(filename, "wt") as file:
+            file.writelines(PYTHON_BLOCK % i for i in range(count))
+
+    return filename
+
+
+def wait_for_index(editor):
+    """Waits until the line index of a LargeFile is built."""
+
+    while not getattr(editor.buffer, "done", True):
+        time.sleep(0.001)
+
+
+def bench_insert(folder, size):
+    """Inserts single chars at random offsets of a 1MB buffer."""
+
+    editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+    generator = random.Random(1)
+    offsets = [generator.randint(0, EDIT_SIZE) for _ in range(EDIT_COUNT)]
+
+    start = time.perf_counter()
+    for offset in offsets:
+        editor.view.insert(offset, "x")
+
+    return time.perf_counter() - start, EDIT_COUNT
+
+
+def bench_typing(folder, size):
+    """Types chars one at a time in insert mode, through HeadlessEditor.keys."""
+
+    editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+    editor.keys("1000Gi")
+    keys = ("typed text\r" * (EDIT_COUNT // 11 + 1))[:EDIT_COUNT]
+
+    start = time.perf_counter()
+    editor.keys(keys)
+
+    return time.perf_counter() - start, EDIT_COUNT
+
+
+def bench_typing_status(folder, size):
+    """Types like bench_typing in a file of a million lines, working out
+    the status line after every key like a window would."""
+
+    editor = HeadlessEditor("a short line\n" * STATUS_LINES)
+    editor.keys("%dGi" % (STATUS_LINES // 2))
+    keys = ("typed text\r" * (EDIT_COUNT // 11 + 1))[:EDIT_COUNT]
+
+    start = time.perf_counter()
+    for key in keys:
+        editor.keys(key)
+        status_text(editor)
+
+    return time.perf_counter() - start, EDIT_COUNT
+
+
+def bench_typing_swap(folder, size):
+    """Types like bench_typing with a swap file logging every keystroke."""
+
+    editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+    path = os.path.join(folder, ".tvim-bench.swp")
+    swap = SwapFile(editor.buffer, path, None)
+    editor.keys("1000Gi")
+    keys = ("typed text\r" * (EDIT_COUNT // 11 + 1))[:EDIT_COUNT]
+
+    start = time.perf_counter()
+    editor.keys(keys)
+    seconds = time.perf_counter() - start
+    swap.close()
+
+    return seconds, EDIT_COUNT
+
+
+def bench_syntax_typing(folder, size):
+    """Types lines that open and close strings into the middle of a Python
+    file, lexing the lines in view after every key like a window would."""
+
+    editor = HeadlessEditor.open(synthetic_python(folder))
+    syntax = editor.document.syntax
+    line = SYNTAX_LINES // 2
+    editor.keys("%dGo" % line)
+    syntax.tokens(line, line + VIEW_LINES)
+    keys = ('x = """typed"""\r' * (EDIT_COUNT // 16 + 1))[:EDIT_COUNT]
+
+    start = time.perf_counter()
+    for key in keys:
+        editor.keys(key)
+        syntax.tokens(line, line + VIEW_LINES)
+
+    return time.perf_counter() - start, EDIT_COUNT
+
+
+def bench_syntax_lex(folder, size):
+    """Lexes a whole Python file, as showing its last lines first does."""
+
+    editor = HeadlessEditor.open(synthetic_python(folder))
+    last = editor.buffer.line_count()
+
+    start = time.perf_counter()
+    editor.document.syntax.tokens(last - VIEW_LINES, last)
+
+    return time.perf_counter() - start, last
+
+
+def bench_delete(folder, size):
+    """Deletes single chars at random offsets of a 1MB buffer."""
+
+    editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+    generator = random.Random(2)
+    offsets = [generator.randint(0, EDIT_SIZE - EDIT_COUNT - 1)
+               for _ in range(EDIT_COUNT)]
+
+    start = time.perf_counter()
+    for offset in offsets:
+        editor.view.delete(offset, 1)
+
+    return time.perf_counter() - start, EDIT_COUNT
+
+
+def bench_undo(folder, size):
+    """Pastes 1000 lines COMMAND_COUNT times into a 1MB buffer, then undoes
+    and redoes every paste."""
+
+    editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+    editor.keys("y999j")
+
+    start = time.perf_counter()
+    editor.keys("p" * COMMAND_COUNT)
+    editor.keys("u" * COMMAND_COUNT)
+    editor.keys("\x12" * COMMAND_COUNT)
+
+    return time.perf_counter() - start, 3 * COMMAND_COUNT
+
+
+def command_bench(keys, profiled=False):
+    """Returns a benchmark that types keys COMMAND_COUNT times into an
+    editor on a 1MB buffer, starting from line 1000, with ':profile start'
+    if profiled is True."""
+
+    def bench(folder, size):
+        editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+        editor.keys("1000G")
+        if profiled:
+            editor.line(":profile start")
+
+        start = time.perf_counter()
+        for _ in range(COMMAND_COUNT):
+            editor.keys(keys)
+
+        return time.perf_counter() - start, COMMAND_COUNT
+
+    bench.__doc__ = "Types '%s' in command mode on a 1MB buffer." % (
+        keys.replace("\x1b", "<Esc>"))
+
+    return bench
+
+
+def bench_macro(folder, size):
+    """Replays a macro that comments out a line and moves down, with
+    '1000@a' on a 1MB buffer."""
+
+    editor = HeadlessEditor(synthetic_text(EDIT_SIZE))
+    editor.keys("qaI# \x1bjq")
+
+    start = time.perf_counter()
+    editor.keys("%d@a" % COMMAND_COUNT)
+
+    return time.perf_counter() - start, COMMAND_COUNT
+
+
+def search_bench(pattern):
+    """Returns a benchmark that searches a synthetic file for pattern."""
+
+    def bench(folder, size):
+        editor = HeadlessEditor.open(synthetic_file(folder, size))
+        wait_for_index(editor)
+
+        start = time.perf_counter()
+        editor.line("?" + pattern)
+
+        return time.perf_counter() - start, 1
+
+    bench.__doc__ = "Searches a synthetic file for '%s'." % pattern
+
+    return bench
+
+
+def bench_search_cached(folder, size):
+    """Repeats a search made before the synthetic file was closed and
+    opened again, whose matches come from the FileCache."""
+
+    filename = synthetic_file(folder, size)
+    editor = HeadlessEditor.open(filename)
+    wait_for_index(editor)
+    editor.line("?" + DATE_PATTERN)
+    editor.close()
+    editor = HeadlessEditor.open(filename)
+    wait_for_index(editor)
+
+    start = time.perf_counter()
+    editor.line("?" + DATE_PATTERN)
+
+    return time.perf_counter() - start, 1
+
+
+def bench_open(folder, size):
+    """Opens a synthetic file, including the line index of a LargeFile."""
+
+    filename = synthetic_file(folder, size)
+
+    start = time.perf_counter()
+    editor = HeadlessEditor.open(filename)
+    # The line index is needed before the last line can be shown
+    wait_for_index(editor)
+    editor.buffer.line_start(editor.buffer.line_count())
+
+    return time.perf_counter() - start, 1
+
+
+def bench_open_cached(folder, size):
+    """Opens a synthetic file again after closing it, taking its format,
+    its line index and the cursor from the FileCache."""
+
+    filename = synthetic_file(folder, size)
+    editor = HeadlessEditor.open(filename)
+    wait_for_index(editor)
+    editor.keys("G")
+    editor.close()
+
+    start = time.perf_counter()
+    editor = HeadlessEditor.open(filename)
+    wait_for_index(editor)
+    editor.buffer.line_start(editor.buffer.line_count())
+
+    return time.perf_counter() - start, 1
+
+
+def bench_open_crlf(folder, size):
+    """Opens a synthetic file with '\r\n' line endings, which are turned
+    into '\n' as the file is decoded."""
+
+    filename = synthetic_crlf_file(folder, size)
+
+    start = time.perf_counter()
+    editor = HeadlessEditor.open(filename)
+    wait_for_index(editor)
+    editor.buffer.line_start(editor.buffer.line_count())
+
+    return time.perf_counter() - start, 1
+
+
+def bench_open_gzip(folder, size):
+    """Opens the synthetic file compressed with gzip, decompressing it as it
+    is decoded."""
+
+    filename = synthetic_gzip_file(folder, size)
+
+    start = time.perf_counter()
+    editor = HeadlessEditor.open(filename)
+    editor.buffer.line_start(editor.buffer.line_count())
+
+    return time.perf_counter() - start, 1
+
+
+def bench_save(folder, size):
+    """Saves a synthetic file under a new name, after one edit to it."""
+
+    editor = HeadlessEditor.open(synthetic_file(folder, size))
+    if not editor.view.read_only:
+        editor.keys("ggItop\x1b")
+    target = os.path.join(folder, "tvim-bench-save.txt")
+
+    start = time.perf_counter()
+    editor.save_file(target)
+    seconds = time.perf_counter() - start
+    os.remove(target)
+
+    return seconds, 1
+
+
+def bench_save_gzip(folder, size):
+    """Saves the synthetic file compressed with gzip under a new name, after
+    one edit to it, compressing it again."""
+
+    editor = HeadlessEditor.open(synthetic_gzip_file(folder, size))
+    editor.keys("ggItop\x1b")
+    target = os.path.join(folder, "tvim-bench-save.txt.gz")
+
+    start = time.perf_counter()
+    editor.save_file(target)
+    seconds = time.perf_counter() - start
+    os.remove(target)
+
+    return seconds, 1
+
+
+def bench_follow(folder, size):
+    """Appends batches of lines to a log followed with ':follow' and a line
+    cap, timing the frames that append each batch and drop the oldest
+    lines."""
+
+    filename = os.path.join(folder, "tvim-bench-follow.log")
+    with open(filename, "w") as file:
+        file.write("start\n")
+    editor = HeadlessEditor.open(filename)
+    editor.keys("G")
+    editor.line(":follow %d" % FOLLOW_LINES)
+    batch = "".join("%s line %d of the log\n" % (DATE_PATTERN, line)
+                    for line in range(FOLLOW_BATCH_LINES))
+
+    seconds = 0
+    for _ in range(FOLLOW_BATCHES):
+        with open(filename, "a") as file:
+            file.write(batch)
+        size = os.path.getsize(filename)
+        while editor.follower.offset != size:
+            time.sleep(0.001)
+        start = time.perf_counter()
+        editor.poll_follow()
+        seconds += time.perf_counter() - start
+    editor.close()
+    os.remove(filename)
+
+    return seconds, FOLLOW_BATCHES
+
+
+def bench_filter(folder, size):
+    """Pipes a whole synthetic text through 'cat' with ':%!cat'."""
+
+    editor = HeadlessEditor(synthetic_text(size))
+
+    start = time.perf_counter()
+    editor.line(":%!cat")
+
+    return time.perf_counter() - start, 1
+
+
+def bench_find(folder, size):
+    """Ranks the paths of a FIND_FILES file index for a few queries."""
+
+    generator = random.Random(2)
+    names = ("src lib test util core model view controller main index config "
+             "api server client data parser lexer token helper loader").split()
+    folders = {}
+    count = 0
+    while count < FIND_FILES:
+        path = os.path.join(*generator.choices(names, k=generator.randint(1, 6)))
+        files = ["%s_%s%d%s" % (generator.choice(names), generator.choice(names),
+                                count + i, generator.choice((".py", ".c", ".txt")))
+                 for i in range(generator.randint(1, 40))]
+        folders[path] = (0, files, [])
+        count += len(files)
+    index = FileIndex(tempfile.mkdtemp(dir=folder), saved=False)
+    index.wait()
+    index._publish(folders)
+
+    start = time.perf_counter()
+    for query in FIND_QUERIES:
+        index.search(query)
+
+    return time.perf_counter() - start, len(FIND_QUERIES)
+
+
+def bench_edit_many(folder, size):
+    """Opens FILE_COUNT files of EDIT_SIZE in turn with ':e'. The hidden
+    ones are unloaded, so the last file opens as fast as the first."""
+
+    source = synthetic_file(folder, EDIT_SIZE)
+    filenames = []
+    for number in range(FILE_COUNT):
+        filename = os.path.join(folder, "tvim-bench-edit-%d.txt" % number)
+        if not os.path.exists(filename):
+            shutil.copyfile(source, filename)
+        filenames.append(filename)
+    editor = HeadlessEditor()
+
+    start = time.perf_counter()
+    for filename in filenames:
+        editor.line(":e " + filename)
+
+    return time.perf_counter() - start, FILE_COUNT
+
+
+def bench_grep(folder, size):
+    """Searches GREP_FILES files of GREP_SIZE for RARE_WORD with ':vimgrep'
+    in the worker processes, once they have been started."""
+
+    grep_folder = os.path.join(folder, "tvim-bench-grep")
+    if not os.path.exists(grep_folder):
+        os.makedirs(grep_folder)
+        for number in range(GREP_FILES):
+            filename = os.path.join(grep_folder, "%d.txt" % number)
+            with open(filename, "wt") as file:
+                file.write(synthetic_text(GREP_SIZE, seed=number))
+    editor = HeadlessEditor()
+    # Starting the pool is paid once per session, not per search
+    GrepJob(RARE_WORD, [os.path.join(grep_folder, "0.txt")]).wait()
+
+    start = time.perf_counter()
+    editor.line(":vimgrep /%s/j %s" % (RARE_WORD, grep_folder))
+    elapsed = time.perf_counter() - start
+    editor.close()
+
+    return elapsed, GREP_FILES
+
+
+def bench_import_time(folder, size):
+    """Imports MainModule in a new Python, as reported by
+    'python -X importtime' (the slowest imports can be found there too)."""
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                              "import my_modules.MainModule"],
+                             capture_output=True, text=True, check=True,
+                             cwd=PACKAGE_ROOT)
+    # Each line is 'import time: self [us] | cumulative | name'
+    for line in process.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "my_modules.MainModule":
+            return int(fields[1]) / 1e6, 1
+
+    raise RuntimeError("MainModule is missing from:\n" + process.stderr)
+
+
+def bench_first_paint(folder, size):
+    """Starts a new Python that opens a tVIM window, until the window has
+    been drawn. This is what launching the editor from a script costs."""
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", FIRST_PAINT_SCRIPT],
+                               stdout=subprocess.PIPE, text=True,
+                               cwd=PACKAGE_ROOT)
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.wait()
+    if line.strip() != "painted":
+        raise RuntimeError("The window could not be opened.")
+
+    return elapsed, 1
+
+
+def bench_held_key(folder, size):
+    """Sends HELD_KEYS 'j' keys at once to a tVIM window, like a key held
+    down or a burst of keys, until they are handled and the window is
+    redrawn."""
+
+    from my_modules.MainModule import tVIM, tk_session
+
+    session = tk_session()
+    seconds = []
+
+    def send():
+        window = session.windows[0]
+        window.cmd_line.focus_force()
+        start = time.perf_counter()
+        for _ in range(HELD_KEYS):
+            window.cmd_line.event_generate("<KeyPress-j>", when="tail")
+
+        def redrawn():
+            # The keys are handled before Tk is idle, then the frames run
+            if len(window.scheduler):
+                session.root.after_idle(redrawn)
+                return
+            seconds.append(time.perf_counter() - start)
+            window.close()
+
+        session.root.after_idle(redrawn)
+
+    session.root.after(0, send)
+    tVIM(synthetic_text(EDIT_SIZE))
+
+    return seconds[0], HELD_KEYS
+
+
+def bench_remote(folder, size):
+    """Starts a new Python that sends a file to a running tVIM with
+    '--remote', until it exits. It should not start Tk at all."""
+
+    server = RemoteServer("bench-%d" % os.getpid())
+    try:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "my_modules.Remote", "--remote",
+                        "--servername", server.name, "notes.txt"],
+                       check=True, cwd=PACKAGE_ROOT)
+        elapsed = time.perf_counter() - start
+        if server.requests.get(timeout=REMOTE_TIMEOUT) == None:
+            raise RuntimeError("The file was not sent.")
+    finally:
+        server.close()
+
+    return elapsed, 1
+
+
+def display_available():
+    """Returns whether windows can be opened. Only X11 and Wayland can be
+    without a display."""
+
+    if not sys.platform.startswith(("linux", "freebsd", "openbsd")):
+        return True
+
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+# Maps the name of each benchmark to its function and whether it runs once
+# per size of synthetic file
+BENCHMARKS = {
+    "insert": (bench_insert, False),
+    "typing": (bench_typing, False),
+    "typing_status": (bench_typing_status, False),
+    "typing_swap": (bench_typing_swap, False),
+    "syntax_typing": (bench_syntax_typing, False),
+    "syntax_lex": (bench_syntax_lex, False),
+    "delete": (bench_delete, False),
+    "undo": (bench_undo, False),
+    "gg": (command_bench("gg"), False),
+    "G": (command_bench("G"), False),
+    "o": (command_bench("o\x1b"), False),
+    "O": (command_bench("O\x1b"), False),
+    "gg_profiled": (command_bench("gg", profiled=True), False),
+    "macro": (bench_macro, False),
+    "search_literal": (search_bench(RARE_WORD), True),
+    "search_regex": (search_bench(DATE_PATTERN), True),
+    "search_cached": (bench_search_cached, True),
+    "open": (bench_open, True),
+    "open_cached": (bench_open_cached, True),
+    "open_crlf": (bench_open_crlf, True),
+    "open_gzip": (bench_open_gzip, True),
+    "save": (bench_save, True),
+    "save_gzip": (bench_save_gzip, True),
+    "filter": (bench_filter, True),
+    "follow": (bench_follow, False),
+    "edit_many": (bench_edit_many, False),
+    "find": (bench_find, False),
+    "grep": (bench_grep, False),
+    "import_time": (bench_import_time, False),
+    "first_paint": (bench_first_paint, False),
+    "held_key": (bench_held_key, False),
+    "remote": (bench_remote, False),
+}
+
+
+"""The code below runs the benchmarks and compares their results."""
+
+
+def run_in_child(name, folder, size, repeat, queue):
+    """Runs a benchmark repeat times and puts its results on a queue. Runs
+    in a process of its own."""
+
+    function = BENCHMARKS[name][0]
+    runs = []
+    for _ in range(repeat):
+        # Each run starts with an empty FileCache, so every run does the
+        # same work
+        cache_folder = tempfile.mkdtemp(prefix="tvim-bench-cache-", dir=folder)
+        my_modules.FileCache.CACHE_FOLDER = cache_folder
+        runs.append(function(folder, size))
+        shutil.rmtree(cache_folder, ignore_errors=True)
+    peak_rss = None
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux counts in KB, macOS in bytes
+        if sys.platform == "darwin":
+            peak_rss //= 1024
+    queue.put((runs, peak_rss))
+
+
+def run_benchmark(name, folder, size, repeat):
+    """Runs a benchmark in a new process and returns its result as a dict.
+
+    Parameters
+    ----------
+    name: a str, the name of the benchmark in BENCHMARKS.
+    folder: a str, the folder with the synthetic files.
+    size: an int, the size of the synthetic file in bytes.
+    repeat: an int, the number of times the benchmark is run.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_in_child,
+                              args=(name, folder, size, repeat, queue))
+    process.start()
+    runs, peak_rss = queue.get()
+    process.join()
+
+    seconds = [run[0] for run in runs]
+    operations = runs[0][1]
+    best = min(seconds)
+
+    return {"seconds": best,
+            "median_seconds": statistics.median(seconds),
+            "operations": operations,
+            "seconds_per_operation": best / operations,
+            "peak_rss_kb": peak_rss}
+
+
+def git_commit():
+    """Returns the hash of the commit being benchmarked, or None."""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, folder, repeat, names=None):
+    """Runs the benchmarks and returns their results with the details of
+    the machine they ran on.
+
+    Parameters
+    ----------
+    sizes: a list of ints, the sizes of the synthetic files in bytes.
+    folder: a str, the folder the synthetic files are kept in.
+    repeat: an int, the number of times each benchmark is run.
+    names: a list of the names of the benchmarks to run, defaults to all.
+    """
+
+    results = {}
+    for name, (function, sized) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        if name in DISPLAY_BENCHMARKS and not display_available():
+            print("%-24s skipped, no display" % name)
+            continue
+        for size in (sizes if sized else [EDIT_SIZE]):
+            key = "%s[%s]" % (name, format_size(size)) if sized else name
+            results[key] = run_benchmark(name, folder, size, repeat)
+            print("%-24s %10.6f s  %10.3f us/op  %s KB peak" % (
+                key, results[key]["seconds"],
+                results[key]["seconds_per_operation"] * 1e6,
+                results[key]["peak_rss_kb"]))
+
+    return {"commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "results": results}
+
+
+def format_size(size):
+    """Returns a size in bytes the way parse_size reads it, like '16MB'."""
+
+    for unit, scale in (("GB", 1 << 30), ("MB", 1 << 20), ("KB", 1 << 10)):
+        if size >= scale and size % scale == 0:
+            return "%d%s" % (size // scale, unit)
+
+    return str(size)
+
+
+def compare(old, new, threshold):
+    """Prints how each benchmark changed between two runs.
+
+    Parameters
+    ----------
+    old: a dict, the JSON of the earlier run.
+    new: a dict, the JSON of the later run.
+    threshold: a float, how much slower (as a fraction) a benchmark may get
+               before it is flagged.
+
+    Returns
+    -------
+    The names of the benchmarks that got slower than threshold allows.
+    """
+
+    regressions = []
+    print("\n%-24s %12s %12s %8s" % ("benchmark", "old (s)", "new (s)", "ratio"))
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before = old["results"][name]["seconds"]
+        after = result["seconds"]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print("%-24s %12.6f %12.6f %8.2f%s" % (name, before, after, ratio, flag))
+
+    return regressions
+
+
+def main(argv=None):
+    """Runs the benchmarks from the command line. Exits with 1 if a
+    benchmark got slower than the run it is compared against."""
+
+    parser = argparse.ArgumentParser(description="Benchmarks tVIM's editing "
+                                     "engine without opening a window.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="sizes of the synthetic files, like 1MB,1GB")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="the number of runs of each benchmark, the "
+                        "fastest is kept")
+    parser.add_argument("--folder", default=tempfile.gettempdir(),
+                        help="where the synthetic files are kept")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS),
+                        help="the benchmarks to run, defaults to all")
+    parser.add_argument("--output", help="the JSON file to write results to")
+    parser.add_argument("--compare", help="the JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="the slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = run_benchmarks(sizes, args.folder, args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "rt") as file:
+            old = json.load(file)
+        if compare(old, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""This module connects a TextBuffer to the Tkinter Text widget that shows it.
+
+The TextBuffer is the source of truth for the document. Commands edit the
+document through a BufferView, which changes the buffer, and every BufferView
+of the buffer renders the change in its widget as the buffer reports it. So
+several windows can show the same document. Edits that Tkinter makes on its
+own (typing, pasting, deleting with backspace) are caught by renaming the
+widget's Tcl command, so they are copied into the buffer before the widget
+applies them.
+"""
+
+# Import our modules
+from my_modules.Profiler import span # Times the renders for ':profile'
+
+
+class BufferView():
+    """The BufferView class keeps a Text widget in step with a TextBuffer.
+
+    Instance vars
+    -------------
+    widget: The Tkinter Text widget that renders the buffer.
+    buffer: The TextBuffer that holds the document.
+    _orig: The name the widget's original Tcl command was renamed to.
+    _copying: Whether an edit made by the widget is being copied into the
+              buffer, so it is not rendered a second time.
+    read_only: Always False, commands that edit check it first.
+    """
+
+    read_only = False
+
+    def __init__(self, widget, buffer):
+        """Initializes a BufferView and renders the buffer into the widget.
+
+        Parameters
+        ----------
+        self: BufferView instance.
+        widget: a Tkinter Text widget.
+        buffer: a TextBuffer instance.
+        """
+
+        self.widget = widget
+        self.buffer = buffer
+        self._copying = False
+
+        # Route every call to the widget's Tcl command through _dispatch
+        self._orig = widget._w + "_orig"
+        widget.tk.call("rename", widget._w, self._orig)
+        widget.tk.createcommand(widget._w, self._dispatch)
+        self._bind_id = widget.bind("<Destroy>", self._close, add="+")
+        buffer.listeners.append(self._render_edit)
+
+        self.render()
+
+    def detach(self):
+        """Gives the widget back its own Tcl command and stops rendering the
+        buffer, so another view can use the widget."""
+
+        if self._render_edit in self.buffer.listeners:
+            self.buffer.listeners.remove(self._render_edit)
+        self.widget.unbind("<Destroy>", self._bind_id)
+        self.widget.tk.deletecommand(self.widget._w)
+        self.widget.tk.call("rename", self._orig, self.widget._w)
+
+    @span("render")
+    def render(self):
+        """Replaces everything in the widget with the text of the buffer."""
+
+        self._call("delete", "1.0", "end")
+        self._call("insert", "1.0", self.buffer.get_text())
+
+    # The methods below are used by commands to edit and move around
+
+    def insert(self, offset, text):
+        """Inserts text into the buffer and the widget.
+
+        Parameters
+        ----------
+        self: BufferView instance.
+        offset: an int, where the text is inserted.
+        text: the str that is inserted.
+        """
+
+        self.buffer.insert(offset, text)
+
+    def delete(self, offset, length):
+        """Deletes text from the buffer and the widget.
+
+        Parameters
+        ----------
+        self: BufferView instance.
+        offset: an int, the offset of the first char deleted.
+        length: an int, the number of chars deleted.
+
+        Returns
+        -------
+        The str that was deleted.
+        """
+
+        return self.buffer.delete(offset, length)
+
+    def cursor(self):
+        """Returns the offset of the insert cursor."""
+
+        return self.offset(self._call("index", "insert"))
+
+    def set_cursor(self, offset):
+        """Moves the insert cursor to an offset and scrolls it into view.
+
+        Parameters
+        ----------
+        self: BufferView instance.
+        offset: an int, the new offset of the cursor.
+        """
+
+        index = self.index(offset)
+        self._call("mark", "set", "insert", index)
+        self._call("see", index)
+
+    def check_cursor(self):
+        """Does nothing, the whole buffer is in the widget."""
+
+    def yscroll(self, first, last):
+        """Moves the scrollbar to the part of the buffer in view."""
+
+        self.widget.vbar.set(first, last)
+
+    def focus(self):
+        """Moves the keyboard focus to the widget, for insert mode."""
+
+        self.widget.focus()
+
+    def loaded_range(self):
+        """Returns the (start, end) offsets of the text loaded in the widget,
+        which is the whole buffer."""
+
+        return 0, len(self.buffer)
+
+    def index(self, offset):
+        """Returns the Tkinter index str ("line.column") of an offset.
+
+        Parameters
+        ----------
+        self: BufferView instance.
+        offset: an int, an offset in the buffer.
+        """
+
+        line, column = self.buffer.offset_to_index(offset)
+
+        return "%d.%d" % (line, column)
+
+    def offset(self, index):
+        """Returns the buffer offset of a Tkinter index.
+
+        Parameters
+        ----------
+        self: BufferView instance.
+        index: a str, any index the widget understands (e.g. "insert").
+        """
+
+        line, column = self._call("index", index).split(".")
+
+        return self.buffer.index_to_offset(int(line), int(column))
+
+    # The methods below handle the calls Tkinter makes to the widget
+
+    def _call(self, *args):
+        """Calls the widget's original Tcl command with args."""
+
+        return self.widget.tk.call(self._orig, *args)
+
+    def _render_edit(self, offset, deleted, inserted):
+        """Renders an edit of the buffer in the widget. Called by the buffer
+        on every edit, after it is made."""
+
+        if self._copying:
+            return
+
+        # The text before offset is unchanged, so its index is too
+        line, column = self.buffer.offset_to_index(offset)
+        start = "%d.%d" % (line, column)
+        if deleted:
+            lines = deleted.count('\n')
+            if lines:
+                column = len(deleted) - deleted.rfind('\n') - 1
+            else:
+                column += len(deleted)
+            self._call("delete", start, "%d.%d" % (line + lines, column))
+        if inserted:
+            self._call("insert", start, inserted)
+
+    def _dispatch(self, operation, *args):
+        """Copies the edits made to the widget into the buffer, then passes
+        the call on to the widget."""
+
+        if operation in ("insert", "delete", "replace"):
+            self._copying = True
+            try:
+                self._copy_edit(operation, args)
+            finally:
+                self._copying = False
+
+        return self._call(operation, *args)
+
+    def _copy_edit(self, operation, args):
+        """Copies an insert, delete or replace call into the buffer."""
+
+        if operation == "insert":
+            # The args are an index followed by (chars, tags) pairs
+            offset = self.offset(args[0])
+            for text in args[1::2]:
+                self.buffer.insert(offset, text)
+                offset += len(text)
+
+        elif operation == "delete":
+            self._copy_delete(*args[:2])
+
+        elif operation == "replace":
+            self._copy_delete(*args[:2])
+            offset = self.offset(args[0])
+            for text in args[2::2]:
+                self.buffer.insert(offset, text)
+                offset += len(text)
+
+    def _copy_delete(self, first, last=None):
+        """Deletes the chars between two Tkinter indices from the buffer."""
+
+        start = self.offset(first)
+        end = self.offset(last) if last is not None else start + 1
+        if end > start:
+            self.buffer.delete(start, end - start)
+
+    def _close(self, event):
+        """Removes the Tcl command created for _dispatch."""
+
+        if event.widget is self.widget:
+            if self._render_edit in self.buffer.listeners:
+                self.buffer.listeners.remove(self._render_edit)
+            self.widget.tk.deletecommand(self.widget._w)
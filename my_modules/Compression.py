@@ -0,0 +1,137 @@
+"""This module lets tVIM edit compressed files, like rotated '.log.gz'
+files, as the text they hold.
+
+The compression of a file is told by the magic bytes it starts with, not by
+its name. A compressed file is read as a stream of its decompressed bytes,
+so it is never decompressed to disk first, and saved back through a
+streaming compressor of the same kind. gzip, xz and bz2 come with Python,
+zstd needs the zstandard package. Each codec is only imported once a file
+compressed with it is read or saved, so plain files never load them.
+"""
+
+
+# The magic bytes each compression starts with. A bz2 stream is 'BZh',
+# its block size and the magic number of its first block
+MAGICS = ((b"\x1f\x8b", "gzip"), (b"\xfd7zXZ\x00", "xz"),
+          (b"\x28\xb5\x2f\xfd", "zstd"))
+BZ2_MAGIC = b"BZh"
+BZ2_BLOCK_MAGIC = b"1AY&SY"
+# The number of bytes looked at to tell the compression of a file
+MAGIC_SIZE = 10
+
+# The levels files are compressed at on save: the defaults of the gzip, xz
+# and zstd commands, which keep a save of a big log quick
+GZIP_LEVEL = 6
+XZ_PRESET = 6
+BZ2_LEVEL = 9
+ZSTD_LEVEL = 3
+
+NO_ZSTANDARD_ERROR = "zstd files need the zstandard package."
+
+
+def zstandard_module():
+    """Returns the zstandard module, imported on the first zstd file.
+
+    Raises
+    ------
+    OSError without the zstandard package, which is optional.
+    """
+
+    try:
+        import zstandard
+    except ImportError:
+        raise OSError(NO_ZSTANDARD_ERROR)
+
+    return zstandard
+
+
+def sniff_compression(filename):
+    """Returns the compression of a file: "gzip", "xz", "bz2", "zstd" or
+    None for a file that is not compressed, or that does not exist.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file.
+    """
+
+    try:
+        with open(filename, "rb") as file:
+            data = file.read(MAGIC_SIZE)
+    except OSError:
+        return None
+
+    for magic, compression in MAGICS:
+        if data.startswith(magic):
+            return compression
+    if (data.startswith(BZ2_MAGIC) and data[3:4].isdigit()
+            and data[4:10] == BZ2_BLOCK_MAGIC):
+        return "bz2"
+
+    return None
+
+
+def decompressed(file, compression):
+    """Returns a binary file object reading the decompressed bytes of a
+    file, from where the file is.
+
+    Parameters
+    ----------
+    file: a binary file object, the file as it is on disk.
+    compression: a str as returned by sniff_compression, or None, in which
+                 case the file itself is returned.
+
+    Raises
+    ------
+    OSError for a zstd file without the zstandard package.
+    """
+
+    if compression == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=file, mode="rb")
+    if compression == "xz":
+        import lzma
+        return lzma.LZMAFile(file, "rb")
+    if compression == "bz2":
+        import bz2
+        return bz2.BZ2File(file, "rb")
+    if compression == "zstd":
+        zstandard = zstandard_module()
+        return zstandard.ZstdDecompressor().stream_reader(
+            file, read_across_frames=True, closefd=False)
+
+    return file
+
+
+def compressed(file, compression):
+    """Returns a binary file object that compresses what is written to it
+    into a file. Closing it ends the compressed stream but leaves the file
+    open.
+
+    Parameters
+    ----------
+    file: a binary file object open for writing.
+    compression: a str as returned by sniff_compression, or None, in which
+                 case the file itself is returned.
+
+    Raises
+    ------
+    OSError for zstd without the zstandard package.
+    """
+
+    if compression == "gzip":
+        import gzip
+        # An empty name, or the name of the temporary file would be kept
+        return gzip.GzipFile(filename="", mode="wb", fileobj=file,
+                             compresslevel=GZIP_LEVEL)
+    if compression == "xz":
+        import lzma
+        return lzma.LZMAFile(file, "wb", preset=XZ_PRESET)
+    if compression == "bz2":
+        import bz2
+        return bz2.BZ2File(file, "wb", compresslevel=BZ2_LEVEL)
+    if compression == "zstd":
+        zstandard = zstandard_module()
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+            file, closefd=False)
+
+    return file
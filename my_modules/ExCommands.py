@@ -0,0 +1,74 @@
+"""This module holds the registry of ':' commands (ex commands).
+
+Each ex command is a function(tVIM, argument) registered under one or more
+names with the ex_command decorator. Plugins can add their own commands the
+same way:
+
+    from my_modules.ExCommands import ex_command
+
+    @ex_command("hello")
+    def hello_command(tVIM, argument):
+        ...
+
+A command registered with bang=True can also be typed with a '!' right after
+its name, like ':q!', and is called as function(tVIM, argument, bang).
+"""
+
+import re
+
+
+# Maps the name of each ex command to its (function, bang) pair, bang
+# being whether it takes a '!'
+EX_COMMANDS = {}
+
+# Splits ':name args' (or ':name! args') into its name, its '!' and its
+# argument
+EX_COMMAND_RE = re.compile(r'\s*([A-Za-z]+)(!?)\s*(.*)', re.DOTALL)
+
+
+def ex_command(*names, bang=False):
+    """Returns a decorator that registers a function as an ex command.
+
+    Parameters
+    ----------
+    names: strs, the names the command is typed as after ':'.
+    bang: a bool, whether the command takes a '!' after its name, passed
+          to the function as a third argument, defaults to False.
+    """
+
+    def register(function):
+        for name in names:
+            EX_COMMANDS[name] = (function, bang)
+        return function
+
+    return register
+
+
+def run_ex_command(tVIM, line):
+    """Runs the ex command typed in cmd_line.
+
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    line: a str, what was typed after ':'.
+
+    Returns
+    -------
+    Whether a command with that name, taking a '!' if one was typed, was
+    found.
+    """
+
+    match = EX_COMMAND_RE.fullmatch(line)
+    if match is None or match.group(1) not in EX_COMMANDS:
+        return False
+    function, takes_bang = EX_COMMANDS[match.group(1)]
+    if match.group(2) and not takes_bang:
+        return False
+
+    argument = match.group(3).strip()
+    if takes_bang:
+        function(tVIM, argument, match.group(2) == "!")
+    else:
+        function(tVIM, argument)
+
+    return True
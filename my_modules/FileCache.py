@@ -0,0 +1,253 @@
+"""This module keeps what tVIM learned about a file from one session to the
+next.
+
+When a document is unloaded, the format it was read in, its line index, the
+offset of the cursor and the matches of its last searches are saved to
+CACHE_FOLDER, under the path, size, mtime and inode of the file. When the
+file is opened again and none of these has changed, it is decoded in that
+format at once, its lines are not indexed again, the cursor goes back where
+it was and a search made before is highlighted without scanning the file.
+
+Each entry is a line of JSON followed by the raw bytes of its arrays, so an
+index of millions of lines is read back with a single frombytes(). The cache
+is kept under CACHE_LIMIT bytes by dropping the entries used least recently.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+from collections import OrderedDict
+
+# Import our modules
+from my_modules.FileFormat import * # Keeps the encoding and line endings
+
+
+# The entries are saved in this folder
+CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".tvim", "cache")
+
+# The most bytes the entries take together, the entries used least
+# recently are dropped past it
+CACHE_LIMIT = 128 << 20
+
+# The number of searches remembered for each file, and the most matches a
+# search may have to be remembered
+SEARCH_LIMIT = 8
+MATCH_LIMIT = 1 << 20
+
+
+def file_key(filename):
+    """Returns what tells whether a file changed: its path, size, mtime and
+    inode, as a list, or None if the file can not be found.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file.
+    """
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns,
+            stat.st_ino]
+
+
+def entry_path(filename):
+    """Returns the path of the entry of a file in CACHE_FOLDER."""
+
+    key = hashlib.sha1(os.path.abspath(filename).encode("utf-8",
+                                                        "surrogatepass"))
+
+    return os.path.join(CACHE_FOLDER, key.hexdigest() + ".cache")
+
+
+class CacheEntry():
+    """The CacheEntry class is what is remembered about one version of a
+    file.
+
+    Instance vars
+    -------------
+    key: The file_key of the file the entry is about.
+    format: The FileFormat the file was read in.
+    length: The length of the document read from the file.
+    lines: The line index of the document, or None: the newline offsets of
+           a TextBuffer, or the checkpoints of a LargeFile.
+    newline_total: The number of newlines in a LargeFile, or None.
+    cursor: The offset of the cursor when the document was unloaded.
+    searches: An OrderedDict from pattern to the (starts, ends) arrays of
+              its matches, the search made last at the end.
+    """
+
+    def __init__(self, key, file_format, length, cursor=0):
+        """Initializes a CacheEntry with no line index and no searches.
+
+        Parameters
+        ----------
+        self: CacheEntry instance.
+        key: a list, as returned by file_key.
+        file_format: the FileFormat of the file.
+        length: an int, the length of the document.
+        cursor: an int, the offset of the cursor, defaults to 0.
+        """
+
+        self.key = key
+        self.format = file_format
+        self.length = length
+        self.lines = None
+        self.newline_total = None
+        self.cursor = cursor
+        self.searches = OrderedDict()
+
+
+def remember_search(searches, pattern, starts, ends):
+    """Adds the matches of a search to an OrderedDict of searches, dropping
+    the one made least recently past SEARCH_LIMIT. Searches with more than
+    MATCH_LIMIT matches are not remembered.
+
+    Parameters
+    ----------
+    searches: an OrderedDict, as in a CacheEntry.
+    pattern: a str, the pattern typed after '?'.
+    starts: an array with the offset of each match.
+    ends: an array with the offset after the end of each match.
+    """
+
+    searches.pop(pattern, None)
+    if len(starts) > MATCH_LIMIT:
+        return
+    searches[pattern] = (starts, ends)
+    while len(searches) > SEARCH_LIMIT:
+        searches.popitem(last=False)
+
+
+def load_entry(filename):
+    """Returns the entry of a file, or None if there is none or the file
+    changed since it was saved.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file.
+    """
+
+    key = file_key(filename)
+    if key == None:
+        return None
+    path = entry_path(filename)
+    try:
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            if header["key"] != key:
+                return None
+            encoding, newline, bom, compression = header["format"]
+            entry = CacheEntry(key, FileFormat(encoding, newline,
+                                               bytes.fromhex(bom),
+                                               compression),
+                               header["length"], header["cursor"])
+            entry.newline_total = header["newline_total"]
+            if header["lines"] != None:
+                entry.lines = read_array(file, header["lines"])
+            for pattern, count in header["searches"]:
+                entry.searches[pattern] = (read_array(file, count),
+                                           read_array(file, count))
+        # Reading an entry makes it the one used most recently
+        os.utime(path)
+    except (OSError, ValueError, KeyError, TypeError, EOFError):
+        return None
+
+    return entry
+
+
+def save_entry(entry):
+    """Saves an entry, replacing the one of its file at once, then drops
+    the entries used least recently past CACHE_LIMIT.
+
+    Parameters
+    ----------
+    entry: a CacheEntry.
+    """
+
+    if entry.key == None:
+        return
+    file_format = entry.format
+    header = {"key": entry.key,
+              "format": [file_format.encoding, file_format.newline,
+                         file_format.bom.hex(), file_format.compression],
+              "length": entry.length,
+              "cursor": entry.cursor,
+              "newline_total": entry.newline_total,
+              "lines": None if entry.lines is None else len(entry.lines),
+              "searches": [[pattern, len(starts)] for pattern, (starts, _)
+                           in entry.searches.items()]}
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=".tvim-", suffix=".tmp",
+                                         dir=CACHE_FOLDER)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(json.dumps(header).encode("utf-8", "surrogatepass")
+                       + b"\n")
+            if entry.lines is not None:
+                file.write(array('q', entry.lines).tobytes())
+            for starts, ends in entry.searches.values():
+                file.write(array('q', starts).tobytes())
+                file.write(array('q', ends).tobytes())
+        os.replace(temp_name, entry_path(entry.key[0]))
+    except (OSError, ValueError):
+        # A failed save only means the next open starts cold
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        return
+
+    evict()
+
+
+def evict(limit=CACHE_LIMIT):
+    """Drops the entries used least recently until the rest take at most
+    limit bytes.
+
+    Parameters
+    ----------
+    limit: an int, a number of bytes, defaults to CACHE_LIMIT.
+    """
+
+    entries = []
+    try:
+        with os.scandir(CACHE_FOLDER) as scan:
+            for item in scan:
+                if item.name.endswith(".cache"):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size,
+                                    item.path))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def read_array(file, count):
+    """Reads an array of count 64-bit ints from a file.
+
+    Raises
+    ------
+    EOFError if the file ends first.
+    """
+
+    values = array('q')
+    values.frombytes(file.read(count * values.itemsize))
+    if len(values) != count:
+        raise EOFError()
+
+    return values
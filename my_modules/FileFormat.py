@@ -0,0 +1,234 @@
+"""This module reads and writes files as text for tVIM, keeping the encoding
+and line endings they had.
+
+sniff_format() looks at the first SNIFF_SIZE bytes of a file for a byte
+order mark, for UTF-8 and for the line endings used, like Vim's
+'fileencodings' and 'fileformats'. read_text() then decodes the file a chunk
+at a time, turning its line endings into '\\n'. Bytes that do not decode are
+kept as lone surrogates, so a FileFormat encodes the text back into the same
+bytes on save, even for a file that is not valid text at all.
+"""
+
+import codecs
+
+
+# The number of bytes looked at to tell the format of a file
+SNIFF_SIZE = 64 << 10
+
+# The number of bytes decoded at a time
+READ_CHUNK = 1 << 20
+
+# The encoding of files that are not UTF-8, which decodes any byte
+FALLBACK_ENCODING = "latin-1"
+
+# The byte order marks that are recognized, UTF-32 first since its little
+# endian mark starts with the one of UTF-16
+BOMS = ((codecs.BOM_UTF32_LE, "utf-32-le"), (codecs.BOM_UTF32_BE, "utf-32-be"),
+        (codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"),
+        (codecs.BOM_UTF16_BE, "utf-16-be"))
+
+# The names Vim gives each line ending, shown in the status line
+NEWLINE_NAMES = {"\n": "unix", "\r\n": "dos", "\r": "mac"}
+
+
+class FileFormat():
+    """The FileFormat class is the way the text of a document is stored in
+    its file.
+
+    Instance vars
+    -------------
+    encoding: The name of the codec of the file.
+    newline: The str that ends each line in the file: '\\n', '\\r\\n' or
+             '\\r'.
+    bom: The byte order mark the file starts with, or b"".
+    compression: The compression of the file, as named by
+                 sniff_compression, or None.
+    """
+
+    def __init__(self, encoding="utf-8", newline="\n", bom=b"",
+                 compression=None):
+        """Initializes a FileFormat, UTF-8 with Unix line endings unless
+        told otherwise.
+
+        Parameters
+        ----------
+        self: FileFormat instance.
+        encoding: a str, the name of a codec, defaults to "utf-8".
+        newline: a str, the line ending, defaults to "\\n".
+        bom: a bytes, the byte order mark, defaults to b"".
+        compression: a str, the compression, defaults to None.
+        """
+
+        self.encoding = encoding
+        self.newline = newline
+        self.bom = bom
+        self.compression = compression
+
+    def errors(self):
+        """Returns the error handler that maps the bytes that do not decode
+        to lone surrogates and back. UTF-16 and UTF-32 keep their unpaired
+        surrogates as they are, the others escape each bad byte."""
+
+        if self.encoding.startswith("utf-16") or self.encoding.startswith(
+                "utf-32"):
+            return "surrogatepass"
+
+        return "surrogateescape"
+
+    def byte_lines(self):
+        """Returns whether each line of the file ends in a b'\\n' byte, so
+        its lines can be found without decoding it, as a LargeFile does."""
+
+        return self.newline != "\r" and not (self.encoding.startswith(
+            "utf-16") or self.encoding.startswith("utf-32"))
+
+    def flags(self):
+        """Returns what the status line shows about the format, like
+        ' [gzip] [latin-1] [dos]', or "" for an uncompressed file in UTF-8
+        with Unix line endings."""
+
+        flags = ""
+        if self.compression != None:
+            flags += " [%s]" % self.compression
+        if self.encoding != "utf-8":
+            flags += " [%s]" % self.encoding
+        if self.bom:
+            flags += " [BOM]"
+        if self.newline != "\n":
+            flags += " [%s]" % NEWLINE_NAMES[self.newline]
+
+        return flags
+
+    def encode(self, text):
+        """Returns the bytes of a chunk of text in the file, with its line
+        endings and the bytes that did not decode put back.
+
+        Parameters
+        ----------
+        self: FileFormat instance.
+        text: a str, a chunk of the document.
+        """
+
+        if self.newline != "\n":
+            text = text.replace("\n", self.newline)
+
+        return text.encode(self.encoding, self.errors())
+
+
+def sniff_format(data):
+    """Returns the FileFormat of a file from the bytes it starts with.
+
+    Parameters
+    ----------
+    data: a bytes, the first SNIFF_SIZE bytes of the file (or all of them).
+    """
+
+    bom = b""
+    for mark, encoding in BOMS:
+        if data.startswith(mark):
+            bom = mark
+            break
+    else:
+        # A multi-byte char may be cut off at the end of the sample
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(data, False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = FALLBACK_ENCODING
+
+    file_format = FileFormat(encoding, "\n", bom)
+    try:
+        text = codecs.getincrementaldecoder(encoding)(
+            file_format.errors()).decode(data[len(bom):], False)
+    except UnicodeDecodeError:
+        # Bytes that only look like a byte order mark, like the 'FF FE 00 00'
+        # of a binary file, are read as FALLBACK_ENCODING, as in read_text
+        file_format = FileFormat(FALLBACK_ENCODING)
+        text = data.decode(FALLBACK_ENCODING)
+
+    # Like Vim, a file is only taken as 'dos' if every line ends in '\r\n',
+    # and as 'mac' if no line ends in '\n'
+    crlf = text.count("\r\n")
+    if crlf and crlf == text.count("\n"):
+        file_format.newline = "\r\n"
+    elif "\r" in text and "\n" not in text:
+        file_format.newline = "\r"
+
+    return file_format
+
+
+def decode_chunks(file, file_format):
+    """Decodes a file a chunk at a time, turning its line endings into
+    '\\n'.
+
+    Parameters
+    ----------
+    file: a binary file object, at the start of the file.
+    file_format: the FileFormat of the file.
+
+    Returns
+    -------
+    A list of the decoded strs, or None if a line ending does not match
+    file_format.newline.
+
+    Raises
+    ------
+    UnicodeDecodeError if the bytes can not be decoded even so, like an odd
+    number of bytes in UTF-16.
+    """
+
+    decoder = codecs.getincrementaldecoder(file_format.encoding)(
+        file_format.errors())
+    newline = file_format.newline
+    file.read(len(file_format.bom))
+
+    chunks = []
+    carry = ""
+    while True:
+        data = file.read(READ_CHUNK)
+        text = carry + decoder.decode(data, not data)
+        carry = ""
+        if newline != "\n":
+            # A '\r' at the end of a chunk may start a '\r\n' in the next
+            if data and text.endswith("\r"):
+                text, carry = text[:-1], "\r"
+            if newline == "\r\n" and text.count("\n") != text.count("\r\n"):
+                return None
+            if newline == "\r" and "\n" in text:
+                return None
+            text = text.replace(newline, "\n")
+        if text:
+            chunks.append(text)
+        if not data:
+            return chunks
+
+
+def read_text(open_file, file_format):
+    """Reads a whole file as text, along with the format to save it in.
+
+    Parameters
+    ----------
+    open_file: a function returning the file as a binary file object at its
+               start, called again if the file has to be read over.
+    file_format: the FileFormat sniffed from the start of the file.
+
+    Returns
+    -------
+    A (text, file_format) pair. The format differs from the one sniffed if
+    the rest of the file did not match it: line endings that are mixed are
+    all kept as they are, and bytes that can not be decoded at all are read
+    as FALLBACK_ENCODING.
+    """
+
+    try:
+        chunks = decode_chunks(open_file(), file_format)
+        if chunks == None:
+            file_format = FileFormat(file_format.encoding, "\n",
+                                     file_format.bom, file_format.compression)
+            chunks = decode_chunks(open_file(), file_format)
+    except UnicodeDecodeError:
+        file_format = FileFormat(FALLBACK_ENCODING,
+                                 compression=file_format.compression)
+        chunks = decode_chunks(open_file(), file_format)
+
+    return "".join(chunks), file_format
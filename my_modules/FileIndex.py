@@ -0,0 +1,375 @@
+"""This module keeps an index of the files under a folder for ':find'.
+
+The index is built by walking the folder with os.scandir on a worker thread
+and saved to INDEX_FOLDER, so the next session starts with it at once. Each
+later walk only stats the folders: a folder whose mtime has not changed has
+the same files as before, so only the folders that changed are read again.
+
+A query matches the paths that hold its chars in order. The paths are kept
+as one lowercase string, which a regex scans block by block. Every match is
+scored in Python, and a heap keeps the best ones, so a good match is found
+wherever it sorts among the paths.
+"""
+
+import heapq
+import json
+import os
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+
+# The indexes of the folders are saved in this folder
+INDEX_FOLDER = os.path.join(os.path.expanduser("~"), ".tvim", "index")
+
+# Folders that are never indexed
+SKIPPED_FOLDERS = {".git", ".hg", ".svn", "__pycache__", "node_modules",
+                   ".tox", ".venv"}
+
+# The number of paths returned for a query
+RESULT_COUNT = 20
+
+# The number of chars of the paths scanned at once, the GIL is free between
+# two blocks so the Tk mainloop keeps running during a search
+SCAN_BLOCK = 1 << 18
+
+# How often (in ms) a window checks on a search in progress
+FIND_POLL = 50
+
+# What a matched char scores at the start of a word, right after the
+# previous matched char and in the name of the file
+BOUNDARY_BONUS = 8
+CONSECUTIVE_BONUS = 4
+NAME_BONUS = 2
+
+# What each gap between two matched chars costs, on top of a point per char
+# skipped, so chars scattered over many words do not outscore a word
+GAP_PENALTY = 3
+WORD_SEPARATORS = "/\\_-. "
+
+
+def subsequence_regex(query):
+    """Returns a regex matching the chars of a query in order within one
+    line. The char classes exclude the char looked for next, so a match
+    never backtracks.
+
+    Parameters
+    ----------
+    query: a non-empty str, in lowercase.
+    """
+
+    parts = [re.escape(query[0])]
+    for char in query[1:]:
+        char = re.escape(char)
+        parts.append("[^\\n%s]*%s" % (char, char))
+
+    return re.compile("".join(parts))
+
+
+def fuzzy_score(query, path):
+    """Scores how well a path matches a query, higher is better. Chars of the
+    query are matched from the end, so they land in the file name if they
+    can.
+
+    Parameters
+    ----------
+    query: a non-empty str, in lowercase.
+    path: a str, a path holding the chars of query in order.
+
+    Returns
+    -------
+    A (score, -length) pair, so shorter paths win ties.
+    """
+
+    lower = path.lower()
+    name_start = max(lower.rfind("/"), lower.rfind(os.sep)) + 1
+    camel = len(lower) == len(path)
+
+    positions = []
+    pos = len(lower)
+    for char in reversed(query):
+        pos = lower.rfind(char, 0, pos)
+        positions.append(pos)
+    positions.reverse()
+
+    score = 0
+    previous = -2
+    for pos in positions:
+        if (pos == 0 or lower[pos - 1] in WORD_SEPARATORS
+                or camel and path[pos].isupper() and path[pos - 1].islower()):
+            score += BOUNDARY_BONUS
+        if pos == previous + 1:
+            score += CONSECUTIVE_BONUS
+        elif previous >= 0:
+            score -= GAP_PENALTY
+        if pos >= name_start:
+            score += NAME_BONUS
+        previous = pos
+    # Every char skipped between the first and last match costs a point
+    score -= positions[-1] - positions[0] + 1 - len(query)
+
+    return score, -len(path)
+
+
+class FileIndex():
+    """The FileIndex class holds the paths of the files under a folder and
+    keeps them up to date on a worker thread.
+
+    Instance vars
+    -------------
+    root: The absolute path of the folder indexed.
+    path: The path of the file the index is saved to, or None.
+    ready: An Event set once the paths have been read from the saved index
+           or from a first walk.
+    _folders: A dict from the path of each folder (relative to root) to its
+              (mtime, files, subfolders), as found by the last walk.
+    _data: A (paths, text, starts) triple replaced whole after each walk:
+           the relative paths of the files, the same paths as one lowercase
+           str with a newline after each, and the offset of each in it.
+    """
+
+    def __init__(self, root, saved=True):
+        """Initializes a FileIndex and starts reading it on a worker thread.
+
+        Parameters
+        ----------
+        self: FileIndex instance.
+        root: a str, the path of the folder to index.
+        saved: a bool, whether the index is saved to INDEX_FOLDER and read
+               from there, defaults to True.
+        """
+
+        self.root = os.path.abspath(root)
+        self.path = None
+        if saved:
+            import hashlib
+            key = hashlib.sha1(self.root.encode("utf-8", "surrogatepass"))
+            self.path = os.path.join(INDEX_FOLDER, key.hexdigest() + ".json")
+        self.ready = threading.Event()
+        self._folders = {}
+        self._data = ([], "", array('q'))
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.refresh()
+
+    def refresh(self):
+        """Starts a walk of the folder on a worker thread, unless one is
+        running already."""
+
+        with self._lock:
+            if self._thread != None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Blocks until the walk running, if any, has finished."""
+
+        thread = self._thread
+        if thread != None:
+            thread.join()
+
+    def __len__(self):
+        """Returns the number of files in the index."""
+
+        return len(self._data[0])
+
+    def search(self, query, limit=RESULT_COUNT):
+        """Returns the paths that best match a query.
+
+        Parameters
+        ----------
+        self: FileIndex instance.
+        query: a str, spaces are ignored.
+        limit: an int, the number of paths returned, defaults to
+               RESULT_COUNT.
+
+        Returns
+        -------
+        A list of absolute paths, the best match first.
+        """
+
+        query = "".join(query.lower().split())
+        paths, text, starts = self._data
+        if not query or not paths:
+            return []
+        # A char found nowhere is cheap to rule out before scanning
+        if any(char not in text for char in set(query)):
+            return []
+
+        regex = subsequence_regex(query)
+        # The best limit matches so far, the worst first. Of two paths that
+        # score the same, the one found first wins
+        best = []
+        count = 0
+        pos = 0
+        while pos < len(text):
+            end = text.find('\n', pos + SCAN_BLOCK)
+            end = len(text) if end < 0 else end
+            match = regex.search(text, pos, end)
+            if match is None:
+                pos = end
+                continue
+            # Only one match per path, the search goes on from the next one
+            path = paths[bisect_right(starts, match.start()) - 1]
+            item = (fuzzy_score(query, path), -count, path)
+            count += 1
+            if len(best) < limit:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+            pos = text.find('\n', match.end()) + 1
+
+        return [os.path.join(self.root, path)
+                for _, _, path in sorted(best, reverse=True)]
+
+    def _run(self):
+        """Reads the saved index if there is one, then walks the folder and
+        saves the index if it changed. Runs on its own thread."""
+
+        if not self.ready.is_set():
+            folders = self._load()
+            if folders:
+                self._publish(folders)
+                self.ready.set()
+
+        folders = self._walk()
+        if folders != self._folders:
+            self._publish(folders)
+            self._save()
+        self.ready.set()
+
+    def _walk(self):
+        """Returns the folders under root, reading again only the ones whose
+        mtime changed since the last walk."""
+
+        folders = {}
+        stack = [""]
+        while stack:
+            folder = stack.pop()
+            full_path = os.path.join(self.root, folder)
+            try:
+                mtime = os.stat(full_path).st_mtime_ns
+                old = self._folders.get(folder)
+                if old != None and old[0] == mtime:
+                    files, subfolders = old[1], old[2]
+                else:
+                    files, subfolders = self._read_folder(full_path)
+            except OSError:
+                continue
+            folders[folder] = (mtime, files, subfolders)
+            stack.extend(os.path.join(folder, name) for name in subfolders)
+
+        return folders
+
+    def _read_folder(self, full_path):
+        """Returns the sorted (files, subfolders) of a folder."""
+
+        files, subfolders = [], []
+        with os.scandir(full_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_FOLDERS:
+                            subfolders.append(entry.name)
+                    else:
+                        files.append(entry.name)
+                except OSError:
+                    continue
+
+        return sorted(files), sorted(subfolders)
+
+    def _publish(self, folders):
+        """Makes the files of a walk the ones searched."""
+
+        paths = [os.path.join(folder, name)
+                 for folder, (_, files, _) in sorted(folders.items())
+                 for name in files]
+        lowered = [path.lower() for path in paths]
+        starts = array('q', accumulate([0] + [len(path) + 1
+                                              for path in lowered[:-1]]))
+        text = "\n".join(lowered) + "\n" if lowered else ""
+
+        self._folders = folders
+        self._data = (paths, text, starts)
+
+    def _load(self):
+        """Returns the folders of the saved index, or {} if there is none."""
+
+        if self.path == None:
+            return {}
+        try:
+            with open(self.path, "rt", encoding="utf-8") as file:
+                saved = json.load(file)
+            if saved.get("root") != self.root:
+                return {}
+            return {folder: (mtime, files, subfolders) for folder,
+                    (mtime, files, subfolders) in saved["folders"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _save(self):
+        """Saves the index, replacing the saved one at once."""
+
+        if self.path == None:
+            return
+        try:
+            os.makedirs(INDEX_FOLDER, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(prefix=".tvim-", suffix=".tmp",
+                                             dir=INDEX_FOLDER)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wt", encoding="utf-8") as file:
+                json.dump({"root": self.root, "folders": self._folders}, file)
+            os.replace(temp_name, self.path)
+        except (OSError, ValueError):
+            # A failed save only means the next session starts cold
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+
+class FindJob():
+    """The FindJob class runs a query on a FileIndex on its own thread, once
+    the index is ready.
+
+    Instance vars
+    -------------
+    query: The str searched for.
+    results: The list of absolute paths found, the best match first.
+    done: Whether the search has finished.
+    """
+
+    def __init__(self, index, query):
+        """Starts searching an index for a query.
+
+        Parameters
+        ----------
+        self: FindJob instance.
+        index: a FileIndex.
+        query: a str.
+        """
+
+        self.query = query
+        self.results = []
+        self.done = False
+        self._index = index
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """Blocks until the search has finished."""
+
+        self._thread.join()
+
+    def _run(self):
+        """Waits for the index, then searches it."""
+
+        self._index.ready.wait()
+        self.results = self._index.search(self.query)
+        self.done = True
@@ -0,0 +1,321 @@
+"""This module pipes lines of a buffer through a shell command for ':%!cmd'
+and ':a,b!cmd'.
+
+A FilterJob streams a snapshot of the lines into the command's stdin on one
+worker thread while another reads its stdout, so neither side waits on a
+full pipe. The snapshot only copies the list of pieces, the output is kept as
+the chunks it was read in, and the window inserts those chunks one by one,
+dropping each as it goes, so the text is never joined into one more copy.
+
+A FilterApply then puts the output in the buffer in slices of at most
+APPLY_BUDGET ms scheduled with root.after, inserting it after the range
+before deleting the range, so the window keeps drawing and scrolling
+meanwhile. The slices all go into one UndoEntry, which 'u' undoes at once.
+"""
+
+import io
+import subprocess
+import threading
+import time
+
+
+# The number of chars written to or read from the command at a time
+FILTER_CHUNK = 1 << 20
+
+# How often (in ms) a window checks on a filter in progress
+FILTER_POLL = 100
+
+# The most bytes of the command's stderr kept for the error message
+STDERR_LIMIT = 4096
+
+# How long (in ms) a slice of the output may take to put in the buffer, and
+# the most chars inserted or deleted at a time
+APPLY_BUDGET = 8
+APPLY_CHUNK = 1 << 16
+
+
+class FilterJob():
+    """The FilterJob class runs a shell command on a range of a buffer on
+    worker threads, collecting what it prints.
+
+    Instance vars
+    -------------
+    command: The shell command, as typed after '!'.
+    buffer: The TextBuffer the range was taken from.
+    start: The offset of the first char of the range.
+    end: The offset after the last char of the range.
+    version: The version of the buffer the range was taken from.
+    total: The number of chars of the range.
+    written: The number of chars written to the command so far.
+    chunks: A list of the strs the command printed, in order.
+    done: Whether the command has exited or the job was cancelled.
+    cancelled: Whether the job was cancelled.
+    returncode: The exit status of the command, or None.
+    error: The stderr of a command that failed, or the exception that
+           stopped the job, or None.
+    """
+
+    def __init__(self, buffer, start, end, command):
+        """Takes a snapshot of a range of a buffer and starts piping it
+        through a command.
+
+        Parameters
+        ----------
+        self: FilterJob instance.
+        buffer: a TextBuffer.
+        start: an int, the offset of the first char of the range.
+        end: an int, the offset after the last char of the range.
+        command: a str, the shell command.
+        """
+
+        self.command = command
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.version = buffer.version
+        self.total = end - start
+        self.written = 0
+        self.chunks = []
+        self.done = False
+        self.cancelled = False
+        self.returncode = None
+        self.error = None
+        self._snapshot = buffer.snapshot()
+        # Like Vim, the last line is sent with a newline even without one
+        self._newline_added = (end == len(buffer) and end > start
+                               and buffer.get_text(end - 1, end) != "\n")
+        self._stderr = b""
+        self._process = None
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def progress(self):
+        """Returns the fraction of the range written to the command."""
+
+        return self.written / self.total if self.total else 1.0
+
+    def wait(self):
+        """Blocks until the job has finished."""
+
+        self._thread.join()
+
+    def cancel(self):
+        """Stops the command, its output is dropped."""
+
+        self.cancelled = True
+        process = self._process
+        if process != None and process.poll() == None:
+            process.kill()
+
+    def output(self):
+        """Yields the chunks of the output, dropping each one from chunks as
+        it is taken. The newline added to the last line is taken out again.
+        """
+
+        chunks = self.chunks
+        chunks.reverse()
+        while chunks:
+            chunk = chunks.pop()
+            if not chunks and self._newline_added and chunk.endswith("\n"):
+                chunk = chunk[:-1]
+            yield chunk
+
+    def _run(self):
+        """Starts the command and reads its stdout, while _write feeds its
+        stdin and _read_stderr drains its stderr. Runs on its own thread."""
+
+        try:
+            self._process = subprocess.Popen(
+                self.command, shell=True, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as error:
+            self.error = str(error)
+            self.done = True
+            return
+        # A cancel that came before the command started
+        if self.cancelled:
+            self._process.kill()
+
+        helpers = [threading.Thread(target=self._write, daemon=True),
+                   threading.Thread(target=self._read_stderr, daemon=True)]
+        for helper in helpers:
+            helper.start()
+        try:
+            # Bytes that are not UTF-8 pass through like they do on save
+            reader = io.TextIOWrapper(self._process.stdout, encoding="utf-8",
+                                      errors="surrogateescape")
+            chunk = reader.read(FILTER_CHUNK)
+            while chunk:
+                if not self.cancelled:
+                    self.chunks.append(chunk)
+                chunk = reader.read(FILTER_CHUNK)
+        except (OSError, ValueError) as error:
+            if not self.cancelled:
+                self.error = str(error)
+        for helper in helpers:
+            helper.join()
+
+        self.returncode = self._process.wait()
+        if self.cancelled:
+            self.chunks = []
+        elif self.returncode != 0 and self.error == None:
+            self.error = (self._stderr.decode("utf-8", "replace").strip()
+                          or "exit status %d" % self.returncode)
+        self.done = True
+
+    def _write(self):
+        """Writes the range to the command's stdin in chunks, then closes
+        it. Runs on its own thread."""
+
+        stdin = self._process.stdin
+        try:
+            for chunk in self._snapshot.iter_chunks(self.start, self.end,
+                                                    FILTER_CHUNK):
+                if self.cancelled:
+                    break
+                stdin.write(chunk.encode("utf-8", "surrogateescape"))
+                self.written += len(chunk)
+            if self._newline_added and not self.cancelled:
+                stdin.write(b"\n")
+        except OSError:
+            # The command stopped reading, like 'head' does, which is fine
+            pass
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def _read_stderr(self):
+        """Keeps the start of the command's stderr and drains the rest, so
+        the command never waits on it. Runs on its own thread."""
+
+        stderr = self._process.stderr
+        for data in iter(lambda: stderr.read(STDERR_LIMIT), b""):
+            if len(self._stderr) < STDERR_LIMIT:
+                self._stderr += data[:STDERR_LIMIT - len(self._stderr)]
+        stderr.close()
+
+
+class FilterApply():
+    """The FilterApply class replaces the range of a finished FilterJob with
+    its output, a slice per frame.
+
+    Instance vars
+    -------------
+    tVIM: The tVIM instance whose buffer is edited.
+    job: The FilterJob whose output is applied.
+    total: The number of chars to insert and delete.
+    applied: The number of chars inserted or deleted so far.
+    done: Whether the whole output is in the buffer.
+    _output: The generator of the chunks of the output not inserted yet.
+    _chunk: The chunk of the output being inserted.
+    _taken: The number of chars of _chunk inserted so far.
+    _offset: Where the next slice of the output is inserted.
+    _end: The offset after the part of the range not deleted yet.
+    _entry: The UndoEntry the edits go into, or None before the first.
+    _job: The id of the pending root.after call, or None.
+    """
+
+    def __init__(self, tVIM, job):
+        """Initializes a FilterApply, which edits nothing until it is run.
+
+        Parameters
+        ----------
+        self: FilterApply instance.
+        tVIM: tVIM instance.
+        job: a FilterJob that is done, with no error.
+        """
+
+        self.tVIM = tVIM
+        self.job = job
+        self.total = (job.end - job.start
+                      + sum(len(chunk) for chunk in job.chunks))
+        self.applied = 0
+        self.done = False
+        self._output = job.output()
+        self._chunk = ""
+        self._taken = 0
+        self._offset = job.end
+        self._end = job.end
+        self._entry = None
+        self._job = None
+
+    def progress(self):
+        """Returns the fraction of the output put in the buffer."""
+
+        return self.applied / self.total if self.total else 1.0
+
+    def start(self):
+        """Applies the output a slice per frame, from the next frame on."""
+
+        self._job = self.tVIM.root.after_idle(self._apply_slice)
+
+    def finish(self):
+        """Applies whatever is left of the output right away."""
+
+        self.cancel()
+        self._apply_until(None)
+
+    def cancel(self):
+        """Stops applying the output, like when the window is closed. The
+        part applied stays, as one change."""
+
+        if self._job:
+            self.tVIM.root.after_cancel(self._job)
+            self._job = None
+
+    def _apply_slice(self):
+        """Applies the output for APPLY_BUDGET ms, then yields to Tk."""
+
+        self._job = None
+        deadline = time.perf_counter() + APPLY_BUDGET / 1000
+        if not self._apply_until(deadline):
+            self._job = self.tVIM.root.after(1, self._apply_slice)
+
+    def _apply_until(self, deadline):
+        """Applies the output until the deadline (a perf_counter time, or
+        None for no deadline). Returns whether the whole output was
+        applied."""
+
+        undo_tree = self.tVIM.undo_tree
+        view = self.tVIM.view
+        # The first edit starts a change of its own, the next ones go into it
+        if self._entry == None:
+            undo_tree.close()
+        else:
+            undo_tree.resume(self._entry)
+
+        # The output goes after the range first, so each chunk is dropped
+        # before the range is copied into the undo history
+        while self._chunk != None:
+            if self._taken == len(self._chunk):
+                self._chunk = next(self._output, None)
+                self._taken = 0
+                continue
+            text = self._chunk[self._taken:self._taken + APPLY_CHUNK]
+            self._taken += len(text)
+            view.insert(self._offset, text)
+            self._offset += len(text)
+            self.applied += len(text)
+            self._entry = undo_tree.current
+            if deadline != None and time.perf_counter() > deadline:
+                return False
+
+        # The range is deleted from its end, each slice a delta of its own
+        while self._end > self.job.start:
+            length = min(APPLY_CHUNK, self._end - self.job.start)
+            view.delete(self._end - length, length)
+            self._end -= length
+            self.applied += length
+            self._entry = undo_tree.current
+            if deadline != None and time.perf_counter() > deadline:
+                return False
+
+        undo_tree.close()
+        view.set_cursor(self.job.start)
+        self.done = True
+        self.tVIM.filter_apply = None
+
+        return True
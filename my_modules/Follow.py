@@ -0,0 +1,271 @@
+"""This module follows a growing file for ':follow', like 'tail -f'.
+
+A Follower reads the bytes appended to a file since the last read on a
+worker thread, and decodes them in the format the file was read with. On
+Linux the thread sleeps on inotify until the file changes; elsewhere, or if
+inotify can not be used, it checks the size of the file every FOLLOW_POLL
+ms. The window takes what was read once per frame and appends it to the
+buffer in a single insert, dropping the oldest lines past the cap given to
+':follow', so a log that grows quickly costs one Tk insert per frame.
+"""
+
+import codecs
+import os
+import select
+import sys
+import threading
+import time
+
+
+# How often (in ms) the size of the file is checked without inotify, and
+# at the latest with it
+FOLLOW_POLL = 100
+
+# How often (in ms) a window appends the text read, about once per frame
+FOLLOW_FRAME = 16
+
+# The number of bytes read from the file at a time
+FOLLOW_CHUNK = 1 << 20
+
+# The inotify events that may mean the file grew, was truncated or was
+# moved away or deleted by a log rotation
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF
+              | IN_MOVE_SELF)
+
+# The C library with inotify, found on first use. False until then, None
+# where there is none
+LIBC = False
+
+
+def inotify_libc():
+    """Returns the C library if it has inotify, or None. ctypes is only
+    imported the first time, so starting tVIM does not pay for it."""
+
+    global LIBC
+    if LIBC is False:
+        LIBC = None
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch.argtypes = (ctypes.c_int,
+                                                   ctypes.c_char_p,
+                                                   ctypes.c_uint32)
+                LIBC = libc
+            except (ImportError, OSError, AttributeError):
+                pass
+
+    return LIBC
+
+
+def saved_size(buffer, file_format):
+    """Returns the number of bytes a buffer takes in its file, where a
+    Follower of the file starts reading.
+
+    Parameters
+    ----------
+    buffer: a TextBuffer.
+    file_format: the FileFormat the buffer was read with.
+    """
+
+    size = len(file_format.bom)
+    for chunk in buffer.iter_chunks(size=FOLLOW_CHUNK):
+        size += len(file_format.encode(chunk))
+
+    return size
+
+
+def follow_offset(document):
+    """Returns the number of bytes of its file a document holds, where a
+    Follower of the file starts reading: where the last Follower of the
+    document stopped if the buffer is as it left it, since the first lines
+    may have been dropped since, or else saved_size of the buffer.
+
+    Parameters
+    ----------
+    document: a loaded Document.
+    """
+
+    if (document.followed != None
+            and document.followed[0] == document.buffer.version):
+        return document.followed[1]
+
+    return saved_size(document.buffer, document.format)
+
+
+class Follower():
+    """The Follower class reads what is appended to a file on its own
+    thread, keeping the decoded text until a window takes it. If the file
+    is truncated or replaced, like by a log rotation, it is followed from
+    its start again, like 'tail -F'.
+
+    Instance vars
+    -------------
+    filename: The path of the file.
+    offset: The number of bytes of the file read so far.
+    format: The FileFormat the file is decoded with.
+    lines: The most lines the window keeps, or None to keep them all.
+    inotify: Whether inotify wakes the thread, instead of only polling.
+    error: The exception that stopped the thread, or None.
+    _pending: A list of the decoded strs not taken yet.
+    _carry: A '\\r' held back from the last read, since the next read may
+            start with the '\\n' of a '\\r\\n'.
+    """
+
+    def __init__(self, filename, offset, file_format, lines=None):
+        """Starts following a file from an offset.
+
+        Parameters
+        ----------
+        self: Follower instance.
+        filename: a str, the path of the file.
+        offset: an int, the number of bytes of the file read already.
+        file_format: the FileFormat the file was read with.
+        lines: an int, the most lines to keep, defaults to None.
+
+        Raises
+        ------
+        OSError if the file can not be found.
+        """
+
+        self.filename = filename
+        self.offset = offset
+        self.format = file_format
+        self.lines = lines
+        self.error = None
+        self._inode = os.stat(filename).st_ino
+        self._decoder = codecs.getincrementaldecoder(file_format.encoding)(
+            file_format.errors())
+        self._carry = ""
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stopped = False
+
+        self._inotify = -1
+        libc = inotify_libc()
+        if libc != None:
+            self._inotify = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            self._watch()
+        self.inotify = self._inotify >= 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def take(self):
+        """Returns the text read since the last call, or ""."""
+
+        with self._lock:
+            text = "".join(self._pending)
+            self._pending.clear()
+
+        return text
+
+    def taken_offset(self):
+        """Returns the number of bytes of the file whose text was taken,
+        leaving out the text not taken yet, a '\\r' held back and the
+        bytes of a char the decoder is still waiting for the end of. Only
+        called once the Follower is stopped."""
+
+        pending = "".join(self._pending) + self._carry
+        held, _ = self._decoder.getstate()
+
+        return self.offset - len(held) - len(self.format.encode(pending))
+
+    def stop(self):
+        """Stops following the file."""
+
+        self._stopped = True
+        self._thread.join()
+        if self._inotify >= 0:
+            os.close(self._inotify)
+            self._inotify = -1
+
+    def read_new(self):
+        """Reads and decodes the bytes appended since the last read. Called
+        by the thread whenever the file may have changed."""
+
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            # Moved away by a rotation, the new file is not there yet
+            return
+        if stat.st_ino != self._inode or stat.st_size < self.offset:
+            self._inode = stat.st_ino
+            self.offset = 0
+            self._decoder.reset()
+            self._carry = ""
+            self._watch()
+        if stat.st_size == self.offset:
+            return
+
+        with open(self.filename, "rb") as file:
+            file.seek(self.offset)
+            if self.offset == 0 and self.format.bom:
+                if file.read(len(self.format.bom)) == self.format.bom:
+                    self.offset = len(self.format.bom)
+                else:
+                    file.seek(0)
+            data = file.read(FOLLOW_CHUNK)
+            while data and not self._stopped:
+                self.offset += len(data)
+                text = self._decode(data)
+                if text:
+                    with self._lock:
+                        self._pending.append(text)
+                data = file.read(FOLLOW_CHUNK)
+
+    def _decode(self, data):
+        """Returns the text of a chunk of bytes, with '\\n' ending each
+        line."""
+
+        text = self._carry + self._decoder.decode(data)
+        self._carry = ""
+        newline = self.format.newline
+        if newline != "\n":
+            if text.endswith("\r"):
+                text, self._carry = text[:-1], "\r"
+            text = text.replace(newline, "\n")
+
+        return text
+
+    def _watch(self):
+        """Watches the file now at filename with inotify."""
+
+        if self._inotify >= 0:
+            inotify_libc().inotify_add_watch(
+                self._inotify, os.fsencode(self.filename), WATCH_MASK)
+
+    def _wait(self):
+        """Sleeps until the file may have changed, or FOLLOW_POLL ms."""
+
+        if self._inotify < 0:
+            time.sleep(FOLLOW_POLL / 1000)
+            return
+
+        readable, _, _ = select.select([self._inotify], [], [],
+                                       FOLLOW_POLL / 1000)
+        # Which events came does not matter, read_new checks the file
+        if readable:
+            try:
+                while os.read(self._inotify, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def _run(self):
+        """Reads the file each time it changes until stopped. Runs on its
+        own thread."""
+
+        while not self._stopped:
+            try:
+                self.read_new()
+            except OSError as error:
+                self.error = error
+                return
+            self._wait()
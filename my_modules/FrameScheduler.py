@@ -0,0 +1,119 @@
+"""This module runs the redraws that follow the keys of a tVIM window once
+per frame.
+
+A key runs its command as soon as it arrives, which only moves the cursor or
+edits the buffer. What has to be redrawn after it (the keys typed so far in
+cmd_line, the highlights in view, the line numbers, the status line and the
+incremental search) is queued on the FrameScheduler of the window by name.
+A task queued again before it ran still runs once, so a held key or a burst
+of keys costs one redraw, not one per key.
+
+The queued tasks run from root.after_idle, once Tk has handled the events
+waiting, in the order they were first queued. A frame runs tasks until
+FRAME_BUDGET ms are spent and leaves the rest to the next frame, so the keys
+that came meanwhile are handled first. Nothing calls update(), which would
+handle those keys inside the handler of the key before them.
+"""
+
+import time
+from collections import OrderedDict
+
+# Import our modules
+from my_modules.Profiler import span # Times the frames for ':profile'
+
+
+# How long (in ms) the tasks of a frame may run before the rest wait for
+# the next frame
+FRAME_BUDGET = 8
+
+
+class FrameScheduler():
+    """The FrameScheduler class queues the redraws of a window and runs
+    each once per frame.
+
+    Instance vars
+    -------------
+    root: The Tk window whose after_idle runs the frames.
+    _tasks: An OrderedDict from the name of each task queued to its
+            (function, args).
+    _job: The id of the pending after_idle call, or None.
+    """
+
+    def __init__(self, root):
+        """Initializes a FrameScheduler with no tasks.
+
+        Parameters
+        ----------
+        self: FrameScheduler instance.
+        root: a Tk window.
+        """
+
+        self.root = root
+        self._tasks = OrderedDict()
+        self._job = None
+
+    def __len__(self):
+        """Returns the number of tasks queued."""
+
+        return len(self._tasks)
+
+    def __contains__(self, name):
+        """Returns whether a task is queued under a name."""
+
+        return name in self._tasks
+
+    def schedule(self, name, function, *args):
+        """Queues a task for the next frame. A task queued already under
+        the same name keeps its place and runs once, with the new args.
+
+        Parameters
+        ----------
+        self: FrameScheduler instance.
+        name: a str, the name of the task.
+        function: the function to run.
+        args: the arguments it is run with.
+        """
+
+        self._tasks[name] = (function, args)
+        if self._job is None:
+            self._job = self.root.after_idle(self.run_frame)
+
+    def cancel(self, name):
+        """Drops a queued task, like one being run right away instead."""
+
+        self._tasks.pop(name, None)
+
+    def clear(self):
+        """Drops every queued task, like when the window is closed."""
+
+        self._tasks.clear()
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    @span("frame")
+    def run_frame(self, budget=FRAME_BUDGET):
+        """Runs the queued tasks until budget ms are spent. The tasks left
+        are run in the next frame.
+
+        Parameters
+        ----------
+        self: FrameScheduler instance.
+        budget: a number of ms, or None to run every task, defaults to
+                FRAME_BUDGET.
+        """
+
+        self._job = None
+        if budget is not None:
+            deadline = time.perf_counter() + budget / 1000
+        try:
+            # At least one task runs, so every frame makes progress
+            while self._tasks:
+                _, (function, args) = self._tasks.popitem(last=False)
+                function(*args)
+                if budget is not None and time.perf_counter() > deadline:
+                    break
+        finally:
+            # Even if a task failed, the others still run
+            if self._tasks and self._job is None:
+                self._job = self.root.after_idle(self.run_frame)
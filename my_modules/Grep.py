@@ -0,0 +1,322 @@
+"""This module searches many files at once for ':vimgrep'.
+
+The files are split into batches that a pool of processes, one per core,
+searches in parallel. A worker maps each file into memory and matches the
+pattern against its bytes, skipping files that look binary. A GrepJob adds
+the hits of each batch to its results once the batches before it are done,
+so the first hits are shown while the other files are still being searched
+and the hits are always in the order of the files.
+
+The hits go to the QuickFix list of the session, which ':cn' and ':cp' go
+through like Vim's quickfix list.
+"""
+
+import glob
+import mmap
+import os
+import threading
+
+# Import our modules
+from my_modules.SearchEngine import compile_pattern # Compiles '?pattern's
+from my_modules.FileIndex import SKIPPED_FOLDERS # Folders never searched
+
+
+# The number of files searched by a worker at a time
+GREP_BATCH = 16
+
+# The most hits kept per file, one hit per line
+FILE_HIT_LIMIT = 1000
+
+# A file with a NUL byte in its first BINARY_SAMPLE bytes is binary
+BINARY_SAMPLE = 8192
+
+# How often (in ms) a window checks on a grep in progress
+GREP_POLL = 50
+
+# The pool of worker processes, started on the first ':vimgrep'
+POOL = None
+
+
+def grep_pool():
+    """Returns the pool of worker processes, starting it if needed. Workers
+    are spawned rather than forked, since tVIM runs threads of its own."""
+
+    # The pool takes a while to import, so it is left out of startup
+    import concurrent.futures
+    import multiprocessing
+
+    global POOL
+    if POOL == None:
+        POOL = concurrent.futures.ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("spawn"))
+
+    return POOL
+
+
+def close_pool():
+    """Stops the worker processes, if they were started. A process that
+    exits without calling this may wait for them forever, as the workers
+    of a pool started in a child process are not stopped at exit."""
+
+    global POOL
+    if POOL != None:
+        POOL.shutdown(cancel_futures=True)
+        POOL = None
+
+
+def expand_files(arguments):
+    """Returns the files named by the arguments of ':vimgrep', in order.
+
+    Parameters
+    ----------
+    arguments: a str, file names and glob patterns like '**/*.py' separated
+               by spaces. A folder stands for every file under it.
+    """
+
+    files = []
+    for argument in arguments.split():
+        for name in sorted(glob.glob(os.path.expanduser(argument),
+                                     recursive=True)):
+            if not os.path.isdir(name):
+                files.append(name)
+                continue
+            for folder, subfolders, names in os.walk(name):
+                subfolders[:] = sorted(subfolder for subfolder in subfolders
+                                       if subfolder not in SKIPPED_FOLDERS)
+                files.extend(os.path.join(folder, file)
+                             for file in sorted(names))
+
+    # A file named twice is searched once
+    return list(dict.fromkeys(os.path.abspath(file) for file in files))
+
+
+def format_entry(entry):
+    """Returns a quickfix entry as shown in the quickfix list, like
+    'path:line:column: text' with the path relative to the current folder.
+
+    Parameters
+    ----------
+    entry: a (path, line, column, text) hit.
+    """
+
+    path, line, column, text = entry
+    try:
+        path = os.path.relpath(path)
+    except ValueError:
+        # On Windows, a path on another drive has no relative path
+        pass
+
+    return "%s:%d:%d: %s" % (path, line, column + 1, text.strip())
+
+
+def grep_files(paths, pattern):
+    """Searches files for a pattern. Runs in a worker process.
+
+    Parameters
+    ----------
+    paths: a list of strs, the paths of the files.
+    pattern: a str, a pattern as typed after '?'.
+
+    Returns
+    -------
+    A list of (path, line, column, text) hits, the first match of each
+    matching line.
+    """
+
+    regex = compile_pattern(pattern, binary=True)
+    hits = []
+    for path in paths:
+        try:
+            hits.extend(grep_file(path, regex))
+        except (OSError, ValueError):
+            continue
+
+    return hits
+
+
+def grep_file(path, regex):
+    """Returns the (path, line, column, text) hits of a compiled bytes
+    pattern in a file, or no hits if the file is binary."""
+
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if b"\0" in data[:BINARY_SAMPLE]:
+                return []
+
+            hits = []
+            line = 1
+            counted = 0
+            line_end = -1
+            for match in regex.finditer(data):
+                start = match.start()
+                # Only the first match of a line is a hit
+                if start <= line_end:
+                    continue
+                line += data[counted:start].count(b"\n")
+                counted = start
+                line_start = data.rfind(b"\n", 0, start) + 1
+                line_end = data.find(b"\n", start)
+                if line_end < 0:
+                    line_end = len(data)
+                column = len(data[line_start:start].decode("utf-8", "replace"))
+                text = data[line_start:line_end].decode("utf-8", "replace")
+                hits.append((path, line, column, text.rstrip("\r")))
+                if len(hits) >= FILE_HIT_LIMIT:
+                    break
+
+    return hits
+
+
+class GrepJob():
+    """The GrepJob class searches files for a pattern in the worker
+    processes, collecting the hits of each batch of files in order.
+
+    Instance vars
+    -------------
+    pattern: The pattern searched for, as typed after '?'.
+    files: The list of the paths of the files searched.
+    results: The list of the (path, line, column, text) hits found so far.
+    searched: The number of files searched so far.
+    done: Whether every file has been searched or the job was cancelled.
+    error: The exception that stopped the job, or None.
+    """
+
+    def __init__(self, pattern, files):
+        """Starts searching files for a pattern.
+
+        Parameters
+        ----------
+        self: GrepJob instance.
+        pattern: a str, a pattern as typed after '?'. It is compiled here
+                 first, so an invalid one raises re.error at once.
+        files: a list of strs, the paths of the files.
+        """
+
+        compile_pattern(pattern, binary=True)
+        self.pattern = pattern
+        self.files = files
+        self.results = []
+        self.searched = 0
+        self.done = False
+        self.error = None
+        self._futures = []
+        self._cancelled = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """Blocks until the job has finished."""
+
+        self._thread.join()
+
+    def cancel(self):
+        """Stops the job, the batches not started yet are dropped."""
+
+        self._cancelled = True
+        for future in self._futures:
+            future.cancel()
+
+    def _run(self):
+        """Hands the batches to the pool and collects their hits as they
+        come in. Runs on its own thread."""
+
+        import concurrent.futures
+
+        try:
+            pool = grep_pool()
+            batches = {}
+            for start in range(0, len(self.files), GREP_BATCH):
+                batch = self.files[start:start + GREP_BATCH]
+                if self._cancelled:
+                    break
+                future = pool.submit(grep_files, batch, self.pattern)
+                batches[future] = (len(self._futures), len(batch))
+                self._futures.append(future)
+
+            # Batches finish in any order, but their hits are added in the
+            # order of the files, so the same search lists the same hits
+            finished = {}
+            added = 0
+            for future in concurrent.futures.as_completed(batches):
+                if self._cancelled:
+                    break
+                finished[batches[future][0]] = future
+                while added in finished:
+                    future = finished.pop(added)
+                    # Adding to a list is atomic, the window reads it
+                    # meanwhile
+                    self.results.extend(future.result())
+                    self.searched += batches[future][1]
+                    added += 1
+        except Exception as error:
+            self.error = error
+        self.done = True
+
+
+class QuickFix():
+    """The QuickFix class is the list of places ':cn' and ':cp' jump to,
+    filled by ':vimgrep'. Like Vim's, there is one per session.
+
+    Instance vars
+    -------------
+    entries: The list of (path, line, column, text) places.
+    current: The index of the place jumped to last, or -1.
+    job: The GrepJob filling entries, or None.
+    """
+
+    def __init__(self):
+        """Initializes an empty QuickFix list."""
+
+        self.entries = []
+        self.current = -1
+        self.job = None
+
+    def start(self, job):
+        """Empties the list and fills it with the hits of a GrepJob from now
+        on, cancelling the one that filled it before.
+
+        Parameters
+        ----------
+        self: QuickFix instance.
+        job: a GrepJob.
+        """
+
+        if self.job != None and not self.job.done:
+            self.job.cancel()
+        self.job = job
+        self.entries = []
+        self.current = -1
+
+    def update(self):
+        """Adds the hits the job has found since the last update, and
+        returns them as a list."""
+
+        if self.job == None:
+            return []
+        new = self.job.results[len(self.entries):]
+        self.entries.extend(new)
+
+        return new
+
+    def move(self, step):
+        """Returns the place step places after the current one, which
+        becomes the current one, or None past either end of the list.
+
+        Parameters
+        ----------
+        self: QuickFix instance.
+        step: an int, 1 for ':cn' and -1 for ':cp'.
+        """
+
+        self.update()
+        index = self.current + step
+        if self.current < 0:
+            index = 0
+        if not 0 <= index < len(self.entries):
+            return None
+        self.current = index
+
+        return self.entries[index]
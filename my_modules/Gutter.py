@@ -0,0 +1,176 @@
+"""This module draws the line numbers beside scroll_window and the status
+line below it.
+
+Both are worked out from the line index of the buffer instead of asking Tk:
+the number of the first line in view, the number of lines and the row and
+column of the cursor are each a bisection in the TextBuffer (or a lookup in
+the checkpoints of a LargeFile). Tk is only asked where each line in view is
+drawn, so a refresh costs the size of a screen, not the size of the file.
+
+Both are refreshed by the HighlightManager, once per frame of edits, scrolls
+and resizes, and only redrawn when what they show has changed.
+"""
+
+import tkinter as tk
+import tkinter.font as tkfont
+
+
+# The colors of the line numbers and of the gutter behind them
+GUTTER_FOREGROUND = "#808080"
+GUTTER_BACKGROUND = "#f0f0f0"
+
+# The space (in pixels) on either side of the line numbers
+GUTTER_PADDING = 4
+
+
+def status_text(tVIM):
+    """Returns the text of the status line of a window, like Vim's ruler:
+    the name of the document, whether it is modified or read-only, its
+    encoding and line endings unless they are UTF-8 and Unix ones, whether
+    it is followed, its number of lines, the line and column of the cursor
+    and the register 'q' is recording into.
+
+    Parameters
+    ----------
+    tVIM: a tVIM or HeadlessEditor instance.
+    """
+
+    document = tVIM.document
+    buffer = tVIM.buffer
+    line, column = buffer.offset_to_index(tVIM.view.cursor())
+
+    flags = ""
+    if document.modified():
+        flags += " [+]"
+    if not hasattr(buffer, "listeners"):
+        flags += " [RO]"
+    flags += document.format.flags()
+    if tVIM.follower != None:
+        flags += " [follow]"
+    lines = "%d lines" % buffer.line_count()
+    # A LargeFile is still counting its lines
+    if not getattr(buffer, "done", True):
+        lines = "%d+ lines" % buffer.line_count()
+
+    recording = ""
+    if tVIM.key_parser.recording != None:
+        recording = "  recording @" + tVIM.key_parser.recording
+
+    return '"%s"%s  %s  %d,%d%s' % (document.name(), flags, lines, line,
+                                     column + 1, recording)
+
+
+class Gutter():
+    """The Gutter class draws the number of each line in view on a Canvas
+    left of scroll_window.
+
+    Instance vars
+    -------------
+    tVIM: The tVIM instance whose lines are numbered.
+    canvas: The Tkinter Canvas the numbers are drawn on.
+    _drawn: What was last drawn, as a (rows, digits, font) triple, where
+            rows is a list of the (number, y) of each line.
+    _char_widths: A dict from font to the width of a digit in it.
+    """
+
+    def __init__(self, tVIM):
+        """Initializes a Gutter and makes its Canvas, which the caller
+        grids.
+
+        Parameters
+        ----------
+        self: Gutter instance.
+        tVIM: tVIM instance.
+        """
+
+        self.tVIM = tVIM
+        self.canvas = tk.Canvas(tVIM.root, width=0, highlightthickness=0,
+                                borderwidth=0, background=GUTTER_BACKGROUND)
+        self._drawn = None
+        self._char_widths = {}
+
+    def refresh(self, start, end):
+        """Draws the numbers of the lines in view, unless they are drawn
+        already. Called by the HighlightManager after each refresh.
+
+        Parameters
+        ----------
+        self: Gutter instance.
+        start: an int, the offset of the first line in view.
+        end: an int, the offset of the end of the last line in view.
+        """
+
+        buffer = self.tVIM.buffer
+        widget = self.tVIM.scroll_window
+        first = buffer.line_of(start)
+        last = buffer.line_of(max(start, end - 1))
+        # Buffer line 'first' is widget line 'top', which differ for a page
+        # of a LargeFile
+        top = int(self.tVIM.view.index(start).split(".")[0])
+
+        rows = []
+        for line in range(first, last + 1):
+            info = widget.dlineinfo("%d.0" % (top + line - first))
+            if info != None:
+                rows.append((line, info[1]))
+        drawn = (rows, len(str(buffer.line_count())), widget.cget("font"))
+        if drawn == self._drawn:
+            return
+        self._drawn = drawn
+        self._draw(*drawn)
+
+    def _draw(self, rows, digits, font):
+        """Draws the numbers of rows, sizing the gutter for digits."""
+
+        if font not in self._char_widths:
+            self._char_widths[font] = tkfont.Font(font=font).measure("0")
+        width = digits * self._char_widths[font] + 2 * GUTTER_PADDING
+        if int(self.canvas.cget("width")) != width:
+            self.canvas.config(width=width)
+
+        self.canvas.delete("all")
+        for line, y in rows:
+            self.canvas.create_text(width - GUTTER_PADDING, y, anchor=tk.NE,
+                                    text=str(line), font=font,
+                                    fill=GUTTER_FOREGROUND)
+
+
+class StatusLine():
+    """The StatusLine class shows status_text() in a Label below
+    scroll_window.
+
+    Instance vars
+    -------------
+    tVIM: The tVIM instance whose status is shown.
+    label: The Tkinter Label showing the status.
+    """
+
+    def __init__(self, tVIM):
+        """Initializes a StatusLine and makes its Label, which the caller
+        grids.
+
+        Parameters
+        ----------
+        self: StatusLine instance.
+        tVIM: tVIM instance.
+        """
+
+        self.tVIM = tVIM
+        self.label = tk.Label(tVIM.root, anchor=tk.W, font=("Courier", 9))
+
+    def schedule(self):
+        """Refreshes the status in the next frame, at most once per batch
+        of keys."""
+
+        self.tVIM.scheduler.schedule("status", self.refresh)
+
+    def refresh(self, start=None, end=None):
+        """Shows the status, unless it is shown already. Also called by the
+        HighlightManager after each refresh, with the range in view."""
+
+        self.tVIM.scheduler.cancel("status")
+        if self.tVIM.document == None:
+            return
+        text = status_text(self.tVIM)
+        if text != self.label.cget("text"):
+            self.label.config(text=text)
@@ -0,0 +1,604 @@
+"""This module runs the editing engine of tVIM without a window.
+
+A HeadlessEditor holds the same buffer, key parser, registers and search
+engine as a tVIM window and runs the very same commands from ParseCommands,
+but renders nothing. It needs neither Tk nor a display, so it is what the
+tests and the benchmarks drive:
+
+    editor = HeadlessEditor("first line\\nsecond line")
+    editor.keys("Gofinal line\\x1b")
+    editor.line("?line")
+    editor.keys("n")
+"""
+
+import os
+
+# Import our modules, but not MainModule, which builds the windows
+from my_modules.ParseCommands import * # Provides functionaltiy for commands
+from my_modules.StringConstants import * # Defines string constants
+from my_modules.SearchEngine import * # Finds the matches of ?pattern
+from my_modules.SaveFile import * # Saves files on a worker thread
+from my_modules.Session import * # Holds the documents of the editor
+from my_modules.Filter import * # Pipes lines through ':%!cmd'
+from my_modules.Follow import * # Follows growing files for ':follow'
+
+
+class HeadlessView():
+    """The HeadlessView class has the methods of a BufferView, but keeps the
+    cursor itself instead of rendering the buffer in a widget.
+
+    Instance vars
+    -------------
+    buffer: The TextBuffer (or LargeFile) being edited.
+    read_only: Whether buffer is a LargeFile, which can not be edited.
+    insert_mode: Whether keys are typed into the buffer, set by focus().
+    _cursor: The offset of the cursor.
+    """
+
+    def __init__(self, buffer):
+        """Initializes a HeadlessView with the cursor at the start.
+
+        Parameters
+        ----------
+        self: HeadlessView instance.
+        buffer: a TextBuffer or a LargeFile.
+        """
+
+        self.buffer = buffer
+        self.read_only = hasattr(buffer, "map")
+        self.insert_mode = False
+        self._cursor = 0
+
+    def insert(self, offset, text):
+        """Inserts text into the buffer."""
+
+        self.buffer.insert(offset, text)
+
+    def delete(self, offset, length):
+        """Deletes text from the buffer and returns it."""
+
+        return self.buffer.delete(offset, length)
+
+    def cursor(self):
+        """Returns the offset of the cursor."""
+
+        return self._cursor
+
+    def set_cursor(self, offset):
+        """Moves the cursor to an offset, kept within the buffer."""
+
+        self._cursor = max(0, min(offset, len(self.buffer)))
+
+    def focus(self):
+        """Enters insert mode, where a window would focus scroll_window."""
+
+        self.insert_mode = True
+
+    def detach(self):
+        """Does nothing, there is no widget to give back."""
+
+    def check_cursor(self):
+        """Does nothing, the whole buffer is always loaded."""
+
+    def yscroll(self, first, last):
+        """Does nothing, there is no scrollbar."""
+
+    def loaded_range(self):
+        """Returns the (start, end) offsets of the whole buffer."""
+
+        return 0, len(self.buffer)
+
+    def index(self, offset):
+        """Returns the "line.column" index of an offset."""
+
+        return "%d.%d" % self.buffer.offset_to_index(offset)
+
+    def offset(self, index):
+        """Returns the offset of a "line.column", "insert" or "end" index."""
+
+        if index == "insert":
+            return self._cursor
+        if index == "end":
+            return len(self.buffer)
+        line, column = index.split(".")
+
+        return self.buffer.index_to_offset(int(line), int(column))
+
+
+class HeadlessHighlights():
+    """The HeadlessHighlights class has the methods of a HighlightManager and
+    remembers the ranges it is given, since there is nothing to tag.
+
+    Instance vars
+    -------------
+    ranges: A dict from tag name to a (starts, ends) pair.
+    regexes: A dict from tag name to the regex that finds its ranges, or
+             None.
+    """
+
+    def __init__(self):
+        """Initializes a HeadlessHighlights with no ranges."""
+
+        self.ranges = {}
+        self.regexes = {}
+
+    def set_ranges(self, tag, starts, ends, regex=None):
+        """Replaces the ranges highlighted with a tag."""
+
+        self.ranges[tag] = (starts, ends)
+        self.regexes[tag] = regex
+
+    def clear(self, tag):
+        """Removes every range highlighted with a tag."""
+
+        self.ranges.pop(tag, None)
+        self.regexes.pop(tag, None)
+
+    def watch(self, buffer):
+        """Does nothing, edits need no refresh."""
+
+    def schedule(self):
+        """Does nothing, there is no view to refresh."""
+
+    def refresh(self):
+        """Does nothing, there is no view to refresh."""
+
+
+class HeadlessRoot():
+    """The HeadlessRoot class has the methods of a Tk window that schedule
+    calls and set the title, but only runs the calls when run_idle() is
+    called, so a test decides when a frame passes.
+
+    Instance vars
+    -------------
+    calls: A dict from the id of each call pending to its (function, args)
+           pair, in the order they were scheduled.
+    titles: A list of the titles set, the last one shown.
+    _next_id: The id of the next call scheduled.
+    """
+
+    def __init__(self):
+        """Initializes a HeadlessRoot with no calls pending."""
+
+        self.calls = {}
+        self.titles = []
+        self._next_id = 1
+
+    def after_idle(self, function, *args):
+        """Schedules a call for the next run_idle() and returns its id."""
+
+        job = self._next_id
+        self._next_id += 1
+        self.calls[job] = (function, args)
+
+        return job
+
+    def after(self, ms, function, *args):
+        """Schedules a call like after_idle, however long ms is."""
+
+        return self.after_idle(function, *args)
+
+    def after_cancel(self, job):
+        """Drops a call that has not run yet."""
+
+        self.calls.pop(job, None)
+
+    def title(self, text):
+        """Sets the title."""
+
+        self.titles.append(text)
+
+    def run_idle(self, once=False):
+        """Runs the calls pending, and then the calls they schedule until
+        none are left.
+
+        Parameters
+        ----------
+        self: HeadlessRoot instance.
+        once: a bool, whether to run only the calls pending, leaving the
+              ones they schedule to the next run, defaults to False.
+        """
+
+        while self.calls:
+            for job in list(self.calls):
+                # A call may cancel one that comes after it
+                if job in self.calls:
+                    function, args = self.calls.pop(job)
+                    function(*args)
+            if once:
+                return
+
+
+class KeyPlayer():
+    """The KeyPlayer class types keys into the model of a window, the way
+    the window would handle them: keys go to the key parser in command
+    mode and into the buffer in insert mode, and '?' and ':' lines run on
+    '\\r'. Nothing is drawn, so it runs the keys of a HeadlessEditor and
+    replays macros in a tVIM window.
+
+    Instance vars
+    -------------
+    window: The tVIM or HeadlessEditor the keys are typed into. Its view
+            must keep insert_mode, like a HeadlessView.
+    record: Whether the keys are recorded while 'q' is recording, which
+            the keys of a replay are not.
+    line: The '?' or ':' line being typed, or None.
+    """
+
+    def __init__(self, window, record=False):
+        """Initializes a KeyPlayer.
+
+        Parameters
+        ----------
+        self: KeyPlayer instance.
+        window: a tVIM or HeadlessEditor instance.
+        record: a bool, whether 'q' records the keys, defaults to False.
+        """
+
+        self.window = window
+        self.record = record
+        self.line = None
+
+    def keys(self, keys):
+        """Types keys into the window.
+
+        Parameters
+        ----------
+        self: KeyPlayer instance.
+        keys: a str, the chars of the keys.
+        """
+
+        parser = self.window.key_parser
+        for key in keys:
+            insert_mode = self.window.view.insert_mode
+            if self.record and parser.recording != None:
+                # 'q' in command mode stops recording, like parse_command
+                if (key == "q" and not insert_mode and self.line == None
+                        and not parser.pending):
+                    stop_recording(self.window)
+                    continue
+                parser.recorded.append(key)
+            if insert_mode:
+                self._type(key)
+            elif self.line != None:
+                self._type_line(key)
+            else:
+                self._command(key)
+
+    def _command(self, key):
+        """Handles a key typed in command mode, like parse_command."""
+
+        parser = self.window.key_parser
+        if key == '\x1b':
+            parser.reset()
+        elif key in "?:" and not parser.pending:
+            self.line = key
+        elif key == '\r' and not parser.pending:
+            pass
+        else:
+            action = parser.feed(key)
+            if action == False:
+                raise CommandError(CMD_ERROR)
+            if action != None:
+                run_action(self.window, action)
+
+    def _type_line(self, key):
+        """Handles a key typed into a '?' or ':' line, like parse_line."""
+
+        if key == '\x1b':
+            self.line = None
+        elif key == '\r':
+            command, self.line = self.line, None
+            run_line(self.window, command)
+        elif key == '\x08':
+            self.line = self.line[:-1] or None
+        else:
+            self.line += key
+
+    def _type(self, key):
+        """Handles a key typed in insert mode, like the Text widget."""
+
+        view = self.window.view
+        cursor = view.cursor()
+        if key == '\x1b':
+            view.insert_mode = False
+        elif view.read_only:
+            raise CommandError(READ_ONLY_ERROR)
+        elif key == '\x08':
+            if cursor > 0:
+                view.delete(cursor - 1, 1)
+                view.set_cursor(cursor - 1)
+        else:
+            key = '\n' if key == '\r' else key
+            view.insert(cursor, key)
+            view.set_cursor(cursor + len(key))
+
+
+class HeadlessEditor():
+    """The HeadlessEditor class edits a document like a tVIM window, without
+    opening one. Commands that can not run raise a CommandError instead of
+    showing a popup.
+
+    Instance vars
+    -------------
+    session: The Session of the editor, of its own unless one is given.
+    document: The Document of the session shown in the editor.
+    buffer: The TextBuffer holding the document, or a read-only LargeFile.
+    view: The HeadlessView holding the cursor.
+    key_parser: The KeyParser that turns keys into commands.
+    registers: A dict from register name to a (text, linewise) pair, shared
+               by every editor of the session.
+    undo_tree: The UndoTree recording the edits of buffer.
+    search_engine: The SearchEngine holding the matches of the last search.
+    incremental_search: The IncrementalSearch, only ever asked to finish.
+    highlights: The HeadlessHighlights with the ranges that would be tagged.
+    filename: The path of document's file, or None.
+    filter_apply: Always None, as filter() puts the whole output in before
+                  it returns.
+    follower: The Follower of document's file, whose text poll_follow()
+              appends, or None.
+    messages: A list of the messages shown, like the output of ':ls'.
+    closed: Whether ':q' or ':wq' has closed the editor.
+    """
+
+    def __init__(self, contents="", large_file=None, filename=None,
+                 session=None):
+        """Initializes a HeadlessEditor, like a tVIM window.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        contents: a str, the text to edit, defaults to "".
+        large_file: a LargeFile opened read-only instead of contents,
+                    defaults to None.
+        filename: a str, the path of a file to edit instead of contents,
+                  defaults to None.
+        session: a Session shared with other editors, defaults to None.
+        """
+
+        self.session = session if session != None else Session()
+        self.document = None
+        self.buffer = None
+        self.view = None
+        self.filename = None
+        self.filter_apply = None
+        self.follower = None
+        self.messages = []
+        self.closed = False
+
+        self.key_parser = KeyParser(NORMAL_COMMANDS, MOTIONS, OPERATORS)
+        self.registers = self.session.registers
+        if filename != None or large_file != None:
+            contents = None
+        self.switch_to(self.session.open(filename, contents, large_file))
+        self.session.windows.append(self)
+        self.search_engine = SearchEngine()
+        self.incremental_search = IncrementalSearch(self)
+        self.highlights = HeadlessHighlights()
+        self._player = KeyPlayer(self, record=True)
+
+    @classmethod
+    def open(cls, filename, session=None):
+        """Opens a file like the 'Open' menu does, large files read-only.
+
+        Parameters
+        ----------
+        cls: HeadlessEditor class.
+        filename: a str, the path of the file.
+        session: a Session shared with other editors, defaults to None.
+        """
+
+        return cls(filename=filename, session=session)
+
+    def switch_to(self, document):
+        """Shows another document of the session in the editor.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        document: a Document of the session.
+        """
+
+        if document is self.document:
+            return
+        self.stop_following()
+        if self.filter_apply != None:
+            self.filter_apply.finish()
+        document.load()
+
+        if self.document != None:
+            self.document.cursor = self.view.cursor()
+            self.view.detach()
+        self.session.show(self, document)
+        self.view = HeadlessView(self.buffer)
+        self.view.set_cursor(document.cursor)
+
+    def find_file(self, query):
+        """Opens the file under the current folder whose path best matches
+        a query, waiting for the search.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        query: a str, the chars to find in order in the path.
+        """
+
+        job = FindJob(self.session.file_index(os.getcwd()), query)
+        job.wait()
+        if not job.results:
+            raise CommandError(NO_MATCH_ERROR)
+        try:
+            self.switch_to(self.session.open(job.results[0]))
+        except (OSError, UnicodeDecodeError) as error:
+            raise CommandError(OPEN_ERROR + "\n" + str(error))
+
+    def grep(self, pattern, files, jump=True):
+        """Searches files for a pattern in the worker processes, waiting for
+        every hit to be in the quickfix list.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        pattern: a str, a pattern as typed after '?'.
+        files: a list of strs, the paths of the files.
+        jump: a bool, whether to jump to the first hit, defaults to True.
+        """
+
+        job = GrepJob(pattern, files)
+        quickfix = self.session.quickfix
+        quickfix.start(job)
+        job.wait()
+        quickfix.update()
+        if job.error != None:
+            raise CommandError(GREP_ERROR + "\n" + str(job.error))
+        if not quickfix.entries:
+            raise CommandError(NO_GREP_MATCH)
+        if jump:
+            jump_to_entry(self, quickfix.move(1))
+
+    def filter(self, start, end, command):
+        """Pipes a range of the buffer through a shell command, waiting
+        for it to exit, and replaces the range with what it prints.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        start: an int, the offset of the first char of the range.
+        end: an int, the offset after the last char of the range.
+        command: a str, the shell command.
+        """
+
+        job = FilterJob(self.buffer, start, end, command)
+        job.wait()
+        applying = apply_filter(self, job)
+        if applying != None:
+            applying.finish()
+
+    def follow(self, lines):
+        """Follows the file of the document, like a tVIM window, but only
+        appends what was read when poll_follow() is called.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        lines: an int, the most lines to keep, or None to keep them all.
+        """
+
+        self.stop_following()
+        self.follower = Follower(self.filename, follow_offset(self.document),
+                                 self.document.format, lines)
+
+    def stop_following(self):
+        """Stops following the file of the document, if it is followed."""
+
+        if self.follower != None:
+            self.follower.stop()
+            # Following again goes on from here
+            self.document.followed = (self.buffer.version,
+                                      self.follower.taken_offset())
+            self.follower = None
+
+    def poll_follow(self):
+        """Appends what the Follower read since the last call, like a frame
+        of a tVIM window."""
+
+        text = self.follower.take()
+        if text:
+            apply_follow(self, text)
+
+    def show_quickfix(self, shown):
+        """Does nothing, there is no quickfix list to show."""
+
+    def message(self, text):
+        """Keeps a message in messages, since there is no one to show it to.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        text: a str, the message.
+        """
+
+        self.messages.append(text)
+
+    def keys(self, keys):
+        """Types keys, as if they were typed into the window. Keys go to the
+        key parser in command mode and into the buffer in insert mode, and
+        Esc goes back to command mode. A '?' or ':' line runs on '\\r'.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        keys: a str, the chars of the keys.
+        """
+
+        self._player.keys(keys)
+
+    def replay(self, keys):
+        """Replays the keys of a macro, like keys() but without recording
+        them again.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        keys: a str, the chars of the keys.
+        """
+
+        KeyPlayer(self).keys(keys)
+
+    def line(self, command):
+        """Runs a '?pattern' or ':command' line.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        command: a str, the line including its leading '?' or ':'.
+        """
+
+        run_line(self, command)
+
+    def text(self):
+        """Returns the whole text of the document."""
+
+        return self.buffer.get_text()
+
+    def save_file(self, filename, on_done=None):
+        """Saves the document as a filename, waiting until it is written.
+
+        Parameters
+        ----------
+        self: HeadlessEditor instance.
+        filename: a str that is the name of the file.
+        on_done: a function called once the file is saved, defaults to None.
+        """
+
+        job = SaveJob(self.buffer, filename, self.document.format,
+                      self.document)
+        job.wait()
+        if job.error != None:
+            raise CommandError(SAVE_ERROR + "\n" + str(job.error))
+        job.document.saved(job.filename, job.version)
+        self.filename = self.document.filename
+        if on_done != None:
+            on_done()
+
+    def save_as(self, on_done=None):
+        """Saves the document as the file it was last opened or saved as,
+        since there is no dialog to ask for a name."""
+
+        if self.filename == None:
+            raise CommandError(NO_FILE_NAME_ERROR)
+        self.save_file(self.filename, on_done)
+
+    def close(self):
+        """Marks the editor as closed and releases its document."""
+
+        if not self.closed:
+            self.closed = True
+            self.stop_following()
+            self.document.cursor = self.view.cursor()
+            self.session.window_closed(self)
+
+    def confirm_quit(self):
+        """Closes the editor, there is no one to ask."""
+
+        self.close()
@@ -0,0 +1,197 @@
+"""This module draws highlights (search matches, the 'gg'/'G' cursor and the
+syntax of code) in scroll_window one viewport at a time.
+
+The ranges to highlight are kept on the Python side as sorted arrays of
+offsets. Tk tags are only added to the lines currently in view, refreshed when
+the view scrolls, is resized or the buffer is edited, so the number of Tk tag
+ranges stays the size of a screen no matter how many matches there are. The
+refreshes are queued on the FrameScheduler of the window, so a burst of keys
+refreshes once.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Import our modules
+from my_modules.SyntaxHighlighter import SYNTAX_TAGS # The tags of tokens
+
+
+class HighlightManager():
+    """The HighlightManager class tags the visible part of a set of ranges.
+
+    Instance vars
+    -------------
+    tVIM: The tVIM instance whose scroll_window is highlighted.
+    listeners: A list of functions called as function(start, end) with the
+               range in view after each refresh, like the line numbers.
+    _ranges: A dict from tag name to (starts, ends, regex, version). starts
+             and ends are sorted arrays of offsets, version is the buffer
+             version they belong to and regex, if any, is used to find the
+             ranges again in view once the buffer has been edited.
+    _buffer: The buffer whose edits schedule a refresh, or None.
+    """
+
+    def __init__(self, tVIM):
+        """Initializes a HighlightManager and hooks it to scrolling and
+        resizing of tVIM's scroll_window.
+
+        Parameters
+        ----------
+        self: HighlightManager instance.
+        tVIM: tVIM instance.
+        """
+
+        self.tVIM = tVIM
+        self.listeners = []
+        self._ranges = {}
+        self._buffer = None
+
+        # Keep the view of the current document informed, then refresh
+        widget = tVIM.scroll_window
+        widget.config(yscrollcommand=self._on_yscroll)
+        widget.bind("<Configure>", lambda event: self.schedule(), add="+")
+
+    def set_ranges(self, tag, starts, ends, regex=None):
+        """Replaces the ranges highlighted with a tag.
+
+        Parameters
+        ----------
+        self: HighlightManager instance.
+        tag: a str, the name of the tag.
+        starts: a sorted sequence of ints, where each range starts.
+        ends: a sequence of ints, where each range ends. The ranges must not
+              overlap, so ends is sorted too.
+        regex: a compiled pattern that finds the ranges, defaults to None.
+        """
+
+        self._ranges[tag] = (starts, ends, regex, self.tVIM.buffer.version)
+        self.schedule()
+
+    def clear(self, tag):
+        """Removes every range highlighted with a tag.
+
+        Parameters
+        ----------
+        self: HighlightManager instance.
+        tag: a str, the name of the tag.
+        """
+
+        if self._ranges.pop(tag, None) is not None:
+            self._remove_tag(tag)
+
+    def watch(self, buffer):
+        """Refreshes the highlights after every edit of a buffer, instead of
+        the one watched before.
+
+        Parameters
+        ----------
+        self: HighlightManager instance.
+        buffer: a TextBuffer, or None to stop watching.
+        """
+
+        listeners = getattr(self._buffer, "listeners", [])
+        if self._on_edit in listeners:
+            listeners.remove(self._on_edit)
+        self._buffer = buffer
+        if hasattr(buffer, "listeners"):
+            buffer.listeners.append(self._on_edit)
+
+    def schedule(self):
+        """Refreshes the highlights in the next frame, at most once per
+        batch of keys, edits and scroll events."""
+
+        self.tVIM.scheduler.schedule("highlights", self.refresh)
+
+    def refresh(self):
+        """Tags the ranges that are in view and untags the others."""
+
+        self.tVIM.scheduler.cancel("highlights")
+        start, end = self._visible_range()
+
+        for tag, (starts, ends, regex, version) in list(self._ranges.items()):
+            self._remove_tag(tag)
+
+            # Edited text moved the ranges, find them again or drop them
+            if version != self.tVIM.buffer.version:
+                if regex is None:
+                    del self._ranges[tag]
+                    continue
+                starts, ends = self._find_in_view(regex, start, end)
+
+            # Ranges overlapping [start, end), found by bisection
+            first = bisect_right(ends, start)
+            last = bisect_left(starts, end)
+            indices = []
+            for i in range(first, last):
+                indices.append(self.tVIM.view.index(starts[i]))
+                indices.append(self.tVIM.view.index(ends[i]))
+            if indices:
+                self.tVIM.scroll_window.tag_add(tag, *indices)
+
+        self._tag_syntax(start, end)
+        for listener in self.listeners:
+            listener(start, end)
+
+    def _tag_syntax(self, start, end):
+        """Tags the tokens of the lines in view, if the document has a
+        SyntaxHighlighter. Tokens are tagged one call per kind."""
+
+        for tag in SYNTAX_TAGS:
+            self._remove_tag(tag)
+        syntax = self.tVIM.document.syntax
+        if syntax is None:
+            return
+
+        buffer = self.tVIM.buffer
+        indices = {}
+        for line, first, last, kind in syntax.tokens(buffer.line_of(start),
+                                                     buffer.line_of(end)):
+            indices.setdefault("syntax_" + kind, []).extend(
+                ("%d.%d" % (line, first), "%d.%d" % (line, last)))
+        for tag, tag_indices in indices.items():
+            self.tVIM.scroll_window.tag_add(tag, *tag_indices)
+
+    def _visible_range(self):
+        """Returns the (start, end) offsets of the lines in view."""
+
+        view = self.tVIM.view
+        buffer = self.tVIM.buffer
+        widget = self.tVIM.scroll_window
+        top = view.offset("@0,0")
+        bottom = view.offset("@%d,%d" % (widget.winfo_width(),
+                                         widget.winfo_height()))
+        loaded_start, loaded_end = view.loaded_range()
+
+        return (max(buffer.line_start(buffer.line_of(top)), loaded_start),
+                min(buffer.line_end(buffer.line_of(bottom)) + 1, loaded_end))
+
+    def _find_in_view(self, regex, start, end):
+        """Returns the (starts, ends) of the matches of regex in view."""
+
+        starts, ends = array('q'), array('q')
+        for match in regex.finditer(self.tVIM.buffer.get_text(start, end)):
+            if match.end() > match.start():
+                starts.append(match.start() + start)
+                ends.append(match.end() + start)
+
+        return starts, ends
+
+    def _remove_tag(self, tag):
+        """Removes a tag from the ranges it was added to, which are only
+        ever the ones that were in view."""
+
+        ranges = self.tVIM.scroll_window.tag_ranges(tag)
+        if ranges:
+            self.tVIM.scroll_window.tag_remove(tag, *ranges)
+
+    def _on_edit(self, offset, deleted, inserted):
+        """Schedules a refresh. Called by the buffer on every edit."""
+
+        self.schedule()
+
+    def _on_yscroll(self, first, last):
+        """Passes the scroll on to the view, then schedules a refresh."""
+
+        if self.tVIM.view != None:
+            self.tVIM.view.yscroll(first, last)
+        self.schedule()
@@ -0,0 +1,142 @@
+"""This module turns the keys typed in command mode into Vim-style commands.
+
+Commands, motions and operators are looked up in dicts keyed by their key
+sequence, and the proper prefixes of every sequence (like the 'g' of 'gg')
+are kept in a set, so each keystroke is a single O(1) state transition no
+matter how many commands there are. Counts ('5j', '3dd', 'd3w') and operators
+followed by a motion ('dw', 'yG', 'c$') are handled by the parser itself.
+
+The parser only decides what to run; the functions in the tables do the work.
+"""
+
+
+class KeyParser():
+    """The KeyParser class is a state machine fed one key at a time.
+
+    Instance vars
+    -------------
+    commands: A dict from key sequence to a function(tVIM, count).
+    motions: A dict from key sequence to a (function, linewise) pair, where
+             function(tVIM, offset, count) returns the offset moved to.
+    operators: A dict from key to a function(tVIM, start, end, linewise).
+    prefixes: A set with every proper prefix of the keys in the tables.
+    pending: The keys typed so far for the command being built.
+    line_mode: Whether a '?pattern' or ':command' line is being typed.
+               Those lines are left to cmd_line and do not reach feed().
+    recording: The register typed keys are recorded into by 'q', or None.
+    recorded: A list of the keys recorded since 'q' started.
+    last_macro: The register '@@' replays, the last one replayed, or None.
+    """
+
+    def __init__(self, commands, motions, operators):
+        """Initializes a KeyParser using the inputted tables.
+
+        Parameters
+        ----------
+        self: KeyParser instance.
+        commands: a dict of command functions.
+        motions: a dict of (motion function, linewise) pairs.
+        operators: a dict of operator functions.
+        """
+
+        self.commands = commands
+        self.motions = motions
+        self.operators = operators
+
+        self.prefixes = set()
+        for keys in list(commands) + list(motions):
+            for end in range(1, len(keys)):
+                self.prefixes.add(keys[:end])
+        self.line_mode = False
+        self.recording = None
+        self.recorded = []
+        self.last_macro = None
+        self.reset()
+
+    def reset(self):
+        """Forgets the keys typed so far."""
+
+        self.pending = ""
+        self._keys = ""
+        self._count = ""
+        self._operator = None
+        self._operator_count = ""
+
+    def feed(self, key):
+        """Takes in one typed key.
+
+        Parameters
+        ----------
+        self: KeyParser instance.
+        key: a str, the char of the key.
+
+        Returns
+        -------
+        None while more keys are needed, False if the keys do not form a
+        command, or an action tuple to run with run_action:
+        ("command", function, count),
+        ("motion", function, count), or
+        ("operator", operator, motion or None, count, linewise), where a
+        motion of None means the operator key was doubled (like 'dd').
+        """
+
+        keys = self._keys + key
+        self.pending += key
+
+        # Digits make up a count, except for a leading '0' which is a motion
+        if not self._keys and key.isdigit():
+            if self._operator is not None and (key != "0"
+                                               or self._operator_count):
+                self._operator_count += key
+                return None
+            if self._operator is None and (key != "0" or self._count):
+                self._count += key
+                return None
+
+        # An operator is waiting for its motion
+        if self._operator is not None:
+            if keys == self._operator:
+                return self._finish(("operator", self.operators[keys], None,
+                                     self._total_count(), True))
+            if keys in self.motions:
+                motion, linewise = self.motions[keys]
+                return self._finish(("operator",
+                                     self.operators[self._operator], motion,
+                                     self._total_count(), linewise))
+
+        elif keys in self.operators:
+            self._operator = keys
+            self._keys = ""
+            return None
+
+        elif keys in self.commands:
+            return self._finish(("command", self.commands[keys],
+                                 self._total_count()))
+
+        elif keys in self.motions:
+            return self._finish(("motion", self.motions[keys][0],
+                                 self._total_count()))
+
+        if keys in self.prefixes:
+            self._keys = keys
+            return None
+
+        self.reset()
+
+        return False
+
+    def _total_count(self):
+        """Returns the count typed before the command times the count typed
+        after its operator, or None if no count was typed."""
+
+        if not self._count and not self._operator_count:
+            return None
+
+        return int(self._count or 1) * int(self._operator_count or 1)
+
+    def _finish(self, action):
+        """Resets the parser and returns an action."""
+
+        self.reset()
+
+        return action
@@ -0,0 +1,474 @@
+"""This module lets tVIM open files too large to load into a Text widget.
+
+A LargeFile memory-maps the file and indexes its lines on a background
+thread, and a PagedView shows only the lines around the viewport in
+scroll_window, loading a new page as the user scrolls. Large files are opened
+read-only, so the file itself is never copied into memory. Only the lines
+shown or searched are decoded, in the encoding sniffed from the start of the
+file, and saving writes the mapped bytes back as they are.
+"""
+
+import mmap
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from tkinter import DISABLED, NORMAL
+
+# Import our modules
+from my_modules.FileFormat import * # Decodes the bytes of the file
+from my_modules.Profiler import span # Times the renders for ':profile'
+
+
+# Files at least this many bytes are opened with a LargeFile
+LARGE_FILE_SIZE = 64 << 20
+
+# The index keeps the offset of one line start out of every INDEX_STEP lines
+INDEX_STEP = 64
+# How many bytes the indexing thread scans at a time
+INDEX_CHUNK = 16 << 20
+# Matches INDEX_STEP whole lines, so its matches end at the indexed lines
+LINES_RE = re.compile(b'(?:[^\n]*\n){%d}' % INDEX_STEP)
+
+# The number of lines loaded into the widget at once
+PAGE_LINES = 600
+# How close (as a fraction of the page) the view may get to the edge of
+# the page before the next page is loaded
+PAGE_MARGIN = 0.2
+# How often (in ms) the scrollbar is refreshed while the index is built
+INDEX_POLL = 250
+
+
+class LargeFile():
+    """The LargeFile class gives read-only, line-based access to a file
+    through a memory map. It has the same reading methods as a TextBuffer,
+    but its offsets count bytes of the file instead of chars.
+
+    Instance vars
+    -------------
+    filename: The path of the file.
+    size: The size of the file in bytes.
+    map: The mmap of the file, or an empty bytes for an empty file.
+    format: The FileFormat of the file, which must have byte_lines().
+    checkpoints: An array with the offsets of lines 1, INDEX_STEP + 1,
+                 2 * INDEX_STEP + 1, ... found so far.
+    done: Whether the whole file has been indexed.
+    version: Always 0, a LargeFile is never edited.
+    """
+
+    version = 0
+
+    def __init__(self, filename, file_format=None, index=None):
+        """Maps the file into memory and starts indexing it, unless its
+        index is given.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        filename: a str, the path of the file to open.
+        file_format: the FileFormat of the file, sniffed from its start by
+                     default.
+        index: a (checkpoints, newline_total) pair of the whole file, from
+               an earlier session, defaults to None.
+        """
+
+        self.filename = filename
+        self._file = open(filename, "rb")
+        self.size = self._file.seek(0, 2)
+        # mmap refuses empty files, an empty bytes reads the same way
+        if self.size:
+            self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = b""
+        if file_format == None:
+            file_format = sniff_format(self.map[:SNIFF_SIZE])
+        self.format = file_format
+
+        # The first line starts after the byte order mark
+        self.checkpoints = array('q', [len(file_format.bom)])
+        self.done = False
+        self._newline_total = 0
+        self._closed = False
+        self._thread = None
+        if index != None:
+            self.checkpoints, self._newline_total = index
+            self.done = True
+            return
+
+        # Build the line index without blocking the window
+        self._thread = threading.Thread(target=self._build_index, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stops the indexing thread and unmaps the file."""
+
+        self._closed = True
+        if self._thread != None:
+            self._thread.join()
+        if self.size:
+            self.map.close()
+        self._file.close()
+
+    def __len__(self):
+        """Returns the size of the file in bytes."""
+
+        return self.size
+
+    def line_count(self):
+        """Returns the number of lines indexed so far, or the number of lines
+        in the file once the index is done."""
+
+        if self.done:
+            return self._newline_total + 1
+
+        return (len(self.checkpoints) - 1) * INDEX_STEP + 1
+
+    def get_text(self, start=0, end=None):
+        """Returns the text between two byte offsets, decoded in the format
+        of the file, with '\n' ending each line.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        start: an int, the offset of the first byte, defaults to 0.
+        end: an int, the offset after the last byte, defaults to the end.
+        """
+
+        end = self.size if end is None else min(end, self.size)
+        text = self.map[max(start, self.checkpoints[0]):end].decode(
+            self.format.encoding, self.format.errors())
+        if self.format.newline == "\r\n":
+            text = text.replace("\r\n", "\n")
+
+        return text
+
+    def get_line(self, line):
+        """Returns the text of a line, without its line ending.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        line: an int, the line number (starting at 1).
+        """
+
+        text = self.get_text(self.line_start(line), self.line_end(line))
+        if self.format.newline == "\r\n" and text.endswith("\r"):
+            text = text[:-1]
+
+        return text
+
+    def line_start(self, line):
+        """Returns the offset of the first byte of a line.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        line: an int, the line number (starting at 1). Lines past the end
+              of the file give the size of the file.
+        """
+
+        line = max(line, 1)
+        if self.done and line > self.line_count():
+            return self.size
+
+        # Start at the closest indexed line, then skip the remaining lines
+        checkpoint = min((line - 1) // INDEX_STEP, len(self.checkpoints) - 1)
+        pos = self.checkpoints[checkpoint]
+        for _ in range(line - 1 - checkpoint * INDEX_STEP):
+            pos = self.map.find(b'\n', pos) + 1
+            if pos == 0:
+                return self.size
+
+        return pos
+
+    def line_end(self, line):
+        """Returns the offset of the newline that ends a line, or the size of
+        the file for the last line.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        line: an int, the line number (starting at 1).
+        """
+
+        end = self.map.find(b'\n', self.line_start(line))
+
+        return self.size if end == -1 else end
+
+    def line_of(self, offset):
+        """Returns the number of the line holding a byte offset.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        offset: an int, a byte offset in the file.
+        """
+
+        offset = min(max(offset, self.checkpoints[0]), self.size)
+        checkpoint = bisect_right(self.checkpoints, offset) - 1
+        start = self.checkpoints[checkpoint]
+
+        return (checkpoint * INDEX_STEP + 1
+                + self.map[start:offset].count(b'\n'))
+
+    def offset_to_index(self, offset):
+        """Returns the (line, column) pair of a byte offset, where the column
+        counts decoded chars.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        offset: an int, a byte offset in the file.
+        """
+
+        line = self.line_of(offset)
+
+        return line, len(self.get_text(self.line_start(line), offset))
+
+    def index_to_offset(self, line, column):
+        """Returns the byte offset of a (line, column) pair.
+
+        Parameters
+        ----------
+        self: LargeFile instance.
+        line: an int, the line number (starting at 1).
+        column: an int, the column number (starting at 0).
+        """
+
+        start = self.line_start(line)
+        prefix = self.get_line(line)[:max(column, 0)]
+
+        return start + len(prefix.encode(self.format.encoding,
+                                         self.format.errors()))
+
+    def _build_index(self):
+        """Finds every INDEX_STEP-th line start. Runs on its own thread."""
+
+        pos = 0
+        span = INDEX_CHUNK
+        while pos < self.size and not self._closed:
+            end = min(pos + span, self.size)
+            found = array('q', (match.end() for match in
+                                LINES_RE.finditer(self.map, pos, end)))
+
+            if found:
+                self.checkpoints.extend(found)
+                pos = found[-1]
+                span = INDEX_CHUNK
+            elif end == self.size:
+                break
+            else:
+                # Lines too long for one chunk, look further ahead
+                span *= 2
+
+        # Count the newlines after the last checkpoint
+        self._newline_total = ((len(self.checkpoints) - 1) * INDEX_STEP
+                               + self.map[pos:self.size].count(b'\n'))
+        self.done = not self._closed
+
+
+class PagedView():
+    """The PagedView class shows the lines of a LargeFile around the viewport
+    in a Text widget. It has the same methods as a BufferView, but cannot
+    edit the file.
+
+    Instance vars
+    -------------
+    widget: The Tkinter ScrolledText widget that shows the page.
+    buffer: The LargeFile being viewed.
+    top: The line of the file shown on the first line of the widget.
+    read_only: Always True, commands that edit check it first.
+    """
+
+    read_only = True
+
+    def __init__(self, widget, buffer):
+        """Initializes a PagedView and shows the first page of the file.
+
+        Parameters
+        ----------
+        self: PagedView instance.
+        widget: a Tkinter ScrolledText widget.
+        buffer: a LargeFile instance.
+        """
+
+        self.widget = widget
+        self.buffer = buffer
+        self.top = 1
+        self._page_end = 1
+        self._detached = False
+
+        # The scrollbar is driven by the position in the file, not the page
+        self.widget.config(state=DISABLED)
+        self.widget.vbar.config(command=self._on_scrollbar)
+
+        self.render()
+        self._poll_index()
+
+    def detach(self):
+        """Gives the widget and its scrollbar back, so another view can use
+        the widget."""
+
+        self._detached = True
+        self.widget.config(state=NORMAL)
+        self.widget.vbar.config(command=self.widget.yview)
+
+    @span("render page")
+    def render(self, top=None):
+        """Loads a page of lines starting at a line of the file.
+
+        Parameters
+        ----------
+        self: PagedView instance.
+        top: an int, the first line of the page, defaults to the current one.
+        """
+
+        if top is not None:
+            self.top = max(1, top)
+        self._page_end = self.top + PAGE_LINES
+        text = self.buffer.get_text(self.buffer.line_start(self.top),
+                                    self.buffer.line_start(self._page_end))
+        # Drop the newline of the last line, the widget adds its own
+        if text.endswith('\n'):
+            text = text[:-1]
+
+        self.widget.config(state=NORMAL)
+        self.widget.delete("1.0", "end")
+        self.widget.insert("1.0", text)
+        self.widget.config(state=DISABLED)
+
+    def show_line(self, line):
+        """Loads the page around a line of the file unless it is loaded.
+
+        Parameters
+        ----------
+        self: PagedView instance.
+        line: an int, the line of the file to show.
+        """
+
+        if not self.top <= line < self._page_end:
+            self.render(line - PAGE_LINES // 2)
+        self.widget.see("%d.0" % (line - self.top + 1))
+
+    # The methods below match the ones of BufferView
+
+    def insert(self, offset, text):
+        """Large files are read-only, so nothing is inserted."""
+
+    def delete(self, offset, length):
+        """Large files are read-only, so nothing is deleted."""
+
+        return ""
+
+    def cursor(self):
+        """Returns the byte offset of the insert cursor."""
+
+        return self.offset("insert")
+
+    def set_cursor(self, offset):
+        """Moves the insert cursor to a byte offset, loading its page first.
+
+        Parameters
+        ----------
+        self: PagedView instance.
+        offset: an int, the new offset of the cursor.
+        """
+
+        self.show_line(self.buffer.line_of(offset))
+        index = self.index(offset)
+        self.widget.mark_set("insert", index)
+        self.widget.see(index)
+
+    def focus(self):
+        """Moves the keyboard focus to the widget, for insert mode."""
+
+        self.widget.focus()
+
+    def loaded_range(self):
+        """Returns the (start, end) byte offsets of the page in the widget."""
+
+        return (self.buffer.line_start(self.top),
+                self.buffer.line_start(self._page_end))
+
+    def index(self, offset):
+        """Returns the widget index of a byte offset in the current page.
+
+        Parameters
+        ----------
+        self: PagedView instance.
+        offset: an int, a byte offset in the file.
+        """
+
+        line, column = self.buffer.offset_to_index(offset)
+
+        return "%d.%d" % (line - self.top + 1, column)
+
+    def offset(self, index):
+        """Returns the byte offset of a widget index.
+
+        Parameters
+        ----------
+        self: PagedView instance.
+        index: a str, any index the widget understands (e.g. "insert").
+        """
+
+        line, column = self.widget.index(index).split(".")
+
+        return self.buffer.index_to_offset(int(line) + self.top - 1,
+                                           int(column))
+
+    # The methods below handle scrolling
+
+    def yscroll(self, first, last):
+        """Loads the next or previous page when the view nears the edge of
+        the current one, then moves the scrollbar to the place in the file.
+        Called by the HighlightManager whenever the widget scrolls."""
+
+        first, last = float(first), float(last)
+        visible = self.top + int(first * PAGE_LINES)
+        near_top = first < PAGE_MARGIN and self.top > 1
+        near_end = (last > 1 - PAGE_MARGIN
+                    and self._page_end < self.buffer.line_count())
+        if near_top or near_end:
+            # Keep the same line of the file at the top of the view
+            self.render(visible - PAGE_LINES // 2)
+            self.widget.yview(visible - self.top)
+            return
+
+        total = self.buffer.line_count()
+        self.widget.vbar.set((self.top - 1 + first * PAGE_LINES) / total,
+                             (self.top - 1 + last * PAGE_LINES) / total)
+
+    def _on_scrollbar(self, *args):
+        """Scrolls the file when the user drags or clicks the scrollbar."""
+
+        if args[0] == "moveto":
+            line = int(float(args[1]) * self.buffer.line_count()) + 1
+            self.render(line - PAGE_LINES // 2)
+            self.widget.yview(line - self.top)
+        else:
+            self.widget.yview(*args)
+
+    def check_cursor(self):
+        """Loads a new page when the cursor is moved near its edge. Called
+        after every key released in the widget."""
+
+        row, column = self.widget.index("insert").split(".")
+        line = int(row) + self.top - 1
+        margin = int(PAGE_MARGIN * PAGE_LINES)
+        near_top = line < self.top + margin and self.top > 1
+        near_end = (line >= self._page_end - margin
+                    and self._page_end < self.buffer.line_count())
+        if near_top or near_end:
+            self.render(line - PAGE_LINES // 2)
+            self.widget.mark_set("insert", "%d.%s" % (line - self.top + 1,
+                                                      column))
+            self.widget.see("insert")
+
+    def _poll_index(self):
+        """Refreshes the scrollbar until the file is fully indexed."""
+
+        if (not self.buffer.done and not self._detached
+                and self.widget.winfo_exists()):
+            self.yscroll(*self.widget.yview())
+            self.widget.after(INDEX_POLL, self._poll_index)
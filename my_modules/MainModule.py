@@ -4,99 +4,669 @@ Note, the capitalization of the class defintion and title of this program are
 based on a play off of "gVIM".
 """
 
+import os
+
 # Import Tkinter objects (GIU package)
 import tkinter as tk
 import tkinter.scrolledtext as scroll 
-from tkinter import messagebox
-from tkinter import filedialog 
 from tkinter import *
+# messagebox and filedialog are only imported once a dialog is opened, so
+# they cost nothing at startup
 
 # Import our modules
 from my_modules.ParseCommands import * # Provides main functionality of our program
 from my_modules.StringConstants import * # Defines string constants 
+from my_modules.TextBuffer import * # Holds the text of each tVIM window
+from my_modules.BufferView import * # Shows a TextBuffer in scroll_window
+from my_modules.LargeFile import * # Pages huge files into scroll_window
+from my_modules.SearchEngine import * # Finds the matches of ?pattern
+from my_modules.HighlightManager import * # Highlights only what is in view
+from my_modules.SaveFile import * # Saves files on a worker thread
+from my_modules.UndoTree import * # Records edits for 'u' and Ctrl-R
+from my_modules.SwapFile import * # Logs edits for crash recovery
+from my_modules.Session import * # Shares one Tk root between windows
+from my_modules.Gutter import * # Draws the line numbers and status line
+from my_modules.Filter import * # Pipes lines through ':%!cmd'
+from my_modules.Follow import * # Follows growing files for ':follow'
+from my_modules.FrameScheduler import * # Redraws once per frame
+from my_modules.Headless import * # Replays macros without the widgets
+
+
+# The session of every tVIM window of this process, made by tk_session()
+SESSION = None
+
+# The size of a window, without and with the quickfix list shown
+WINDOW_SIZE = "840x480" # widthxheight
+QUICKFIX_WINDOW_SIZE = "840x620"
 
 
 class tVIM():
     """The tVIM class defines a window in which the text editting is done. 
-    Essentially, each instance of tVIM is an instance of the program itself.
+    Every window is a Toplevel of the Tk root of one shared Session, so a new
+    window costs no more than its widgets.
     
     Instance vars
     -------------
-    root: The Tkinter instance (the text editting window)
+    session: The Session this window and its documents belong to.
+    root: The Toplevel of this window (the text editting window)
+    document: The Document of the session shown in this window.
+    buffer: The TextBuffer holding the text of document. It is the source
+            of truth for the document, scroll_window only renders it.
+            For a large file, it is the read-only LargeFile instead.
+    view: The BufferView that keeps scroll_window in step with buffer, or
+          the PagedView that shows the pages of a LargeFile.
     scroll_window: The main Tkinter Text object in which the user writes in.
                    The user can scroll in this text box.
     cmd_line: The Tkinter Text object in which the user calls commands in.
+    key_parser: The KeyParser that turns keys typed in cmd_line into commands.
+    registers: A dict from register name to a (text, linewise) pair, filled
+               by the 'd', 'y' and 'c' operators and pasted by 'p' and 'P'.
+               It is shared by every window of the session.
+    undo_tree: The UndoTree recording the edits of buffer.
+    search_engine: The SearchEngine holding the matches of the last search.
+    incremental_search: The IncrementalSearch run while '?pattern' is typed.
+    scheduler: The FrameScheduler running the redraws that follow keys,
+               once per frame.
+    highlights: The HighlightManager that tags the visible highlights.
+    gutter: The Gutter drawing the line numbers left of scroll_window.
+    status_line: The StatusLine below scroll_window, showing the file, its
+                 number of lines and the line and column of the cursor.
+    quickfix_list: The Tkinter Listbox below cmd_line showing the hits of
+                   ':vimgrep', shown while grepping or after ':copen'.
+    filter_job: The FilterJob of the ':%!cmd' running, or None.
+    filter_apply: The FilterApply putting the output of the last filter in
+                  the buffer, or None.
+    load_job: The LoadJob reading a compressed file for this window, or
+              None.
+    follower: The Follower appending what is written to document's file,
+              or None.
+    
+    filename: The path of document's file, or None.
     
     font: The font of chars in scroll_window.
     font_size: The size of chars in scroll_window.
     font_type: Specifies whether chars in scroll_window are bold/italic.
     """
     
-    def __init__(self, contents=None):
-        """Initializes a tVIM instance using the inputted parameter, if any.
+    def __init__(self, contents=None, large_file=None, filename=None):
+        """Initializes a tVIM instance using the inputted parameters, if any.
         
         Parameters
         ----------
         self: tVIM instance.
         contents: a str that fills the tVIM window, defaults to None.
+        large_file: a LargeFile shown page by page instead of contents,
+                    defaults to None.
+        filename: a str, the path of the file to edit, read from disk
+                  unless contents is given, defaults to None.
         """
         
+        self.session = tk_session()
+        self.document = None
+        self.view = None
+        self.filename = None
+        self.filter_job = None
+        self.filter_apply = None
+        self.load_job = None
+        self.follower = None
+        
         # Initializes the default font, font size, and font type
         self.font = "Courier"
         self.font_size = 10
         self.font_type = ""
         
         # Sets up the main window and adjusts its size
-        self.root = tk.Tk(className="tVIM")
+        self.root = tk.Toplevel(self.session.root)
+        self.root.title("tVIM")
         self.root.resizable(False, False)
-        self.root.geometry("780x460") # widthxheight
-        # The main window has 1 column and 2 rows, 
-        # the upper row for scroll_window and bottom for cmd_line
+        self.root.geometry(WINDOW_SIZE)
+        # The main window has 2 columns and 4 rows: the gutter and
+        # scroll_window, then the status line, cmd_line and the quickfix list
         self.root.rowconfigure(2)
         self.root.columnconfigure(1)  
+        self.root.bind("<Destroy>", self.root_destroyed)
+        self.scheduler = FrameScheduler(self.root)
 
         # Sets up scroll_window
         self.scroll_window = scroll.ScrolledText(self.root, width=95, height=23)
         self.scroll_window.bind("<Key>", self.scroll_window_events)
-        self.scroll_window.grid(sticky=W)
+        self.scroll_window.bind("<KeyRelease>", 
+                                lambda event: self.view.check_cursor())
+        self.scroll_window.bind("<KeyRelease>", 
+                                lambda event: self.status_line.schedule(),
+                                add="+")
+        self.scroll_window.bind("<ButtonRelease-1>", 
+                                lambda event: self.status_line.schedule())
+        self.scroll_window.grid(row=0, column=1, sticky=W)
         self.scroll_window.config(font=(self.font, self.font_size, self.font_type))
-        # Sets up highlighting in the scroll_window
+        # Sets up highlighting in the scroll_window, syntax colors first so
+        # the search highlights are drawn over them
+        for kind, color in SYNTAX_COLORS.items():
+            self.scroll_window.tag_configure("syntax_" + kind, foreground=color)
         self.scroll_window.tag_configure("highlight", background="yellow")
         self.scroll_window.tag_configure("search", background="blue")
 
-        # Insert the contents str param into scroll_window
-        if contents != None:
-            self.scroll_window.insert('1.0', contents)   
+        # Keys typed in cmd_line are parsed one at a time
+        self.key_parser = KeyParser(NORMAL_COMMANDS, MOTIONS, OPERATORS)
+        self.registers = self.session.registers
+        
+        # Searches are compiled once and their matches kept for 'n' and 'N'
+        self.search_engine = SearchEngine()
+        self.incremental_search = IncrementalSearch(self)
+        # Highlights are only tagged on the lines in view
+        self.highlights = HighlightManager(self)
+        # The line numbers and status line are redrawn with the highlights
+        self.gutter = Gutter(self)
+        self.gutter.canvas.grid(row=0, column=0, sticky=NS)
+        self.status_line = StatusLine(self)
+        self.status_line.label.grid(row=1, column=0, columnspan=2, sticky=EW)
+        self.highlights.listeners.append(self.gutter.refresh)
+        self.highlights.listeners.append(self.status_line.refresh)
+        
+        # Load the document into the buffer and render it, large files
+        # only have the lines around the viewport loaded
+        self.switch_to(self.session.open(filename, contents, large_file))
         
         # Set up the frame to maintain the size of cmd_line
         cmd_frame = tk.Frame(self.root, width=50, height=3)
-        cmd_frame.grid(row=1, column=0, sticky=S)
+        cmd_frame.grid(row=2, column=0, columnspan=2, sticky=S)
         # Set up cmd_line
         self.cmd_line = Text(cmd_frame, width=50, height=1)
         self.cmd_line.bind("<Key>", self.cmd_line_events)
+        self.cmd_line.bind("<KeyRelease>", 
+                           lambda event: self.status_line.schedule())
         self.cmd_line.grid(sticky=S)
+        
+        # Set up the quickfix list, it is only gridded while it is shown
+        self.quickfix_list = Listbox(self.root, width=110, height=8,
+                                     font=("Courier", 9))
+        self.quickfix_list.bind("<Double-Button-1>", self.quickfix_clicked)
+        self.quickfix_list.bind("<Return>", self.quickfix_clicked)
 
         # Creates the menu at the top of tVIM's window
         create_menu(self)
 
-        # Runs the program loop
-        self.root.mainloop()
+        # Runs the program loop, unless another window already runs it
+        self.session.windows.append(self)
+        self.session.run()
+        
+    def switch_to(self, document):
+        """Shows another document of the session in this window, reusing
+        its widgets.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        document: a Document of the session.
+        """
+        
+        if document is self.document:
+            return
+        self.stop_following()
+        # The output of a filter goes in the buffer it was made from
+        if self.filter_apply != None:
+            self.filter_apply.finish()
+        # Only the document asked for last is shown
+        if self.load_job != None:
+            self.load_job.cancel()
+            self.load_job = None
+        # A compressed file is decompressed on a worker thread. Meanwhile
+        # the window keeps its document, or shows an empty read-only one
+        loading = (not document.loaded()
+                   and sniff_compression(document.filename) != None)
+        if loading:
+            self.load_job = LoadJob(document.filename)
+            self.poll_load(self.load_job, document)
+            if self.document != None:
+                return
+            document = Document(0, buffer=TextBuffer())
+        document.load()
+        
+        # Remember where the cursor was in the document being left
+        if self.document != None:
+            self.document.cursor = self.view.cursor()
+            self.view.detach()
+        self.highlights.clear("highlight")
+        self.highlights.clear("search")
+        self.session.show(self, document)
+        self.highlights.watch(self.buffer)
+        
+        # Unsaved work left by a crash is offered back before rendering
+        if (document.swap == None and hasattr(self.buffer, "listeners")
+                and not loading):
+            document.swap = open_swap(document)
+        if hasattr(self.buffer, "map"):
+            self.view = PagedView(self.scroll_window, self.buffer)
+        else:
+            self.view = BufferView(self.scroll_window, self.buffer)
+        if loading:
+            self.view.read_only = True
+        self.view.set_cursor(document.cursor)
+        
+    def message(self, text):
+        """Shows a message to the user, like the output of ':ls'.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        text: a str, the message.
+        """
+        
+        from tkinter import messagebox
+        
+        messagebox.showinfo(title="tVIM", message=text, parent=self.root)
         
-    def save_file(self, filename):
-        """Saves this file as a specified filename.
+    def save_file(self, filename, on_done=None):
+        """Saves this file as a specified filename. The file is written on a
+        worker thread while the title bar shows the progress.
         
         Parameters
         ----------
         self: tVIM instance.
         filename: a str that is the name of the file.
+        on_done: a function called once the file is saved, defaults to None.
+        """
+        
+        # Write a snapshot of the buffer, later edits do not affect it
+        job = SaveJob(self.buffer, filename, self.document.format,
+                      self.document)
+        self.filename = job.filename
+        self.poll_save(job, on_done)
+        
+    def find_file(self, query):
+        """Opens the file under the current folder whose path best matches
+        a query. The search runs on a worker thread.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        query: a str, the chars to find in order in the path.
+        """
+        
+        index = self.session.file_index(os.getcwd())
+        self.poll_find(FindJob(index, query))
+        
+    def poll_find(self, job):
+        """Waits for a search to finish, then opens the best match.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        job: the FindJob searching the index.
+        """
+        
+        if not job.done:
+            self.root.title("tVIM - finding '%s'" % job.query)
+            self.root.after(FIND_POLL, self.poll_find, job)
+            return
+        
+        self.root.title("tVIM")
+        if not job.results:
+            error_popup(NO_MATCH_ERROR)
+            return
+        try:
+            self.switch_to(self.session.open(job.results[0]))
+        except (OSError, UnicodeDecodeError) as error:
+            error_popup(OPEN_ERROR + "\n" + str(error))
+        
+    def grep(self, pattern, files, jump=True):
+        """Searches files for a pattern in the worker processes, showing the
+        hits in the quickfix list as they come in.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        pattern: a str, a pattern as typed after '?'.
+        files: a list of strs, the paths of the files.
+        jump: a bool, whether to jump to the first hit once it is found,
+              defaults to True.
+        """
+        
+        job = GrepJob(pattern, files)
+        self.session.quickfix.start(job)
+        self.show_quickfix(True)
+        self.poll_grep(job, jump)
+        
+    def poll_grep(self, job, jump):
+        """Adds the hits found since the last poll to the quickfix list
+        until the search is finished.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        job: the GrepJob searching the files.
+        jump: a bool, whether to jump to the first hit once it is found.
+        """
+        
+        quickfix = self.session.quickfix
+        # A later ':vimgrep' took over the quickfix list
+        if job is not quickfix.job:
+            return
+        
+        # Checked first, so the last hits are added before the job is over
+        done = job.done
+        new = quickfix.update()
+        if new:
+            self.quickfix_list.insert(END, *map(format_entry, new))
+            if jump and quickfix.current < 0:
+                try:
+                    jump_to_entry(self, quickfix.move(1))
+                except CommandError as error:
+                    error_popup(str(error))
+        if not done:
+            self.root.title("tVIM - grep %d of %d files, %d hits" % (
+                job.searched, len(job.files), len(quickfix.entries)))
+            self.root.after(GREP_POLL, self.poll_grep, job, jump)
+            return
+        
+        self.root.title("tVIM")
+        if job.error != None:
+            error_popup(GREP_ERROR + "\n" + str(job.error))
+        elif not quickfix.entries:
+            error_popup(NO_GREP_MATCH)
+        
+    def filter(self, start, end, command):
+        """Pipes a range of the buffer through a shell command on worker
+        threads, and replaces the range with what it prints once it exits.
+        The title bar shows the progress, and Ctrl-C in cmd_line stops it.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        start: an int, the offset of the first char of the range.
+        end: an int, the offset after the last char of the range.
+        command: a str, the shell command.
+        """
+        
+        if self.filter_job != None:
+            raise CommandError(FILTER_RUNNING_ERROR)
+        self.filter_job = FilterJob(self.buffer, start, end, command)
+        self.poll_filter(self.filter_job)
+        
+    def poll_load(self, job, document):
+        """Shows the progress of a compressed file being read, then shows
+        its document.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        job: the LoadJob reading the file.
+        document: the Document of the file.
+        """
+        
+        # Another document was asked for since
+        if job is not self.load_job:
+            return
+        if not job.done:
+            self.root.title("tVIM - reading %s %d%%" % (
+                os.path.basename(job.filename), job.progress() * 100))
+            self.root.after(LOAD_POLL, self.poll_load, job, document)
+            return
+        
+        self.root.title("tVIM")
+        self.load_job = None
+        if job.error != None:
+            error_popup(OPEN_ERROR + "\n" + str(job.error))
+            return
+        document.load(job.result)
+        self.switch_to(document)
+        
+    def follow(self, lines):
+        """Appends what is written to the file of the document as it grows,
+        once per frame.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        lines: an int, the most lines to keep, or None to keep them all.
+        
+        Raises
+        ------
+        OSError if the file can not be found.
+        """
+        
+        self.stop_following()
+        self.follower = Follower(self.filename, follow_offset(self.document),
+                                 self.document.format, lines)
+        self.poll_follow(self.follower)
+        self.status_line.schedule()
+        
+    def stop_following(self):
+        """Stops following the file of the document, if it is followed."""
+        
+        if self.follower != None:
+            self.follower.stop()
+            # Following again goes on from here
+            self.document.followed = (self.buffer.version,
+                                      self.follower.taken_offset())
+            self.follower = None
+            self.status_line.schedule()
+        
+    def poll_follow(self, follower):
+        """Appends what the Follower read since the last frame, until it
+        is stopped.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        follower: the Follower of the file.
+        """
+        
+        # Stopped since, or following another file
+        if follower is not self.follower:
+            return
+        text = follower.take()
+        if text:
+            apply_follow(self, text)
+        if follower.error != None:
+            self.stop_following()
+            error_popup(FOLLOW_ERROR + "\n" + str(follower.error))
+            return
+        self.root.after(FOLLOW_FRAME, self.poll_follow, follower)
+        
+    def poll_filter(self, job):
+        """Shows the progress of a filter until the command has exited,
+        then starts putting its output in the buffer.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        job: the FilterJob running the command.
+        """
+        
+        if not job.done:
+            self.root.title("tVIM - filtering through '%s', %d%% sent "
+                            "(Ctrl-C stops it)" % (job.command,
+                                                   job.progress() * 100))
+            self.root.after(FILTER_POLL, self.poll_filter, job)
+            return
+        
+        self.root.title("tVIM")
+        self.filter_job = None
+        try:
+            applying = apply_filter(self, job)
+        except CommandError as error:
+            error_popup(str(error))
+            return
+        if applying != None:
+            applying.start()
+            self.poll_apply(applying)
+        
+    def poll_apply(self, applying):
+        """Shows the progress of the output of a filter being put in the
+        buffer, until it is all in.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        applying: the FilterApply putting the output in the buffer.
+        """
+        
+        # Finished or cancelled since
+        if applying is not self.filter_apply:
+            self.root.title("tVIM")
+            return
+        self.root.title("tVIM - putting in the output of '%s' %d%%" % (
+            applying.job.command, applying.progress() * 100))
+        self.root.after(FILTER_POLL, self.poll_apply, applying)
+        
+    def replay(self, keys):
+        """Replays the keys of a macro straight into the buffer. The view
+        is swapped for a HeadlessView while they run, so no key updates
+        the widgets, and the buffer is rendered once at the end.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        keys: a str, the chars of the keys.
+        """
+        
+        view, highlights = self.view, self.highlights
+        self.view = HeadlessView(self.buffer)
+        self.view.set_cursor(view.cursor())
+        self.highlights = HeadlessHighlights()
+        view.detach()
+        try:
+            KeyPlayer(self).keys(keys)
+        finally:
+            model, replayed = self.view, self.highlights
+            self.highlights = highlights
+            highlights.watch(self.buffer)
+            # A ':e' in the macro made a view of its own already
+            if model.__class__ is HeadlessView:
+                self.view = view.__class__(self.scroll_window, self.buffer)
+                self.view.set_cursor(model.cursor())
+            for tag in ("highlight", "search"):
+                if tag in replayed.ranges:
+                    starts, ends = replayed.ranges[tag]
+                    highlights.set_ranges(tag, starts, ends,
+                                          replayed.regexes[tag])
+                else:
+                    highlights.clear(tag)
+            if model.__class__ is HeadlessView and model.insert_mode:
+                insert_mode(self)
+        
+    def show_quickfix(self, shown):
+        """Shows or hides the quickfix list below cmd_line.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        shown: a bool, True to show the list and False to hide it.
         """
         
-        # Get the contents currently in this window
-        contents = self.scroll_window.get('1.0', END)
+        if not shown:
+            self.quickfix_list.grid_remove()
+            self.root.geometry(WINDOW_SIZE)
+            return
+        
+        entries = self.session.quickfix.entries
+        self.quickfix_list.delete(0, END)
+        if entries:
+            self.quickfix_list.insert(END, *map(format_entry, entries))
+        self.quickfix_list.grid(row=3, column=0, columnspan=2, sticky=W)
+        self.root.geometry(QUICKFIX_WINDOW_SIZE)
         
-        # Write the contents into the file with filename
-        filename.write(contents)
-        filename.close()
+    def quickfix_clicked(self, event):
+        """Jumps to the hit picked in the quickfix list.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        event: A double click or return key event.
+        """
+        
+        selection = self.quickfix_list.curselection()
+        if not selection:
+            return
+        quickfix = self.session.quickfix
+        quickfix.current = selection[0]
+        try:
+            jump_to_entry(self, quickfix.entries[selection[0]])
+        except CommandError as error:
+            error_popup(str(error))
+        
+    def save_as(self, on_done=None):
+        """Asks for a file name, then saves this file under it.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        on_done: a function called once the file is saved, or at once if no
+                 name is given, defaults to None.
+        """
+        
+        save_button(self, on_done)
+        
+    def close(self):
+        """Closes this tVIM window."""
+        
+        # Remembered for the next time the document is shown or opened
+        self.document.cursor = self.view.cursor()
+        self.root.destroy()
+        
+    def confirm_quit(self):
+        """Closes this tVIM window if the user agrees to."""
+        
+        exit_button(self)
+        
+    def poll_save(self, job, on_done):
+        """Shows the progress of a save until it is finished.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        job: the SaveJob writing the file.
+        on_done: a function called once the file is saved, or None.
+        """
+        
+        if not job.done:
+            self.root.title("tVIM - saving %d%%" % (job.progress() * 100))
+            self.root.after(SAVE_POLL, self.poll_save, job, on_done)
+            return
+        
+        self.root.title("tVIM")
+        if job.error != None:
+            error_popup(SAVE_ERROR + "\n" + str(job.error))
+            return
+        # The document saved, even if another one is shown by now, holds
+        # the changes logged so far on disk
+        document = job.document
+        document.saved(job.filename, job.version)
+        if document is self.document:
+            self.filename = document.filename
+        if on_done != None:
+            on_done()
+        
+    def root_destroyed(self, event):
+        """Releases the document of a closed window. Closing the last window
+        unloads every document, deleting their swap files, and ends the
+        session.
+        
+        Parameters
+        ----------
+        self: tVIM instance.
+        event: A destroy event, of root or of one of its widgets.
+        """
+        
+        if event.widget is not self.root:
+            return
+        
+        self.highlights.watch(None)
+        if self.filter_job != None:
+            self.filter_job.cancel()
+        if self.filter_apply != None:
+            self.filter_apply.cancel()
+            self.filter_apply = None
+        if self.load_job != None:
+            self.load_job.cancel()
+            self.load_job = None
+        self.stop_following()
+        # Nothing is left to redraw
+        self.scheduler.clear()
+        self.session.window_closed(self)
+        if not self.session.windows:
+            end_session()
         
     def scroll_window_events(tVIM, event):
         """Takes in all keyboard events while inside scroll_window.
@@ -107,6 +677,10 @@ class tVIM():
         event: A keyboard event.
         """
     
+        # Keys typed in insert mode are recorded by 'q' too
+        if event.char and tVIM.key_parser.recording != None:
+            tVIM.key_parser.recorded.append(event.char)
+        
         # Move cursor to cmd_line if esc 
         if event.char == '\x1b':
             tVIM.cmd_line.focus()
@@ -120,8 +694,8 @@ class tVIM():
         event: A keyboard event.
         """
     
-        # Move cursor back to scroll_window if enter
-        parse_command(tVIM, event)
+        # Run the keys as commands, keeping them out of cmd_line
+        return parse_command(tVIM, event)
 
 
 
@@ -134,7 +708,10 @@ following site: https://knowpapa.com/text-editor/
 
 
 def create_menu(tVIM):
-    """Builds the GUI for the menu bar at the top of the tVIM window.
+    """Builds the GUI for the menu bar at the top of the tVIM window. Only
+    the names of the dropdown menus are added here, each one is filled the
+    first time it is opened, so a new window does not wait on menus that
+    are never used.
         
     Parameter
     ---------
@@ -145,23 +722,54 @@ def create_menu(tVIM):
     menu = Menu(tVIM.root)
     tVIM.root.config(menu=menu)
     
-    # Creates the 'File' dropdown menu
-    file_menu = Menu(menu)
-    menu.add_cascade(label="File", menu=file_menu) 
+    lazy_menu(menu, "File", lambda file_menu: fill_file_menu(tVIM, file_menu))
+    lazy_menu(menu, "Help", fill_help_menu)
+    lazy_menu(menu, "Themes", 
+              lambda themes_menu: fill_themes_menu(tVIM, themes_menu))
+    lazy_menu(menu, "Fonts", 
+              lambda fonts_menu: fill_fonts_menu(tVIM, fonts_menu))
+
+
+def lazy_menu(menu, label, fill):
+    """Adds a dropdown menu to the menu bar, filled just before it is first
+    shown.
+    
+    Parameters
+    ----------
+    menu: the Tkinter Menu of the menu bar.
+    label: a str, the name of the dropdown menu.
+    fill: a function(dropdown) that adds the entries of the dropdown menu.
+    """
+    
+    dropdown = Menu(menu)
+    
+    def fill_once():
+        dropdown.config(postcommand="")
+        fill(dropdown)
+    
+    dropdown.config(postcommand=fill_once)
+    menu.add_cascade(label=label, menu=dropdown)
+
+
+def fill_file_menu(tVIM, file_menu):
+    """Adds the entries of the 'File' dropdown menu."""
+    
     file_menu.add_command(label="New Window", command=lambda: tVIM())
     file_menu.add_command(label="Open", command=open_button)
     file_menu.add_command(label="Save", command=lambda: save_button(tVIM))
     file_menu.add_command(label="Exit", command=lambda: exit_button(tVIM))
 
-    # Creates the 'Help' dropdown menu
-    help_menu = Menu(menu)
-    menu.add_cascade(label="Help", menu=help_menu)
+
+def fill_help_menu(help_menu):
+    """Adds the entries of the 'Help' dropdown menu."""
+    
     help_menu.add_command(label="About", command=about_button)
     help_menu.add_command(label="Commands", command=command_button)
+
+
+def fill_themes_menu(tVIM, themes_menu):
+    """Adds the entries of the 'Themes' dropdown menu."""
     
-    # Creates the 'Themes' dropdown menu
-    themes_menu = Menu(menu)
-    menu.add_cascade(label="Themes", menu=themes_menu)
     themes_menu.add_command(label="Normal", command=lambda: normal_button(tVIM))
     themes_menu.add_command(label="Dark Mode", command=lambda: dark_button(tVIM))
     themes_menu.add_command(label="Gray", command=lambda: gray_button(tVIM))
@@ -170,10 +778,11 @@ def create_menu(tVIM):
     themes_menu.add_command(label="Beach", command=lambda: beach_button(tVIM))
     themes_menu.add_command(label="UCSD", command=lambda: UCSD_button(tVIM))
     themes_menu.add_command(label="McDonald's", command=lambda: mcdonalds_button(tVIM))
+
+
+def fill_fonts_menu(tVIM, fonts_menu):
+    """Adds the entries of the 'Fonts' dropdown menu."""
     
-    # Creates the 'Fonts' dropdown menu
-    fonts_menu = Menu(menu)
-    menu.add_cascade(label="Fonts", menu=fonts_menu)
     fonts_menu.add_command(label="Courier", command=lambda: courier_button(tVIM))
     fonts_menu.add_command(label="Times", command=lambda: times_button(tVIM))
     fonts_menu.add_command(label="Helvetica", command=lambda: helv_button(tVIM))
@@ -189,31 +798,162 @@ def create_menu(tVIM):
 # The functions below provide functionality to menu items under 'File' and 'Help'
 
 
+def tk_session():
+    """Returns the Session that every tVIM window of this process shares,
+    starting it with a hidden Tk root if there is none."""
+    
+    global SESSION
+    if SESSION == None:
+        root = tk.Tk(className="tVIM")
+        root.withdraw()
+        SESSION = Session(root)
+    
+    return SESSION
+
+
+def end_session():
+    """Ends the session once its last window is closed, which stops the
+    mainloop run by the first tVIM window."""
+    
+    global SESSION
+    if SESSION != None:
+        if SESSION.server != None:
+            SESSION.server.close()
+            SESSION.server = None
+        SESSION.root.destroy()
+        SESSION = None
+
+
+def start_editor(files, servername):
+    """Opens a tVIM window on files, as launched from the command line. The
+    session also listens for the files of later '--remote' launches,
+    unless another tVIM already does under that name.
+    
+    Parameters
+    ----------
+    files: a list of strs, the paths of the files. They are all added to
+           the session, and the first one is shown.
+    servername: a str, the name to listen under.
+    """
+    
+    # Only a launch from the command line pays for the socket
+    from my_modules.Remote import RemoteServer, REMOTE_POLL, remote_available
+    
+    session = tk_session()
+    if remote_available():
+        try:
+            session.server = RemoteServer(servername)
+            session.root.after(REMOTE_POLL, poll_remote, session, REMOTE_POLL)
+        except OSError:
+            # Another tVIM is the server already
+            session.server = None
+    
+    for filename in files:
+        session.open(filename)
+    tVIM(filename=files[0] if files else None)
+
+
+def poll_remote(session, interval):
+    """Shows the files sent by '--remote' launches in the last window
+    used, checking for them every interval ms while the session lasts.
+    
+    Parameters
+    ----------
+    session: the Session listening for the files.
+    interval: an int, the time between two checks in ms.
+    """
+    
+    if session.server == None:
+        return
+    
+    for files in session.server.pending():
+        if not session.windows:
+            break
+        window = session.windows[-1]
+        documents = [session.open(filename) for filename in files]
+        if not documents:
+            continue
+        try:
+            window.switch_to(documents[0])
+        except (OSError, UnicodeDecodeError) as error:
+            error_popup(OPEN_ERROR + "\n" + str(error))
+            continue
+        # Bring the window to the front, like Vim does
+        window.root.deiconify()
+        window.root.lift()
+        window.root.focus_force()
+    
+    session.root.after(interval, poll_remote, session, interval)
+
+
+def open_swap(document):
+    """Offers to recover the swap file left behind for a document's file,
+    then starts a new swap file for it.
+        
+    Parameter
+    ---------
+    document: a loaded Document, not shown in any view yet.
+    
+    Returns
+    -------
+    The SwapFile logging the edits of the buffer, or None if none could be
+    created.
+    """
+    
+    filename = document.filename
+    recovered = False
+    for path in orphaned_swaps(filename)[:1]:
+        question = RECOVER_QUESTION
+        header = read_header(path)
+        if filename != None and (
+                not os.path.exists(filename)
+                or header.get("mtime") != os.stat(filename).st_mtime_ns):
+            question += RECOVER_CHANGED_WARNING
+        from tkinter import messagebox
+        if messagebox.askyesno("Recover", question):
+            recovered = recover_swap(path, document.buffer) > 0
+        os.remove(path)
+    
+    path = free_swap_name(filename)
+    if path == None:
+        return None
+    try:
+        return SwapFile(document.buffer, path, filename, recovered)
+    except OSError:
+        return None
+
+
 def open_button():
     """Opens a file that the user specifies into a new tVIM instance."""
     
+    from tkinter import filedialog
+    
     filename = filedialog.askopenfilename()
 
-    if filename != None:
-        file = open(filename, "rt")
-        contents = file.read()
-        # Load the contents from the chosen file into a new window
-        tVIM(contents)
-        file.close()
+    # The session reads the file, huge files are memory-mapped and shown
+    # a page at a time
+    if filename:
+        tVIM(filename=filename)
         
         
-def save_button(tVIM):
+def save_button(tVIM, on_done=None):
     """Saves the text inside of this tVIM's scroll_window into a specified filename.
         
     Parameter
     ---------
     tVIM: tVIM instance.
+    on_done: a function called once the file is saved, defaults to None.
     """
     
-    filename = filedialog.asksaveasfile(mode='w', defaultextension=".txt")
+    from tkinter import filedialog
+    
+    # Only ask for the name, the file is written later by a SaveJob
+    filename = filedialog.asksaveasfilename(defaultextension=".txt")
     
-    if filename != None:
-        tVIM.save_file(filename)
+    if filename:
+        tVIM.save_file(filename, on_done)
+    elif on_done != None:
+        on_done()
         
         
 def exit_button(tVIM):
@@ -224,19 +964,25 @@ def exit_button(tVIM):
     tVIM: tVIM instance.
     """
     
+    from tkinter import messagebox
+    
     if messagebox.askyesno("Quit", QUIT_QUESTION):
-        tVIM.root.destroy()
+        tVIM.close()
 
         
 def about_button():
     """Opens the 'About' information popup."""
     
+    from tkinter import messagebox
+    
     about = messagebox.showinfo(title="About", message=ABOUT_MESSAGE)
     
     
 def command_button():
     """Opens the 'Commands' information popup."""
     
+    from tkinter import messagebox
+    
     commands = messagebox.showinfo(title="Commands", message=COMMANDS_MESSAGE)
 
 
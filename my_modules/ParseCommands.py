@@ -1,125 +1,1059 @@
 """The code below enables events in response to key presses."""
 
-# Import Tkinter objects (GIU package)
-import tkinter as tk
-import tkinter.scrolledtext as scroll 
-from tkinter import messagebox
-from tkinter import filedialog 
-from tkinter import *
-
-# Import our modules
-from my_modules.MainModule import * # Provides main functionality of our program
+import os
+import re
+
+# Import the Tkinter constants, the dialogs are imported on first use
+from tkinter import END, INSERT
+
+# Import our modules, but not MainModule: it imports this module, and the
+# commands only ever use the tVIM they are given
 from my_modules.StringConstants import * # Defines string constants 
+from my_modules.KeyParser import * # Turns typed keys into commands
+from my_modules.ExCommands import * # Registry of ':' commands
+from my_modules.Grep import * # Searches many files for ':vimgrep'
+from my_modules.Profiler import * # Times the hot paths for ':profile'
+from my_modules.Filter import * # Pipes lines through ':%!cmd'
+
+# Finds the words that the 'w' and 'b' motions move between
+WORD_RE = re.compile(r'\w+|[^\w\s]+')
+
+# The registers 'q' records keys into and '@' replays
+MACRO_REGISTERS = "abcdefghijklmnopqrstuvwxyz"
+
+# Splits ':a,b!command' (or ':%!command') into its range and its command,
+# where a line is a number, '.' for the cursor's line or '$' for the last
+FILTER_RE = re.compile(r'\s*(%|([.$]|\d+)\s*(?:,\s*([.$]|\d+))?)\s*!(.*)',
+                       re.DOTALL)
+
+
+class CommandError(Exception):
+    """Raised by a command that can not run. Its message is one of the
+    errors in StringConstants, shown in a popup by the window."""
   
     
+@span("key")
 def parse_command(tVIM, event):
-    """Parses commands entered inside of cmd_line and checks whether
-    they are valid. Provides the functionality for all commands.
+    """Parses the keys typed inside of cmd_line. Keys typed in command mode
+    go to tVIM's KeyParser one at a time, while '?pattern' and ':command'
+    lines are typed into cmd_line and run after enter.
         
     Parameters
     ----------
     tVIM: tVIM instance.
     event: A keyboard event.
+    
+    Returns
+    -------
+    "break" for keys that were handled, so Tkinter does not insert them.
     """
     
-    # Get the str inside cmd_line
-    command = tVIM.cmd_line.get('1.0', END)
-    # Strip all new line chars from cmd_line.get()
-    command = command.replace('\n', '')
-        
-    # 'o' command - Insert new line below and enter insert
-    if command == "o":
-        # The line below removes all previous highlighting
-        tVIM.scroll_window.tag_remove("highlight", '1.0', END)
-        # Moves the cursor to end of this line and inserts a newline char
-        tVIM.scroll_window.mark_set(INSERT, INSERT + " lineend")
-        tVIM.scroll_window.insert(INSERT, '\n')
-        insert_mode(tVIM)
+    key = event.char
+    parser = tVIM.key_parser
+    
+    # Keys like Shift or the arrows have no char, leave them to Tkinter
+    if not key:
+        return None
+    
+    # While recording, 'q' stops and every other key is recorded
+    if parser.recording != None:
+        if key == "q" and not parser.pending and not parser.line_mode:
+            stop_recording(tVIM)
+            clear_cmd_line(tVIM)
+            return "break"
+        parser.recorded.append(key)
+    
+    # Esc cancels whatever was being typed
+    if key == '\x1b':
+        parser.reset()
+        parser.line_mode = False
+        tVIM.incremental_search.cancel()
         clear_cmd_line(tVIM)
+        return "break"
+    
+    # Ctrl-C stops the ':%!cmd' filter running, if any
+    if key == '\x03' and tVIM.filter_job != None:
+        tVIM.filter_job.cancel()
+        return "break"
+    
+    # '?' and ':' start a line that is typed into cmd_line
+    if parser.line_mode:
+        return parse_line(tVIM, event)
+    if key in "?:" and not parser.pending:
+        parser.line_mode = True
+        return None
+    
+    # Enter on its own does nothing in command mode
+    if key == '\r' and not parser.pending:
+        return "break"
+    
+    # Every other key is one step of the key parser
+    action = parser.feed(key)
+    clear_cmd_line(tVIM)
+    if action == None:
+        # Show the keys typed so far, like Vim's 'showcmd', once per frame
+        tVIM.scheduler.schedule("showcmd", show_pending, tVIM)
+    elif action == False:
+        tVIM.root.bell()
+    else:
+        try:
+            run_action(tVIM, action)
+        except CommandError as error:
+            error_popup(str(error))
         
-    # 'O' command - Insert new line above and enter insert
-    elif command == "O":
-        # The line below removes all previous highlighting
-        tVIM.scroll_window.tag_remove("highlight", '1.0', END)
-        # Moves the cursor to start of this line and inserts a newline char
-        tVIM.scroll_window.mark_set(INSERT, INSERT + " linestart")
-        tVIM.scroll_window.insert(INSERT, '\n')
-        # Moves the cursor one line above the current line
-        tVIM.scroll_window.mark_set(INSERT, INSERT + " -1line")
-        insert_mode(tVIM)
-        clear_cmd_line(tVIM)
+    return "break"
+
+
+def parse_line(tVIM, event):
+    """Handles the keys typed while a '?pattern' or ':command' line is
+    being typed into cmd_line.
         
-    # 'gg' command - Move to the beginning of file
-    elif command == "gg":
-        # The line below removes all previous highlighting
-        tVIM.scroll_window.tag_remove("highlight", '1.0', END)
-        tVIM.scroll_window.mark_set(INSERT, '1.0')
-        tVIM.scroll_window.tag_add("highlight", INSERT, INSERT + " +1c")
-        clear_cmd_line(tVIM)
-               
-    # 'G' command - Move to the end of file
-    elif command == "G":
-        # The line below removes all previous highlighting
-        tVIM.scroll_window.tag_remove("highlight", '1.0', END)
-        tVIM.scroll_window.mark_set(INSERT, END)
-        tVIM.scroll_window.tag_add("highlight", INSERT + " -1c", INSERT)
-        clear_cmd_line(tVIM)
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    event: A keyboard event.
+    """
     
-    # 'i' command - Return to insert mode at cursor
-    elif command == "i":
-        insert_mode(tVIM)
+    # After enter key is pressed, run the line
+    if event.char == '\r':
+        command = tVIM.cmd_line.get('1.0', END).replace('\n', '')
+        tVIM.key_parser.line_mode = False
         clear_cmd_line(tVIM)
         
-    # 'I' command - Return to insert mode at linestart
-    elif command == "I":
-        tVIM.scroll_window.mark_set(INSERT, INSERT + " linestart")
-        insert_mode(tVIM)
-        clear_cmd_line(tVIM)
+        try:
+            run_line(tVIM, command)
+        except CommandError as error:
+            error_popup(str(error))
         
-    # 'A' command - Return to insert mode at lineend
-    elif command == "A":
-        tVIM.scroll_window.mark_set(INSERT, INSERT + " lineend")
-        insert_mode(tVIM)
-        clear_cmd_line(tVIM)
-      
-    # '?' command - Searches for a given pattern after enter
-    elif len(command) > 1 and command[0] == "?":
-        
-        # After enter key is pressed
-        if event.char == '\r':
-            
-            # Get the pattern from command and search for it
-            pattern = command[1:]
-            search_pattern(tVIM, pattern)
-            clear_cmd_line(tVIM)
-            
-    # ':' command - Parses commands after enter pressed
+        return "break"
+    
+    # Deleting the '?' or ':' leaves the line
+    if event.char == '\x08' and tVIM.cmd_line.compare(INSERT, "<=", "1.1"):
+        tVIM.key_parser.line_mode = False
+    
+    # Search as the pattern is typed, once the keys are in cmd_line
+    tVIM.scheduler.schedule("incremental_search", incremental_search, tVIM)
+    
+    return None
+
+
+def line_name(tVIM, command):
+    """Returns the name a '?' or ':' line is profiled under, like '?' or
+    ':vimgrep'."""
+    
+    if command[:1] != ":":
+        return command[:1]
+    match = EX_COMMAND_RE.fullmatch(command[1:])
+    if match != None:
+        return ":" + match.group(1)
+    
+    return ":!" if "!" in command else ":N"
+
+
+@span(line_name)
+def run_line(tVIM, command):
+    """Runs a '?pattern' or ':command' line.
+        
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    command: a str, the line including its leading '?' or ':'.
+    """
+    
+    # '?' command - Searches for a given pattern
+    if len(command) > 1 and command[0] == "?":
+        search_pattern(tVIM, command[1:])
+    
+    # ':N' command - Moves to line N, like 'NG'
+    elif (len(command) > 1 and command[0] == ":"
+          and command[1:].strip().isdigit()):
+        # A line past the end is the last line, as in Vim
+        goto_first_line(tVIM, min(int(command[1:]), tVIM.buffer.line_count()))
+    
+    # ':%!cmd' and ':a,b!cmd' commands - Filter lines through a command
+    elif (len(command) > 1 and command[0] == ":"
+          and FILTER_RE.match(command[1:])):
+        filter_lines(tVIM, command[1:])
+    
+    # ':' command - Runs a command from the registry
     elif len(command) > 1 and command[0] == ":":
+        if not run_ex_command(tVIM, command[1:]):
+            raise CommandError(CMD_ERROR)
+
+
+def action_name(tVIM, action):
+    """Returns the name an action is profiled under, the name of its
+    command or motion, or of its operator and motion."""
+    
+    if action[0] != "operator":
+        return action[1].__name__
+    motion = action[2].__name__ if action[2] != None else "lines"
+    
+    return "%s %s" % (action[1].__name__, motion)
+
+
+@span(action_name)
+def run_action(tVIM, action):
+    """Runs an action returned by the KeyParser.
         
-        # After enter key is pressed
-        if event.char == '\r':
-            
-            # Save as and exit command
-            if command[1:] == "wq":
-                save_button(tVIM)
-                tVIM.root.destroy()
-                
-            # Exit command, prompt the user
-            elif command[1:] == "q":
-                exit_button(tVIM)
-                clear_cmd_line(tVIM)
-                
-            # Save as command
-            elif command[1:] == "w":
-                save_button(tVIM)
-                clear_cmd_line(tVIM)
-                
-            # Command not recognized error 
-            else:
-                error_popup(CMD_ERROR)
-                clear_cmd_line(tVIM)
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    action: a tuple returned by KeyParser.feed().
+    """
+    
+    view = tVIM.view
+    buffer = tVIM.buffer
+    # Each command is undone on its own
+    tVIM.undo_tree.close()
+    
+    # A command runs with its count
+    if action[0] == "command":
+        action[1](tVIM, action[2])
+    
+    # A motion on its own moves the cursor
+    elif action[0] == "motion":
+        view.set_cursor(action[1](tVIM, view.cursor(), action[2]))
+    
+    # An operator works on the text between the cursor and the motion
+    else:
+        kind, operator, motion, count, linewise = action
+        cursor = view.cursor()
+        if motion == None:
+            # A doubled operator works on count lines from the cursor
+            end = buffer.line_start(buffer.line_of(cursor) + (count or 1) - 1)
+        else:
+            end = motion(tVIM, cursor, count)
+        start, end = min(cursor, end), max(cursor, end)
+        
+        # Linewise operators work on whole lines, without the last newline
+        if linewise:
+            start = buffer.line_start(buffer.line_of(start))
+            end = buffer.line_end(buffer.line_of(end))
+        operator(tVIM, start, end, linewise)
+
+
+def check_writable(tVIM):
+    """Checks that the buffer can be edited, large files are opened read-only.
+        
+    Parameter
+    ---------
+    tVIM: tVIM instance.
+    
+    Raises
+    ------
+    CommandError if the buffer can not be edited.
+    """
+    
+    if tVIM.view.read_only:
+        raise CommandError(READ_ONLY_ERROR)
+    # A followed file only changes by growing on disk
+    if tVIM.follower != None:
+        raise CommandError(FOLLOW_EDIT_ERROR)
+    # The output of a filter is still being put in the buffer
+    if tVIM.filter_apply != None:
+        raise CommandError(FILTER_APPLYING_ERROR)
+
+
+"""The code below provides the commands that the KeyParser runs.
+
+Each command takes the tVIM instance and the count typed before it, or None.
+"""
+
+
+def open_below(tVIM, count):
+    """'o' command - Insert new line below and enter insert."""
+    
+    check_writable(tVIM)
+    # The line below removes all previous highlighting
+    tVIM.highlights.clear("highlight")
+    # Inserts a newline char at the end of this line and moves onto it
+    line = tVIM.buffer.line_of(tVIM.view.cursor())
+    end = tVIM.buffer.line_end(line)
+    tVIM.view.insert(end, '\n')
+    tVIM.view.set_cursor(end + 1)
+    insert_mode(tVIM)
+
+
+def open_above(tVIM, count):
+    """'O' command - Insert new line above and enter insert."""
+    
+    check_writable(tVIM)
+    # The line below removes all previous highlighting
+    tVIM.highlights.clear("highlight")
+    # Inserts a newline char at the start of this line and stays on
+    # the new empty line, which is now the one above
+    line = tVIM.buffer.line_of(tVIM.view.cursor())
+    start = tVIM.buffer.line_start(line)
+    tVIM.view.insert(start, '\n')
+    tVIM.view.set_cursor(start)
+    insert_mode(tVIM)
+
+
+def goto_first_line(tVIM, count):
+    """'gg' command - Move to the beginning of file, or to line count."""
+    
+    # The line below removes all previous highlighting
+    tVIM.highlights.clear("highlight")
+    start = tVIM.buffer.line_start(count or 1)
+    tVIM.view.set_cursor(start)
+    tVIM.highlights.set_ranges("highlight", [start], [start + 1])
+
+
+def goto_last_line(tVIM, count):
+    """'G' command - Move to the end of file, or to line count."""
+    
+    if count != None:
+        goto_first_line(tVIM, count)
+        return
+    # The line below removes all previous highlighting
+    tVIM.highlights.clear("highlight")
+    end = len(tVIM.buffer)
+    tVIM.view.set_cursor(end)
+    tVIM.highlights.set_ranges("highlight", [max(end - 1, 0)], [end])
+
+
+def insert_here(tVIM, count):
+    """'i' command - Return to insert mode at cursor."""
+    
+    insert_mode(tVIM)
+
+
+def insert_line_start(tVIM, count):
+    """'I' command - Return to insert mode at linestart."""
+    
+    line = tVIM.buffer.line_of(tVIM.view.cursor())
+    tVIM.view.set_cursor(tVIM.buffer.line_start(line))
+    insert_mode(tVIM)
+
+
+def append_here(tVIM, count):
+    """'a' command - Return to insert mode after the cursor."""
+    
+    tVIM.view.set_cursor(right_motion(tVIM, tVIM.view.cursor(), 1))
+    insert_mode(tVIM)
+
+
+def append_line_end(tVIM, count):
+    """'A' command - Return to insert mode at lineend."""
+    
+    line = tVIM.buffer.line_of(tVIM.view.cursor())
+    tVIM.view.set_cursor(tVIM.buffer.line_end(line))
+    insert_mode(tVIM)
+
+
+def next_match(tVIM, count):
+    """'n' command - Move to the next match of the last search."""
+    
+    for _ in range(count or 1):
+        jump_to_match(tVIM, True)
+
+
+def prev_match(tVIM, count):
+    """'N' command - Move to the previous match of the last search."""
+    
+    for _ in range(count or 1):
+        jump_to_match(tVIM, False)
+
+
+def delete_chars(tVIM, count):
+    """'x' command - Delete count chars from the cursor on, within the line."""
+    
+    cursor = tVIM.view.cursor()
+    end = right_motion(tVIM, cursor, count)
+    if end > cursor:
+        delete_operator(tVIM, cursor, end, False)
+
+
+def undo_command(tVIM, count):
+    """'u' command - Undo the last count changes."""
+    
+    check_writable(tVIM)
+    for _ in range(count or 1):
+        offset = tVIM.undo_tree.undo(tVIM.view)
+        if offset == None:
+            break
+        tVIM.view.set_cursor(offset)
+
+
+def redo_command(tVIM, count):
+    """Ctrl-R command - Redo the last count changes that were undone."""
+    
+    check_writable(tVIM)
+    for _ in range(count or 1):
+        offset = tVIM.undo_tree.redo(tVIM.view)
+        if offset == None:
+            break
+        tVIM.view.set_cursor(offset)
+
+
+def record_macro(register):
+    """Returns the 'q{register}' command, which records the keys typed from
+    then on into register, until 'q' is typed again.
+    
+    Parameters
+    ----------
+    register: a str, the name of the register.
+    """
+    
+    def record_keys(tVIM, count):
+        tVIM.key_parser.recording = register
+        tVIM.key_parser.recorded = []
+    
+    return record_keys
+
+
+def stop_recording(tVIM):
+    """'q' command while recording - Stores the keys recorded in their
+    register, where '@' replays them and 'p' pastes them."""
+    
+    parser = tVIM.key_parser
+    tVIM.registers[parser.recording] = ("".join(parser.recorded), False)
+    parser.recording = None
+    parser.recorded = []
+
+
+def replay_macro(register):
+    """Returns the '{count}@{register}' command, which replays the keys in
+    register count times, or the '@@' command for a register of '@'. The
+    keys are applied to the buffer straight away, and the window is only
+    drawn again once they are all done.
+    
+    Parameters
+    ----------
+    register: a str, the name of the register, or '@' for the last one
+              replayed.
+    """
+    
+    def replay_keys(tVIM, count):
+        name = register
+        if name == "@":
+            name = tVIM.key_parser.last_macro
+        keys = tVIM.registers.get(name, ("", False))[0]
+        if not keys:
+            raise CommandError(NO_MACRO_ERROR)
+        tVIM.key_parser.last_macro = name
+        tVIM.replay(keys * (count or 1))
+    
+    return replay_keys
+
+
+def paste_after(tVIM, count):
+    """'p' command - Paste the register after the cursor, or below the line."""
+    
+    paste(tVIM, count, True)
+
+
+def paste_before(tVIM, count):
+    """'P' command - Paste the register before the cursor, or above the line."""
+    
+    paste(tVIM, count, False)
+
+
+def paste(tVIM, count, after):
+    """Pastes the unnamed register count times.
+        
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    count: an int, the number of copies, or None for one.
+    after: a bool, whether to paste after the cursor instead of before it.
+    """
+    
+    if '"' not in tVIM.registers:
+        return
+    check_writable(tVIM)
+    text, linewise = tVIM.registers['"']
+    text = text * (count or 1)
+    buffer = tVIM.buffer
+    line = buffer.line_of(tVIM.view.cursor())
+    
+    # Lines go above or below the current line
+    if linewise:
+        offset = buffer.line_start(line + 1 if after else line)
+        # The last line may have no newline char to paste after
+        if after and line == buffer.line_count():
+            offset = len(buffer)
+            text = '\n' + text[:-1]
+            tVIM.view.insert(offset, text)
+            tVIM.view.set_cursor(offset + 1)
+        else:
+            tVIM.view.insert(offset, text)
+            tVIM.view.set_cursor(offset)
+    
+    # Chars go just after or at the cursor
+    else:
+        offset = tVIM.view.cursor()
+        if after:
+            offset = right_motion(tVIM, offset, 1)
+        tVIM.view.insert(offset, text)
+        tVIM.view.set_cursor(offset + len(text) - 1)
+
+
+"""The code below provides the motions that the KeyParser runs.
+
+Each motion takes the tVIM instance, the offset it starts from and the count
+typed before it (or None), and returns the offset it moves to.
+"""
+
+
+def left_motion(tVIM, offset, count):
+    """'h' motion - Move count chars left, within the line."""
+    
+    start = tVIM.buffer.line_start(tVIM.buffer.line_of(offset))
+    
+    return max(start, offset - (count or 1))
+
+
+def right_motion(tVIM, offset, count):
+    """'l' motion - Move count chars right, within the line."""
+    
+    end = tVIM.buffer.line_end(tVIM.buffer.line_of(offset))
+    
+    return min(end, offset + (count or 1))
+
+
+def down_motion(tVIM, offset, count):
+    """'j' motion - Move count lines down, keeping the column."""
+    
+    buffer = tVIM.buffer
+    line, column = buffer.offset_to_index(offset)
+    
+    return buffer.index_to_offset(min(line + (count or 1), 
+                                      buffer.line_count()), column)
+
+
+def up_motion(tVIM, offset, count):
+    """'k' motion - Move count lines up, keeping the column."""
+    
+    line, column = tVIM.buffer.offset_to_index(offset)
+    
+    return tVIM.buffer.index_to_offset(max(line - (count or 1), 1), column)
+
+
+def line_start_motion(tVIM, offset, count):
+    """'0' motion - Move to the start of the line."""
+    
+    return tVIM.buffer.line_start(tVIM.buffer.line_of(offset))
+
+
+def line_end_motion(tVIM, offset, count):
+    """'$' motion - Move to the end of the line, count - 1 lines down."""
+    
+    line = tVIM.buffer.line_of(offset) + (count or 1) - 1
+    
+    return tVIM.buffer.line_end(line)
+
+
+def word_motion(tVIM, offset, count):
+    """'w' motion - Move to the start of the count-th next word."""
+    
+    buffer = tVIM.buffer
+    for _ in range(count or 1):
+        # Look at a growing window after offset until the next word is in it
+        size = 256
+        while True:
+            text = buffer.get_text(offset, offset + size)
+            starts = [match.start() for match in WORD_RE.finditer(text)]
+            # A word starting right at offset is the one being left
+            starts = [start for start in starts if start > 0]
+            if starts:
+                offset += starts[0]
+                break
+            if offset + size >= len(buffer):
+                return len(buffer)
+            size *= 4
+    
+    return offset
+
+
+def back_word_motion(tVIM, offset, count):
+    """'b' motion - Move to the start of the count-th previous word."""
+    
+    buffer = tVIM.buffer
+    for _ in range(count or 1):
+        # Look at a growing window before offset until a word start is in it
+        size = 256
+        while True:
+            start = max(0, offset - size)
+            text = buffer.get_text(start, offset)
+            starts = [match.start() for match in WORD_RE.finditer(text)]
+            # A word at the very start of the window may start before it
+            if starts and (starts[-1] > 0 or start == 0):
+                offset = start + starts[-1]
+                break
+            if start == 0:
+                return 0
+            size *= 4
+    
+    return offset
+
+
+def first_line_motion(tVIM, offset, count):
+    """'gg' motion - Move to the first line, or to line count."""
+    
+    return tVIM.buffer.line_start(count or 1)
+
+
+def last_line_motion(tVIM, offset, count):
+    """'G' motion - Move to the last line, or to line count."""
+    
+    return tVIM.buffer.line_start(count or tVIM.buffer.line_count())
+
+
+"""The code below provides the operators that the KeyParser runs.
+
+Each operator takes the tVIM instance, the start and end offsets of the text
+it works on and whether it works on whole lines. Linewise ranges end at the
+newline char of their last line.
+"""
+
+
+def delete_operator(tVIM, start, end, linewise):
+    """'d' operator - Delete the text into the unnamed register."""
+    
+    check_writable(tVIM)
+    yank_operator(tVIM, start, end, linewise)
+    
+    # Whole lines take one of their newline chars with them
+    if linewise:
+        if end < len(tVIM.buffer):
+            end += 1
+        elif start > 0:
+            start -= 1
+    tVIM.view.delete(start, end - start)
+    tVIM.view.set_cursor(tVIM.buffer.line_start(tVIM.buffer.line_of(start))
+                         if linewise else start)
+
+
+def yank_operator(tVIM, start, end, linewise):
+    """'y' operator - Copy the text into the unnamed register."""
+    
+    text = tVIM.buffer.get_text(start, end)
+    if linewise:
+        text += '\n'
+    tVIM.registers['"'] = (text, linewise)
+    tVIM.view.set_cursor(start)
+
+
+def change_operator(tVIM, start, end, linewise):
+    """'c' operator - Delete the text, keeping whole lines, and enter insert."""
+    
+    check_writable(tVIM)
+    yank_operator(tVIM, start, end, linewise)
+    tVIM.view.delete(start, end - start)
+    tVIM.view.set_cursor(start)
+    insert_mode(tVIM)
+
+
+"""The code below builds the tables the KeyParser looks keys up in."""
+
+
+NORMAL_COMMANDS = {
+    "o": open_below,
+    "O": open_above,
+    "gg": goto_first_line,
+    "G": goto_last_line,
+    "i": insert_here,
+    "I": insert_line_start,
+    "a": append_here,
+    "A": append_line_end,
+    "n": next_match,
+    "N": prev_match,
+    "x": delete_chars,
+    "p": paste_after,
+    "P": paste_before,
+    "u": undo_command,
+    "\x12": redo_command, # Ctrl-R
+    "@@": replay_macro("@"),
+}
+# 'qa' to 'qz' record keys into a register, and '@a' to '@z' replay them
+NORMAL_COMMANDS.update({"q" + register: record_macro(register)
+                        for register in MACRO_REGISTERS})
+NORMAL_COMMANDS.update({"@" + register: replay_macro(register)
+                        for register in MACRO_REGISTERS})
+
+# Each motion is paired with whether operators use it on whole lines
+MOTIONS = {
+    "h": (left_motion, False),
+    "l": (right_motion, False),
+    "j": (down_motion, True),
+    "k": (up_motion, True),
+    "0": (line_start_motion, False),
+    "$": (line_end_motion, False),
+    "w": (word_motion, False),
+    "b": (back_word_motion, False),
+    "gg": (first_line_motion, True),
+    "G": (last_line_motion, True),
+}
+
+OPERATORS = {
+    "d": delete_operator,
+    "y": yank_operator,
+    "c": change_operator,
+}
+
+
+"""The code below provides the ':' commands in the ExCommands registry."""
+
+
+@ex_command("w", bang=True)
+def write_command(tVIM, argument, bang):
+    """':w' and ':w!' commands - Save as, or save to the file name given.
+    Saving never asks first, so the '!' changes nothing."""
+    
+    if argument:
+        tVIM.save_file(argument)
+    else:
+        tVIM.save_as()
+
+
+@ex_command("wq", bang=True)
+def write_quit_command(tVIM, argument, bang):
+    """':wq' and ':wq!' commands - Save as, then quit once the file is
+    written."""
+    
+    if argument:
+        tVIM.save_file(argument, tVIM.close)
+    else:
+        tVIM.save_as(tVIM.close)
+
+
+@ex_command("q", bang=True)
+def quit_command(tVIM, argument, bang):
+    """':q' command - Quit after asking the user, or right away for ':q!'."""
+    
+    if bang:
+        tVIM.close()
+    else:
+        tVIM.confirm_quit()
+
+
+@ex_command("e", "edit")
+def edit_command(tVIM, argument):
+    """':e file' command - Show a file in this window, opening it in the
+    session unless it is open already."""
+    
+    if not argument:
+        raise CommandError(NO_FILE_NAME_ERROR)
+    try:
+        tVIM.switch_to(tVIM.session.open(argument))
+    except (OSError, UnicodeDecodeError) as error:
+        raise CommandError(OPEN_ERROR + "\n" + str(error))
+
+
+@ex_command("fin", "find")
+def find_command(tVIM, argument):
+    """':find name' command - Open the file under the current folder whose
+    path best matches name, fuzzily."""
+    
+    if not argument:
+        raise CommandError(NO_FILE_NAME_ERROR)
+    tVIM.find_file(argument)
+
+
+@ex_command("bn", "bnext")
+def buffer_next_command(tVIM, argument):
+    """':bn' command - Show the next document of the session."""
+    
+    tVIM.switch_to(tVIM.session.next_document(tVIM.document, 1))
+
+
+@ex_command("bp", "bprevious")
+def buffer_previous_command(tVIM, argument):
+    """':bp' command - Show the previous document of the session."""
+    
+    tVIM.switch_to(tVIM.session.next_document(tVIM.document, -1))
+
+
+@ex_command("b", "buffer")
+def buffer_command(tVIM, argument):
+    """':b N' command - Show the document numbered N by ':ls'."""
+    
+    document = None
+    if argument.isdigit():
+        document = tVIM.session.find_number(int(argument))
+    if document == None:
+        raise CommandError(NO_BUFFER_ERROR)
+    tVIM.switch_to(document)
+
+
+@ex_command("vim", "vimgrep")
+def vimgrep_command(tVIM, argument):
+    """':vimgrep /pattern/ files' command - Search files for a pattern,
+    filling the quickfix list with the hits as they are found. The files
+    may be glob patterns like '**/*.py', and the 'j' flag keeps the cursor
+    where it is instead of jumping to the first hit."""
+    
+    pattern, flags, files = split_grep_argument(argument)
+    paths = expand_files(files)
+    if not paths:
+        raise CommandError(NO_GREP_FILES_ERROR)
+    try:
+        tVIM.grep(pattern, paths, "j" not in flags)
+    except re.error:
+        raise CommandError(PATTERN_ERROR)
+
+
+@ex_command("prof", "profile")
+def profile_command(tVIM, argument):
+    """':profile start', ':profile stop', ':profile' and ':profile dump
+    file' commands - Start or stop timing commands, searches, files and Tk
+    calls, show the p50 and p99 latency of each, or save them as a Chrome
+    trace."""
+    
+    session = tVIM.session
+    words = argument.split(None, 1)
+    if argument == "start":
+        session.profiler = start_profiling()
+        if session.root != None:
+            route_tk_calls(session.root, True)
+    elif argument == "stop":
+        stop_profiling()
+        if session.root != None:
+            route_tk_calls(session.root, False)
+    elif session.profiler == None:
+        raise CommandError(NO_PROFILE_ERROR)
+    elif not argument:
+        tVIM.message(session.profiler.report())
+    elif words[0] == "dump" and len(words) == 2:
+        try:
+            session.profiler.save_trace(os.path.expanduser(words[1]))
+        except OSError as error:
+            raise CommandError(PROFILE_DUMP_ERROR + "\n" + str(error))
+    else:
+        raise CommandError(PROFILE_USAGE_ERROR)
+
+
+@ex_command("fol", "follow")
+def follow_command(tVIM, argument):
+    """':follow', ':follow N' and ':follow stop' commands - Append what is
+    written to the end of the file as it grows, like 'tail -f', keeping only
+    the last N lines if N is given, or stop following it."""
+    
+    if argument == "stop":
+        tVIM.stop_following()
+        return
+    if argument and (not argument.isdigit() or int(argument) == 0):
+        raise CommandError(FOLLOW_USAGE_ERROR)
+    document = tVIM.document
+    if (document.filename == None or not os.path.exists(document.filename)
+            or hasattr(tVIM.buffer, "map")
+            or document.format.compression != None):
+        raise CommandError(FOLLOW_FILE_ERROR)
+    if document.modified():
+        raise CommandError(FOLLOW_MODIFIED_ERROR)
+    try:
+        tVIM.follow(int(argument) if argument else None)
+    except OSError as error:
+        raise CommandError(FOLLOW_ERROR + "\n" + str(error))
+
+
+@ex_command("cn", "cnext")
+def quickfix_next_command(tVIM, argument):
+    """':cn' command - Jump to the next hit of the quickfix list."""
+    
+    jump_to_entry(tVIM, tVIM.session.quickfix.move(1))
+
+
+@ex_command("cp", "cprevious")
+def quickfix_previous_command(tVIM, argument):
+    """':cp' command - Jump to the previous hit of the quickfix list."""
+    
+    jump_to_entry(tVIM, tVIM.session.quickfix.move(-1))
+
+
+@ex_command("cope", "copen")
+def quickfix_open_command(tVIM, argument):
+    """':copen' command - Show the quickfix list below the text."""
+    
+    tVIM.show_quickfix(True)
+
+
+@ex_command("ccl", "cclose")
+def quickfix_close_command(tVIM, argument):
+    """':cclose' command - Hide the quickfix list."""
+    
+    tVIM.show_quickfix(False)
+
+
+@ex_command("ls", "buffers")
+def list_buffers_command(tVIM, argument):
+    """':ls' command - List the documents of the session."""
+    
+    tVIM.message(tVIM.session.listing(tVIM.document))
                 
 
+def split_grep_argument(argument):
+    """Splits the argument of ':vimgrep' into its pattern, flags and files.
+    Like Vim, the pattern is either enclosed in any non-word char, as in
+    '/pat/gj *.py', or is the first word when it starts with a word char.
+    
+    Parameter
+    ---------
+    argument: a str, what was typed after ':vimgrep '.
+    
+    Returns
+    -------
+    A (pattern, flags, files) triple of strs.
+    """
+    
+    if not argument:
+        raise CommandError(NO_GREP_PATTERN_ERROR)
+    
+    delimiter = argument[0]
+    if delimiter.isalnum() or delimiter == "_":
+        pattern, _, files = argument.partition(" ")
+        return pattern, "", files
+    
+    # The pattern ends at the first delimiter that is not escaped
+    end = 1
+    while end < len(argument) and argument[end] != delimiter:
+        end += 2 if argument[end] == "\\" else 1
+    if end >= len(argument):
+        raise CommandError(NO_GREP_PATTERN_ERROR)
+    pattern = argument[1:end].replace("\\" + delimiter, delimiter)
+    flags, _, files = argument[end + 1:].partition(" ")
+    if not pattern or flags.strip("gj"):
+        raise CommandError(NO_GREP_PATTERN_ERROR)
+    
+    return pattern, flags, files
+
+
+def jump_to_entry(tVIM, entry):
+    """Shows the file of a quickfix entry with the cursor on its hit.
+    
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    entry: a (path, line, column, text) hit, or None past either end of
+           the quickfix list.
+    """
+    
+    if entry == None:
+        raise CommandError(NO_MORE_HITS_ERROR)
+    path, line, column, text = entry
+    try:
+        tVIM.switch_to(tVIM.session.open(path))
+    except (OSError, UnicodeDecodeError) as error:
+        raise CommandError(OPEN_ERROR + "\n" + str(error))
+    tVIM.view.set_cursor(tVIM.buffer.index_to_offset(line, column))
+
+
+def range_line(tVIM, address):
+    """Returns the number of the line a range address stands for.
+    
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    address: a str, a line number, '.' for the line of the cursor or '$'
+             for the last line.
+    """
+    
+    buffer = tVIM.buffer
+    if address == ".":
+        return buffer.line_of(tVIM.view.cursor())
+    if address == "$":
+        return buffer.line_count()
+    
+    return min(max(int(address), 1), buffer.line_count())
+
+
+def filter_lines(tVIM, line):
+    """':%!cmd' and ':a,b!cmd' commands - Pipe whole lines through a shell
+    command, like 'sort' or a formatter, and replace them with what it
+    prints. The command runs on worker threads.
+    
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    line: a str, what was typed after ':'.
+    """
+    
+    match = FILTER_RE.fullmatch(line)
+    command = match.group(4).strip()
+    if not command:
+        raise CommandError(NO_FILTER_COMMAND_ERROR)
+    check_writable(tVIM)
+    
+    buffer = tVIM.buffer
+    if match.group(1) == "%":
+        first, last = 1, buffer.line_count()
+    else:
+        first = range_line(tVIM, match.group(2))
+        last = range_line(tVIM, match.group(3) or match.group(2))
+        # A backwards range is turned around
+        first, last = min(first, last), max(first, last)
+    # The newline of the last line is part of the range, if it has one
+    end = min(buffer.line_end(last) + 1, len(buffer))
+    tVIM.filter(buffer.line_start(first), end, command)
+
+
+def apply_filter(tVIM, job):
+    """Starts replacing the range of a finished FilterJob with its output,
+    as one change that 'u' undoes at once. The FilterApply returned puts
+    the output in the buffer a slice at a time once it is started, or all
+    at once with finish().
+    
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    job: a FilterJob that is done.
+    
+    Returns
+    -------
+    The FilterApply, also kept as tVIM.filter_apply until it is done, or
+    None if the job was cancelled.
+    """
+    
+    if job.cancelled:
+        return None
+    if job.error != None:
+        raise CommandError(FILTER_ERROR + "\n" + job.error)
+    if job.buffer is not tVIM.buffer or job.version != tVIM.buffer.version:
+        raise CommandError(FILTER_CHANGED_ERROR)
+    
+    tVIM.filter_apply = FilterApply(tVIM, job)
+    
+    return tVIM.filter_apply
+
+
+def apply_follow(tVIM, text):
+    """Appends the text read by the Follower of a window to its buffer, as
+    one change, and drops the first lines past the cap of the follower. The
+    cursor follows the end if it was on the last line. The document still
+    matches its file, which it only follows.
+    
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    text: a str, the text appended to the file.
+    """
+    
+    buffer = tVIM.buffer
+    view = tVIM.view
+    cursor = view.cursor()
+    at_end = buffer.line_of(cursor) == buffer.line_count()
+    
+    tVIM.undo_tree.close()
+    view.insert(len(buffer), text)
+    # Keep the last lines complete lines, and the one being written
+    lines = tVIM.follower.lines
+    complete = buffer.line_count() - 1
+    if lines != None and complete > lines:
+        trimmed = buffer.line_start(complete - lines + 1)
+        view.delete(0, trimmed)
+        cursor = max(cursor - trimmed, 0)
+        buffer.compact()
+    tVIM.undo_tree.close()
+    tVIM.document.saved_version = buffer.version
+    
+    if at_end:
+        view.set_cursor(buffer.line_start(buffer.line_count()))
+    else:
+        view.set_cursor(cursor)
+
+
 def insert_mode(tVIM):
     """Exits command mode and enters insert mode, moving the
     cursor back to scroll_window.
@@ -129,10 +1063,15 @@ def insert_mode(tVIM):
     tVIM: tVIM instance.
     """
     
+    # Typing would edit a file that is being followed
+    if tVIM.follower != None:
+        raise CommandError(FOLLOW_EDIT_ERROR)
+    if tVIM.filter_apply != None:
+        raise CommandError(FILTER_APPLYING_ERROR)
     # Focus back onto scroll_window
-    tVIM.scroll_window.focus()
+    tVIM.view.focus()
     # Remove all highlighting
-    tVIM.scroll_window.tag_remove("highlight", '1.0', END)
+    tVIM.highlights.clear("highlight")
     
     
 def clear_cmd_line(tVIM):
@@ -143,11 +1082,25 @@ def clear_cmd_line(tVIM):
     tVIM: tVIM instance.
     """
     
-    # Clear the command line
+    # Clear the command line, it is redrawn with the next frame
     tVIM.cmd_line.delete('1.0', END)
-    tVIM.cmd_line.update()
+
+
+def show_pending(tVIM):
+    """Shows the keys of the command being typed in cmd_line, unless a
+    '?' or ':' line is being typed there since.
+        
+    Parameter
+    ---------
+    tVIM: tVIM instance.
+    """
+    
+    if not tVIM.key_parser.line_mode:
+        tVIM.cmd_line.delete('1.0', END)
+        tVIM.cmd_line.insert('1.0', tVIM.key_parser.pending)
     
 
+@span("search")
 def search_pattern(tVIM, pattern):
     """Searches for the specified pattern in this tVIM instance's
     scroll_window. Provides funcitonality for '?pattern' command.
@@ -159,33 +1112,83 @@ def search_pattern(tVIM, pattern):
     """
     
     # Line below removes all previous highlighting
-    tVIM.scroll_window.tag_remove("highlight", '1.0', END)
+    tVIM.highlights.clear("highlight")
+    tVIM.highlights.clear("search")
+    
+    # Reuse the matches of the incremental search if it found them, or of
+    # the same search made before, otherwise find every match in a single
+    # pass over the buffer
+    tVIM.incremental_search.finish()
+    engine = tVIM.search_engine
+    cached = tVIM.document.cached_search(pattern)
+    try:
+        if engine.is_current(tVIM.buffer, pattern) and engine.complete:
+            found = len(engine)
+        elif cached != None:
+            found = engine.restore(tVIM.buffer, pattern, *cached)
+        else:
+            found = engine.search(tVIM.buffer, pattern)
+    except re.error:
+        raise CommandError(PATTERN_ERROR)
+    tVIM.document.remember_search(pattern, engine.starts, engine.ends)
     
-    # 'start' specifies where we start scroll_window.search
-    start = '1.0'
-    pattern_found = False
+    # If the pattern was not found, call an error
+    if not found:
+        raise CommandError(PATTERN_NOT_FOUND)
     
-    # Keep calling scroll_window.search until we reach the end
-    while (start != END):
-        
-        # look for the pattern from 'start' and get the position
-        pos = tVIM.scroll_window.search(pattern, start, stopindex=END)
+    # Highlight the matches, the lines in view get tagged as they scroll by
+    tVIM.highlights.set_ranges("highlight", engine.starts, engine.ends, 
+                               engine.regex)
+
+
+def incremental_search(tVIM):
+    """Updates the search highlights while a '?pattern' is being typed.
+    Runs once the key just pressed has reached cmd_line.
         
-        # If no occurence of pattern
-        if not pos:
-            start = END
+    Parameter
+    ---------
+    tVIM: tVIM instance.
+    """
+    
+    command = tVIM.cmd_line.get('1.0', END).replace('\n', '')
+    
+    if len(command) > 1 and command[0] == "?":
+        tVIM.incremental_search.update(command[1:])
+    else:
+        tVIM.incremental_search.cancel()
+
+
+def jump_to_match(tVIM, forward):
+    """Moves the cursor to the next or previous match of the last search.
+    Provides functionality for the 'n' and 'N' commands.
         
-        else:
-            # A position was found, highlight that word
-            tVIM.scroll_window.tag_add("highlight", pos, pos  
-                                    + " +" + str(len(pattern)) + "c")
-            # Change start to the end of the found pattern's position
-            start = pos + " +" + str(len(pattern)) + "c"
-            pattern_found = True
+    Parameters
+    ----------
+    tVIM: tVIM instance.
+    forward: a bool, True for the next match, False for the previous one.
+    """
     
-    # If the pattern was not found, call an error
-    if not pattern_found:
-        error_popup(PATTERN_NOT_FOUND)
+    engine = tVIM.search_engine
+    # The matches were found in an older text, or in another document
+    tVIM.incremental_search.finish()
+    if (engine.pattern != None
+            and not engine.is_current(tVIM.buffer, engine.pattern)):
+        engine.search(tVIM.buffer, engine.pattern)
+        tVIM.highlights.set_ranges("highlight", engine.starts, engine.ends,
+                                   engine.regex)
+    cursor = tVIM.view.cursor()
+    if forward:
+        match = engine.next_match(cursor)
+    else:
+        match = engine.prev_match(cursor)
+    
+    if match == None:
+        raise CommandError(PATTERN_NOT_FOUND)
+    
+    # Move onto the match and mark it as the current one
+    tVIM.view.set_cursor(engine.starts[match])
+    tVIM.highlights.set_ranges("search", [engine.starts[match]], 
+                               [engine.ends[match]])
 
 
 """The code below handles a popup window on errors."""
@@ -199,4 +1202,6 @@ def error_popup(error):
     error: a str, the error that occurred. Gets printed.
     """
     
+    from tkinter import messagebox
+    
     popup = messagebox.showerror(title=ERROR_TITLE, message=error)
@@ -0,0 +1,259 @@
+"""This module times the hot paths of tVIM for ':profile'.
+
+Functions decorated with span() time themselves while profiling is on: the
+keys and lines run as commands, searches, and opening and saving files. A
+window can also route every Tk call through a TkCallProxy, which times each
+call that crosses into Tcl. The times are kept per name, so ':profile' shows
+the p50 and p99 latency of each, and ':profile dump' saves them as a Chrome
+trace that chrome://tracing or Perfetto can open.
+
+While profiling is off, a span only checks that PROFILER is None before
+calling the function, and no Tk call is routed through a proxy, so the
+spans stay in for good.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from array import array
+
+
+# The Profiler recording spans, or None while profiling is off
+PROFILER = None
+
+# The most spans kept for the Chrome trace, the latencies are all kept
+TRACE_LIMIT = 200000
+
+# The percentiles shown by ':profile'
+PERCENTILES = (50, 99)
+
+
+def span(name):
+    """Returns a decorator that times each call of a function while
+    profiling is on.
+
+    Parameters
+    ----------
+    name: a str, the name the calls are recorded under, or a function of
+          the arguments of the call returning that name.
+    """
+
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            profiler = PROFILER
+            if profiler is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(name if isinstance(name, str)
+                                else name(*args, **kwargs),
+                                start, time.perf_counter_ns())
+        return timed
+
+    return decorate
+
+
+def start_profiling():
+    """Starts recording spans with a new Profiler, which is returned."""
+
+    global PROFILER
+    PROFILER = Profiler()
+
+    return PROFILER
+
+
+def stop_profiling():
+    """Stops recording spans and returns the Profiler that recorded them,
+    or None if profiling was off."""
+
+    global PROFILER
+    profiler, PROFILER = PROFILER, None
+
+    return profiler
+
+
+def percentile(samples, percent):
+    """Returns the sample below which a percentage of the samples lie.
+
+    Parameters
+    ----------
+    samples: a non-empty sorted list of numbers.
+    percent: a number from 0 to 100.
+    """
+
+    index = min(len(samples) - 1, len(samples) * percent // 100)
+
+    return samples[int(index)]
+
+
+class Profiler():
+    """The Profiler class holds the spans recorded while profiling.
+
+    Instance vars
+    -------------
+    started: The time (in ns, from time.perf_counter_ns) profiling started.
+    latencies: A dict from span name to an array of the durations (in ns)
+               of its calls.
+    events: A list of (name, start, duration, thread id) tuples, the first
+            TRACE_LIMIT spans, for the Chrome trace.
+    """
+
+    def __init__(self):
+        """Initializes a Profiler with no spans."""
+
+        self.started = time.perf_counter_ns()
+        self.latencies = {}
+        self.events = []
+
+    def record(self, name, start, end):
+        """Records a span. Spans may be recorded by any thread.
+
+        Parameters
+        ----------
+        self: Profiler instance.
+        name: a str, the name of the span.
+        start: an int, when the span started, from time.perf_counter_ns.
+        end: an int, when the span ended.
+        """
+
+        durations = self.latencies.get(name)
+        if durations is None:
+            durations = self.latencies.setdefault(name, array('q'))
+        durations.append(end - start)
+        if len(self.events) < TRACE_LIMIT:
+            self.events.append((name, start, end - start,
+                                threading.get_ident()))
+
+    def report(self):
+        """Returns a table of the count, total time and percentiles of each
+        span, the span taking the most time in total first."""
+
+        rows = []
+        for name, durations in self.latencies.items():
+            samples = sorted(durations)
+            rows.append((sum(samples), name, samples))
+        rows.sort(reverse=True)
+
+        lines = ["%-28s %7s %10s %10s %10s %10s" % (
+            "span", "count", "total ms", "p50 us", "p99 us", "max us")]
+        for total, name, samples in rows:
+            lines.append("%-28s %7d %10.1f %10.1f %10.1f %10.1f" % (
+                name[:28], len(samples), total / 1e6,
+                percentile(samples, PERCENTILES[0]) / 1e3,
+                percentile(samples, PERCENTILES[1]) / 1e3,
+                samples[-1] / 1e3))
+
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Returns the spans as a Chrome trace, a dict of "complete" events
+        with times in microseconds since profiling started."""
+
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "pid": pid, "tid": thread,
+                   "ts": (start - self.started) / 1e3,
+                   "dur": duration / 1e3}
+                  for name, start, duration, thread in self.events]
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_trace(self, filename):
+        """Writes the Chrome trace to a file.
+
+        Parameters
+        ----------
+        self: Profiler instance.
+        filename: a str, the path of the JSON file.
+        """
+
+        with open(filename, "wt", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
+
+
+class TkCallProxy():
+    """The TkCallProxy class stands in for the Tcl interpreter of the
+    widgets while profiling, timing each call and eval as a span named
+    after the Tcl command, like 'tk insert' or 'tk after'. Every other
+    attribute is the interpreter's own.
+
+    Instance vars
+    -------------
+    tk: The Tcl interpreter (a _tkinter tkapp) the calls go to.
+    """
+
+    def __init__(self, tk):
+        """Initializes a TkCallProxy for an interpreter."""
+
+        self.tk = tk
+
+    def __getattr__(self, attribute):
+        """Returns an attribute of the interpreter."""
+
+        return getattr(self.tk, attribute)
+
+    def call(self, *args):
+        """Runs a Tcl command, timing it."""
+
+        profiler = PROFILER
+        if profiler is None:
+            return self.tk.call(*args)
+        start = time.perf_counter_ns()
+        try:
+            return self.tk.call(*args)
+        finally:
+            profiler.record(tk_span_name(args), start, time.perf_counter_ns())
+
+    def eval(self, script):
+        """Evaluates a Tcl script, timing it."""
+
+        profiler = PROFILER
+        if profiler is None:
+            return self.tk.eval(script)
+        start = time.perf_counter_ns()
+        try:
+            return self.tk.eval(script)
+        finally:
+            profiler.record("tk eval", start, time.perf_counter_ns())
+
+
+def tk_span_name(args):
+    """Returns the span name of a Tk call: the subcommand of a widget
+    command (like 'tk insert'), or the Tcl command itself."""
+
+    # Tkinter passes some calls as a single tuple
+    if len(args) == 1 and isinstance(args[0], tuple):
+        args = args[0]
+    if not args:
+        return "tk"
+    if str(args[0]).startswith(".") and len(args) > 1:
+        return "tk %s" % args[1]
+
+    return "tk %s" % args[0]
+
+
+def route_tk_calls(root, profiled):
+    """Routes the Tk calls of every widget under a root through a
+    TkCallProxy, or back to the interpreter. Widgets made later take the
+    interpreter of their master, so they follow.
+
+    Parameters
+    ----------
+    root: the Tk root of the session.
+    profiled: a bool, True to time the calls and False to stop.
+    """
+
+    tk = root.tk
+    if isinstance(tk, TkCallProxy):
+        tk = tk.tk
+    target = TkCallProxy(tk) if profiled else tk
+
+    widgets = [root]
+    while widgets:
+        widget = widgets.pop()
+        widget.tk = target
+        widgets.extend(widget.children.values())
@@ -0,0 +1,216 @@
+"""This module lets a launch of tVIM open its files in a tVIM that is
+already running, like Vim's '--remote'.
+
+The first tVIM started from the command line listens on a Unix domain socket
+in SERVER_FOLDER, named after its server name. A later launch with
+'--remote' connects to that socket, sends the paths of its files and exits
+at once, without starting Tk or importing the editor:
+
+    python -m my_modules.Remote notes.txt
+    python -m my_modules.Remote --remote todo.txt
+
+If no tVIM is listening, the '--remote' launch opens the files itself and
+becomes the server. Each request is one line of JSON, answered by 'ok'.
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+
+
+# The sockets of the running servers are kept in this folder
+SERVER_FOLDER = os.path.join(os.path.expanduser("~"), ".tvim", "servers")
+
+# The server name used when none is given, like Vim's 'GVIM'
+DEFAULT_SERVER = "TVIM"
+
+# How long (in seconds) a launch waits on a server before giving up on it
+REMOTE_TIMEOUT = 2.0
+
+# How often (in ms) the editor opens the files sent to its server
+REMOTE_POLL = 100
+
+# The longest request a server reads
+REQUEST_LIMIT = 1 << 20
+
+
+def server_path(name=DEFAULT_SERVER):
+    """Returns the path of the socket of a server.
+
+    Parameters
+    ----------
+    name: a str, the name of the server, defaults to DEFAULT_SERVER.
+    """
+
+    return os.path.join(SERVER_FOLDER, name)
+
+
+def remote_available():
+    """Returns whether this platform has Unix domain sockets."""
+
+    return hasattr(socket, "AF_UNIX")
+
+
+def send_files(files, name=DEFAULT_SERVER):
+    """Asks a running server to open files.
+
+    Parameters
+    ----------
+    files: a list of strs, the paths of the files, relative to the current
+           folder or absolute.
+    name: a str, the name of the server, defaults to DEFAULT_SERVER.
+
+    Returns
+    -------
+    Whether a server took the files, False if none is running.
+    """
+
+    if not remote_available():
+        return False
+
+    request = json.dumps({"files": [os.path.abspath(file) for file in files]})
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(REMOTE_TIMEOUT)
+            client.connect(server_path(name))
+            client.sendall(request.encode("utf-8") + b"\n")
+            with client.makefile("rb") as reply:
+                return reply.readline().strip() == b"ok"
+    except OSError:
+        return False
+
+
+class RemoteServer():
+    """The RemoteServer class listens on a socket for the files that later
+    launches send, on a worker thread. The files wait in a queue until the
+    editor, which owns the Tk mainloop, takes them with pending().
+
+    Instance vars
+    -------------
+    name: The name of the server.
+    path: The path of the socket.
+    requests: A Queue of the lists of absolute paths sent by each launch.
+    """
+
+    def __init__(self, name=DEFAULT_SERVER):
+        """Starts listening as a server, taking over the socket of a server
+        that is gone.
+
+        Parameters
+        ----------
+        self: RemoteServer instance.
+        name: a str, the name of the server, defaults to DEFAULT_SERVER.
+
+        Raises
+        ------
+        OSError if another server with that name is running, or if the
+        socket can not be made.
+        """
+
+        self.name = name
+        self.path = server_path(name)
+        self.requests = queue.Queue()
+
+        os.makedirs(SERVER_FOLDER, mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            if send_files([], name):
+                raise OSError("A tVIM server named '%s' is running." % name)
+            # The socket was left behind by a tVIM that did not close
+            os.remove(self.path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.bind(self.path)
+            os.chmod(self.path, 0o600)
+            self._socket.listen()
+        except OSError:
+            self._socket.close()
+            raise
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def pending(self):
+        """Returns the lists of paths sent since the last call, oldest
+        first."""
+
+        sent = []
+        while True:
+            try:
+                sent.append(self.requests.get_nowait())
+            except queue.Empty:
+                return sent
+
+    def close(self):
+        """Stops listening and removes the socket."""
+
+        if self._closed:
+            return
+        self._closed = True
+        # Shutting the socket down wakes the accept of the worker thread
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._thread.join(REMOTE_TIMEOUT)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _run(self):
+        """Answers each launch that connects. Runs on its own thread."""
+
+        while not self._closed:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            with connection:
+                try:
+                    connection.settimeout(REMOTE_TIMEOUT)
+                    with connection.makefile("rb") as request:
+                        line = request.readline(REQUEST_LIMIT)
+                    files = json.loads(line.decode("utf-8"))["files"]
+                    if not isinstance(files, list) or not all(
+                            isinstance(file, str) for file in files):
+                        continue
+                    # An empty request only checks that the server is up
+                    if files:
+                        self.requests.put(files)
+                    connection.sendall(b"ok\n")
+                except (OSError, ValueError, KeyError, TypeError):
+                    continue
+
+
+def main(argv=None):
+    """Launches tVIM from the command line. With '--remote', the files are
+    sent to the running tVIM instead, if there is one.
+
+    Parameters
+    ----------
+    argv: a list of strs, the arguments, defaults to sys.argv[1:].
+    """
+
+    parser = argparse.ArgumentParser(prog="tvim", description="A Text "
+                                     "Editor with basic Vim functionality.")
+    parser.add_argument("files", nargs="*", help="the files to edit")
+    parser.add_argument("--remote", action="store_true",
+                        help="open the files in the running tVIM, if any")
+    parser.add_argument("--servername", default=DEFAULT_SERVER,
+                        help="the name of the tVIM to open the files in")
+    args = parser.parse_args(argv)
+
+    if args.remote and send_files(args.files, args.servername):
+        return
+
+    # Only now is the editor imported, with Tk
+    from my_modules.MainModule import start_editor
+    start_editor(args.files, args.servername)
+
+
+if __name__ == "__main__":
+    main()
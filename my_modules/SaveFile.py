@@ -0,0 +1,153 @@
+"""This module saves the text of a tVIM window without blocking its window.
+
+A SaveJob takes a snapshot of the buffer, which only copies its list of
+pieces, and streams it in chunks to a temporary file next to the target on a
+worker thread, encoded back into the encoding and line endings the file was
+read with, and compressed again if it was compressed. The temporary file is
+fsynced and then renamed over the target, so a crash in the middle of a save
+leaves the old file untouched.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+# Import our modules
+from my_modules.FileFormat import FileFormat # Encodes the text to save
+from my_modules.Compression import compressed # Compresses the text to save
+from my_modules.Profiler import span # Times the saves for ':profile'
+
+
+# The number of chars written to the file at a time
+SAVE_CHUNK = 1 << 20
+
+# How often (in ms) the window checks on a save in progress
+SAVE_POLL = 100
+
+# New files get the usual permissions, temporary files are private
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class SaveJob():
+    """The SaveJob class writes a buffer to a file on its own thread.
+
+    Instance vars
+    -------------
+    filename: The path of the file being written.
+    format: The FileFormat the text is written in.
+    version: The version of the buffer being written.
+    total: The number of chars (or bytes, for a LargeFile) to write.
+    written: The number of chars (or bytes) written so far.
+    done: Whether the job has finished, successfully or not.
+    error: The exception that stopped the job, or None.
+    document: The Document being saved, to mark as saved once the job is
+              done, or None.
+    """
+
+    def __init__(self, buffer, filename, file_format=None, document=None):
+        """Takes a snapshot of a buffer and starts writing it to a file.
+
+        Parameters
+        ----------
+        self: SaveJob instance.
+        buffer: a TextBuffer or a LargeFile.
+        filename: a str, the path of the file to write.
+        file_format: the FileFormat to write a TextBuffer in, defaults to
+                     UTF-8 with Unix line endings. A LargeFile is written
+                     as the bytes it maps.
+        document: the Document buffer belongs to, defaults to None.
+        """
+
+        self.filename = os.path.abspath(filename)
+        self.format = file_format if file_format != None else FileFormat()
+        # A LargeFile is never edited, so it is its own snapshot
+        if hasattr(buffer, "map"):
+            self._snapshot = buffer
+        else:
+            self._snapshot = buffer.snapshot()
+        self.version = buffer.version
+        self.total = len(buffer)
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.document = document
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def progress(self):
+        """Returns the fraction of the buffer written so far."""
+
+        return self.written / self.total if self.total else 1.0
+
+    def wait(self):
+        """Blocks until the job has finished."""
+
+        self._thread.join()
+
+    def _chunks(self):
+        """Yields the bytes to write one chunk at a time, each with the
+        number of chars (or bytes) of the buffer it holds."""
+
+        if hasattr(self._snapshot, "map"):
+            for start in range(0, self.total, SAVE_CHUNK):
+                chunk = self._snapshot.map[start:start + SAVE_CHUNK]
+                yield len(chunk), chunk
+        else:
+            yield 0, self.format.bom
+            for chunk in self._snapshot.iter_chunks(size=SAVE_CHUNK):
+                yield len(chunk), self.format.encode(chunk)
+
+    @span("save")
+    def _run(self):
+        """Writes the temporary file and renames it over the target. Runs on
+        its own thread."""
+
+        folder, name = os.path.split(self.filename)
+        temp_name = None
+        try:
+            fd, temp_name = tempfile.mkstemp(prefix="." + name + ".",
+                                             suffix=".tmp", dir=folder)
+            with os.fdopen(fd, "wb") as file:
+                stream = compressed(file, self.format.compression)
+                for size, chunk in self._chunks():
+                    stream.write(chunk)
+                    self.written += size
+                # Ends the compressed stream, the file itself stays open
+                if stream is not file:
+                    stream.close()
+                # Make sure the data is on disk before the rename
+                file.flush()
+                os.fsync(file.fileno())
+
+            # Keep the permissions of the file being replaced
+            if os.path.exists(self.filename):
+                shutil.copymode(self.filename, temp_name)
+            else:
+                os.chmod(temp_name, 0o666 & ~UMASK)
+            os.replace(temp_name, self.filename)
+            self._sync_folder(folder)
+
+        except Exception as error:
+            self.error = error
+            if temp_name != None and os.path.exists(temp_name):
+                os.remove(temp_name)
+
+        finally:
+            self.done = True
+
+    def _sync_folder(self, folder):
+        """Flushes the rename to disk where the platform allows it."""
+
+        try:
+            fd = os.open(folder, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,440 @@
+"""This module searches the text of a tVIM window for the '?pattern' command.
+
+A pattern is compiled once with the re module and matched against the buffer
+in one pass, a chunk of whole lines at a time. The offsets of the matches are
+kept in sorted arrays, so 'n' and 'N' find the next match by bisection.
+
+While a '?pattern' is being typed, an IncrementalSearch highlights the
+matches in view at once and scans the rest of the buffer in slices scheduled
+with root.after, so typing is never blocked by the scan.
+
+Patterns are literal by default. Like Vim, a pattern starting with '\\v' is a
+regular expression, and a pattern containing '\\c' ignores case.
+"""
+
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+# The number of chars (or bytes, for a LargeFile) searched at a time
+SEARCH_CHUNK = 1 << 20
+
+# How long (in ms) an incremental search may scan before yielding to Tk
+SCAN_BUDGET = 8
+
+
+def compile_pattern(pattern, binary=False, encoding="utf-8"):
+    """Compiles a '?pattern' into a regular expression.
+
+    Parameters
+    ----------
+    pattern: a str, the pattern typed after '?'.
+    binary: a bool, whether to compile for bytes, defaults to False.
+    encoding: a str, the encoding of the bytes searched, defaults to
+              "utf-8".
+
+    Returns
+    -------
+    A compiled re pattern.
+    """
+
+    flags = re.MULTILINE
+    # '\c' anywhere in the pattern makes the search ignore case
+    if "\\c" in pattern:
+        pattern = pattern.replace("\\c", "")
+        flags |= re.IGNORECASE
+    # '\v' at the start makes the rest a regular expression
+    if pattern.startswith("\\v"):
+        pattern = pattern[2:]
+    else:
+        pattern = re.escape(pattern)
+
+    if binary:
+        try:
+            return re.compile(pattern.encode(encoding, "surrogateescape"),
+                              flags)
+        except UnicodeEncodeError:
+            # A char the file can not hold matches nowhere in it
+            return re.compile(b"(?!)")
+
+    return re.compile(pattern, flags)
+
+
+class SearchEngine():
+    """The SearchEngine class finds and remembers the matches of a pattern.
+
+    Instance vars
+    -------------
+    pattern: The last pattern searched for, as typed by the user.
+    regex: The compiled pattern.
+    starts: A sorted array with the offset of each match.
+    ends: An array with the offset after the end of each match.
+    complete: Whether the whole buffer has been scanned for pattern.
+    buffer: The buffer the matches were found in.
+    version: The version of buffer the matches were found in.
+    """
+
+    def __init__(self):
+        """Initializes a SearchEngine with no matches."""
+
+        self.pattern = None
+        self.regex = None
+        self.starts = array('q')
+        self.ends = array('q')
+        self.complete = False
+        self.buffer = None
+        self.version = None
+
+    def __len__(self):
+        """Returns the number of matches found."""
+
+        return len(self.starts)
+
+    def is_current(self, buffer, pattern):
+        """Returns whether the matches are for a pattern in the current text
+        of a buffer, which is False once the buffer has been edited.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        pattern: a str, the pattern typed after '?'.
+        """
+
+        return (pattern == self.pattern and buffer is self.buffer
+                and buffer.version == self.version)
+
+    def search(self, buffer, pattern):
+        """Finds every match of a pattern in a buffer.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        pattern: a str, the pattern typed after '?'.
+
+        Returns
+        -------
+        The number of matches found.
+        """
+
+        self.reset(buffer, pattern)
+
+        # One pass over the buffer, a chunk of whole lines at a time
+        start = 0
+        while start < len(buffer):
+            end = self.chunk_end(buffer, start)
+            self.scan(buffer, start, end)
+            start = end
+        self.complete = True
+
+        return len(self)
+
+    def reset(self, buffer, pattern):
+        """Compiles a pattern for a buffer and forgets the previous matches.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        pattern: a str, the pattern typed after '?'.
+        """
+
+        self.pattern = pattern
+        binary = hasattr(buffer, "map")
+        self.regex = compile_pattern(
+            pattern, binary, buffer.format.encoding if binary else "utf-8")
+        self.starts = array('q')
+        self.ends = array('q')
+        self.complete = False
+        self.buffer = buffer
+        self.version = buffer.version
+
+    def restore(self, buffer, pattern, starts, ends):
+        """Takes the matches of a pattern found by an earlier search of the
+        same text, without scanning the buffer.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        pattern: a str, the pattern typed after '?'.
+        starts: an array with the offset of each match.
+        ends: an array with the offset after the end of each match.
+
+        Returns
+        -------
+        The number of matches.
+        """
+
+        self.reset(buffer, pattern)
+        self.starts = array('q', starts)
+        self.ends = array('q', ends)
+        self.complete = True
+
+        return len(self)
+
+    def narrow(self, buffer, pattern):
+        """Searches for a pattern that extends the last one by scanning only
+        the previous matches, without scanning the whole buffer.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        pattern: a str, the new pattern typed after '?'.
+
+        Returns
+        -------
+        Whether the previous matches could be reused.
+        """
+
+        # Only a finished literal search with the same case rule can be
+        # narrowed, a regular expression may match differently once extended
+        old = self.pattern
+        if (not self.complete or not self.is_current(buffer, old)
+                or old.startswith("\\v")
+                or pattern.startswith("\\v")
+                or ("\\c" in old) != ("\\c" in pattern)
+                or not pattern.replace("\\c", "").startswith(
+                    old.replace("\\c", ""))):
+            return False
+
+        starts, ends = self.starts, self.ends
+        self.reset(buffer, pattern)
+        binary = hasattr(buffer, "map")
+        # The length of a match of the new pattern, which is literal
+        width = len(pattern.replace("\\c", ""))
+        if binary:
+            try:
+                width = len(pattern.replace("\\c", "").encode(
+                    buffer.format.encoding, "surrogateescape"))
+            except UnicodeEncodeError:
+                width = 0
+
+        # A match of the new pattern holds a match of the old one at its
+        # start. The scan for the old one skipped the starts inside each
+        # of its matches, so a new match starts within an old match, but
+        # not always at its start
+        free = 0
+        for start, end in zip(starts, ends):
+            pos = max(start, free)
+            limit = min(end - 1 + width, len(buffer))
+            if binary:
+                data, shift = buffer.map, 0
+            else:
+                data, shift = buffer.get_text(pos, limit), pos
+            while pos < end:
+                match = self.regex.search(data, pos - shift, limit - shift)
+                if match is None or match.start() + shift >= end:
+                    break
+                if match.end() == match.start():
+                    break
+                self.starts.append(match.start() + shift)
+                self.ends.append(match.end() + shift)
+                pos = free = match.end() + shift
+        self.complete = True
+
+        return True
+
+    def chunk_end(self, buffer, start):
+        """Returns where the chunk starting at an offset ends, just after a
+        newline so that no line is split between two chunks.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        start: an int, the offset where the chunk starts.
+        """
+
+        end = start + SEARCH_CHUNK
+        if end >= len(buffer):
+            return len(buffer)
+
+        return min(buffer.line_end(buffer.line_of(end)) + 1, len(buffer))
+
+    def scan(self, buffer, start, end):
+        """Adds the matches found between two offsets.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        buffer: a TextBuffer or a LargeFile.
+        start: an int, the offset where the scan starts.
+        end: an int, the offset where the scan ends.
+        """
+
+        # A LargeFile is searched in place, without decoding its bytes
+        if hasattr(buffer, "map"):
+            matches = self.regex.finditer(buffer.map, start, end)
+            shift = 0
+        else:
+            matches = self.regex.finditer(buffer.get_text(start, end))
+            shift = start
+
+        for match in matches:
+            # Empty matches cannot be highlighted or jumped to
+            if match.end() > match.start():
+                self.starts.append(match.start() + shift)
+                self.ends.append(match.end() + shift)
+
+    def next_match(self, offset):
+        """Returns the index of the first match after an offset, wrapping
+        around to the first match, or None if there are no matches.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        offset: an int, usually the offset of the cursor.
+        """
+
+        if not self.starts:
+            return None
+
+        return bisect_right(self.starts, offset) % len(self.starts)
+
+    def prev_match(self, offset):
+        """Returns the index of the last match before an offset, wrapping
+        around to the last match, or None if there are no matches.
+
+        Parameters
+        ----------
+        self: SearchEngine instance.
+        offset: an int, usually the offset of the cursor.
+        """
+
+        if not self.starts:
+            return None
+
+        return (bisect_left(self.starts, offset) - 1) % len(self.starts)
+
+
+class IncrementalSearch():
+    """The IncrementalSearch class updates the search highlights of a tVIM
+    window on every keystroke of a '?pattern' in cmd_line.
+
+    The matches in view are found and highlighted right away. The rest of the
+    buffer is then scanned in slices of at most SCAN_BUDGET ms, scheduled with
+    root.after, and a newer keystroke cancels the slices still pending.
+
+    Instance vars
+    -------------
+    tVIM: The tVIM instance being searched.
+    _job: The id of the pending root.after call, or None.
+    _next: The offset where the next slice of the scan starts.
+    """
+
+    def __init__(self, tVIM):
+        """Initializes an IncrementalSearch for a tVIM window.
+
+        Parameters
+        ----------
+        self: IncrementalSearch instance.
+        tVIM: tVIM instance.
+        """
+
+        self.tVIM = tVIM
+        self._job = None
+        self._next = 0
+
+    def update(self, pattern):
+        """Searches for a pattern that was just typed, replacing the scan of
+        the previous pattern.
+
+        Parameters
+        ----------
+        self: IncrementalSearch instance.
+        pattern: a str, the pattern typed after '?' so far.
+        """
+
+        engine = self.tVIM.search_engine
+        buffer = self.tVIM.buffer
+        if engine.is_current(buffer, pattern) and (engine.complete or self._job):
+            return
+        self.cancel()
+
+        # A pattern searched for before is taken from the document, an
+        # extended literal pattern only filters the matches it had
+        cached = self.tVIM.document.cached_search(pattern)
+        try:
+            if cached != None:
+                engine.restore(buffer, pattern, *cached)
+            elif not engine.narrow(buffer, pattern):
+                engine.reset(buffer, pattern)
+                self._next = 0
+                self._job = self.tVIM.root.after_idle(self._scan_slice)
+        except re.error:
+            # Regular expressions are often invalid halfway through typing
+            engine.pattern = None
+            engine.complete = False
+            self.tVIM.highlights.clear("highlight")
+            return
+
+        self._show_visible()
+
+    def cancel(self):
+        """Stops the scan that is in flight, if any."""
+
+        if self._job:
+            self.tVIM.root.after_cancel(self._job)
+            self._job = None
+
+    def finish(self):
+        """Scans whatever is left of the buffer right away."""
+
+        if self._job:
+            self.cancel()
+            self._scan_until(None)
+
+    def _show_visible(self):
+        """Highlights the matches of the lines in view, scanning those lines
+        on their own if the scan has not reached them yet."""
+
+        engine = self.tVIM.search_engine
+        view = self.tVIM.view
+        buffer = self.tVIM.buffer
+
+        bottom = view.offset("@0,%d" % self.tVIM.scroll_window.winfo_height())
+        if engine.complete or self._next > bottom:
+            self.tVIM.highlights.set_ranges("highlight", engine.starts,
+                                            engine.ends, engine.regex)
+            return
+
+        # Scan the visible lines into a separate engine, so the matches of
+        # the full scan stay in order
+        top = view.offset("@0,0")
+        visible = SearchEngine()
+        visible.regex = engine.regex
+        visible.scan(buffer, buffer.line_start(buffer.line_of(top)),
+                     buffer.line_end(buffer.line_of(bottom)))
+        self.tVIM.highlights.set_ranges("highlight", visible.starts,
+                                        visible.ends, engine.regex)
+
+    def _scan_slice(self):
+        """Scans the buffer for SCAN_BUDGET ms, then yields to Tk."""
+
+        self._job = None
+        deadline = time.perf_counter() + SCAN_BUDGET / 1000
+        if not self._scan_until(deadline):
+            self._job = self.tVIM.root.after(1, self._scan_slice)
+        else:
+            self._show_visible()
+
+    def _scan_until(self, deadline):
+        """Scans chunks until the deadline (a perf_counter time, or None for
+        no deadline). Returns whether the whole buffer was scanned."""
+
+        engine = self.tVIM.search_engine
+        buffer = self.tVIM.buffer
+        while self._next < len(buffer):
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            end = engine.chunk_end(buffer, self._next)
+            engine.scan(buffer, self._next, end)
+            self._next = end
+        engine.complete = True
+
+        return True
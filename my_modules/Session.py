@@ -0,0 +1,583 @@
+"""This module keeps track of the documents open in a tVIM session.
+
+Every tVIM window of a session shares one Tk interpreter, and every window
+shows one of the session's documents, switching between them with ':e',
+':bn', ':bp' and ':b'. A document that no window shows and that has no
+unsaved changes is unloaded, and read from disk again when it is shown, so
+only the files that are in use take up memory. What was learned about its
+file is kept in the FileCache meanwhile, and from one session to the next.
+
+Nothing in this module needs Tk, so a HeadlessEditor has a Session too.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# Import our modules
+from my_modules.TextBuffer import * # Holds the text of each document
+from my_modules.FileFormat import * # Keeps the encoding and line endings
+from my_modules.Compression import * # Reads and writes compressed files
+from my_modules.LargeFile import * # Opens huge files read-only
+from my_modules.FileCache import * # Remembers files between sessions
+from my_modules.UndoTree import * # Records edits for 'u' and Ctrl-R
+from my_modules.SyntaxHighlighter import * # Lexes the code in view
+from my_modules.FileIndex import * # Finds files for ':find'
+from my_modules.Grep import * # Searches many files for ':vimgrep'
+from my_modules.Profiler import * # Times the hot paths for ':profile'
+
+
+# How often (in ms) a window checks on a file being read
+LOAD_POLL = 100
+
+
+@span("open")
+def read_buffer(filename, job=None, entry=None):
+    """Reads a file into a TextBuffer, or maps it into a LargeFile if it is
+    huge. A compressed file is decompressed as it is decoded. A file that
+    does not exist yet reads as an empty TextBuffer.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file.
+    job: the LoadJob reading the file, defaults to None.
+    entry: the CacheEntry of the file, whose format and line index are
+           used instead of finding them again, defaults to None.
+
+    Returns
+    -------
+    A (buffer, file_format) pair, file_format being the FileFormat to save
+    the buffer in.
+    """
+
+    if not os.path.exists(filename):
+        return TextBuffer(), FileFormat()
+
+    compression = sniff_compression(filename)
+    with open(filename, "rb") as raw:
+        if job != None:
+            job.file = raw
+            # A cancel that came before the file was open
+            if job.cancelled:
+                raw.close()
+
+        def open_file():
+            raw.seek(0)
+            return decompressed(raw, compression)
+
+        if entry != None:
+            file_format = entry.format
+        else:
+            file_format = sniff_format(open_file().read(SNIFF_SIZE))
+            file_format.compression = compression
+        # A huge file in UTF-16 is decoded after all, its lines can not be
+        # found in its bytes, and neither can the ones of a compressed file
+        if (compression == None and file_format.byte_lines()
+                and os.path.getsize(filename) >= LARGE_FILE_SIZE):
+            index = None
+            if entry != None and entry.newline_total != None:
+                index = (entry.lines, entry.newline_total)
+            return LargeFile(filename, file_format, index), file_format
+
+        text, file_format = read_text(open_file, file_format)
+        newlines = None
+        if (entry != None and file_format is entry.format
+                and len(text) == entry.length):
+            newlines = entry.lines
+
+        return TextBuffer(text, newlines), file_format
+
+
+class LoadJob():
+    """The LoadJob class reads a file with read_buffer on its own thread, so
+    a window stays live while a big compressed file is decompressed.
+
+    Instance vars
+    -------------
+    filename: The path of the file being read.
+    total: The size of the file on disk, in bytes.
+    file: The file object reading the file on disk, or None.
+    result: The (buffer, file_format) pair read, or None.
+    done: Whether the job has finished, successfully or not.
+    cancelled: Whether the job was cancelled.
+    error: The exception that stopped the job, or None.
+    """
+
+    def __init__(self, filename):
+        """Starts reading a file.
+
+        Parameters
+        ----------
+        self: LoadJob instance.
+        filename: a str, the path of the file.
+        """
+
+        self.filename = filename
+        self.total = os.path.getsize(filename)
+        self.file = None
+        self.result = None
+        self.done = False
+        self.cancelled = False
+        self.error = None
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def progress(self):
+        """Returns the fraction of the file on disk read so far."""
+
+        file = self.file
+        if self.done or not self.total:
+            return 1.0
+        try:
+            return file.tell() / self.total if file != None else 0.0
+        except ValueError:
+            return 1.0
+
+    def wait(self):
+        """Blocks until the job has finished."""
+
+        self._thread.join()
+
+    def cancel(self):
+        """Stops reading the file and drops what was read. Closing the file
+        makes the next read of the worker thread fail, which ends the job."""
+
+        self.cancelled = True
+        self.result = None
+        if self.file != None:
+            self.file.close()
+
+    def _run(self):
+        """Reads the file. Runs on its own thread."""
+
+        try:
+            self.result = read_buffer(self.filename, self,
+                                      load_entry(self.filename))
+        except Exception as error:
+            if not self.cancelled:
+                self.error = error
+        finally:
+            if self.cancelled:
+                self.result = None
+            self.done = True
+
+
+class Document():
+    """The Document class is one buffer of a session: a file, or a text not
+    saved anywhere yet, along with its undo history and swap file.
+
+    Instance vars
+    -------------
+    number: The number of the document in the session, as shown by ':ls'.
+    filename: The absolute path of the file, or None.
+    buffer: The TextBuffer (or LargeFile) holding the text, or None while
+            the document is unloaded.
+    undo_tree: The UndoTree of buffer, or None while unloaded.
+    swap: The SwapFile logging the edits of buffer, or None.
+    syntax: The SyntaxHighlighter of buffer, or None if the language of the
+            file is unknown.
+    format: The FileFormat the document is read and saved in.
+    cursor: The offset of the cursor when the document was last shown.
+    windows: The number of windows showing the document.
+    saved_version: The version of buffer that matches the file on disk.
+    key: The file_key of the file when buffer was read from it or saved to
+         it, or None.
+    searches: An OrderedDict from pattern to the (starts, ends) of its
+              matches in buffer, for the last searches made in it.
+    searches_version: The version of buffer the searches were made in.
+    followed: The (version, offset) of buffer when following its file last
+              stopped, offset being the bytes of the file read into it, or
+              None.
+    """
+
+    def __init__(self, number, filename=None, buffer=None):
+        """Initializes a Document, unloaded unless a buffer is given.
+
+        Parameters
+        ----------
+        self: Document instance.
+        number: an int, the number of the document in the session.
+        filename: a str, the path of the file, defaults to None.
+        buffer: a TextBuffer or LargeFile, defaults to None.
+        """
+
+        self.number = number
+        self.filename = os.path.abspath(filename) if filename else None
+        self.buffer = None
+        self.undo_tree = None
+        self.swap = None
+        self.syntax = None
+        self.format = FileFormat()
+        self.cursor = 0
+        self.windows = 0
+        self.saved_version = 0
+        self.key = None
+        self.searches = OrderedDict()
+        self.searches_version = None
+        self.followed = None
+        if buffer != None:
+            self._set_buffer(buffer, getattr(buffer, "format", self.format))
+
+    def name(self):
+        """Returns the name of the document as shown to the user."""
+
+        return self.filename if self.filename != None else "[No Name]"
+
+    def loaded(self):
+        """Returns whether the text of the document is in memory."""
+
+        return self.buffer != None
+
+    def modified(self):
+        """Returns whether the document has changes that are not saved."""
+
+        return self.loaded() and (self.buffer.version != self.saved_version
+                                  or self.filename == None
+                                  and len(self.buffer) > 0)
+
+    def load(self, result=None):
+        """Reads the document from disk unless it is loaded already.
+
+        Parameters
+        ----------
+        self: Document instance.
+        result: the (buffer, file_format) pair of a LoadJob that read the
+                file already, defaults to None.
+        """
+
+        if self.buffer != None:
+            return
+        self.key = file_key(self.filename)
+        entry = load_entry(self.filename)
+        self._set_buffer(*(result or read_buffer(self.filename, None, entry)))
+        # Go back where the cursor was, with the searches made in the file
+        if entry != None and len(self.buffer) == entry.length:
+            self.cursor = min(entry.cursor, len(self.buffer))
+            self.searches = entry.searches
+            self.searches_version = self.buffer.version
+
+    def unload(self):
+        """Drops the text, undo history and swap file of the document,
+        saving what was learned about its file in the FileCache."""
+
+        self.save_cache()
+        if self.swap != None:
+            self.swap.close()
+            self.swap = None
+        if self.syntax != None:
+            self.syntax.close()
+            self.syntax = None
+        if hasattr(self.buffer, "map"):
+            self.buffer.close()
+        self.buffer = None
+        self.undo_tree = None
+        self.followed = None
+
+    def saved(self, filename, version):
+        """Records that a version of the document was saved to a file.
+
+        Parameters
+        ----------
+        self: Document instance.
+        filename: a str, the path the document was saved to.
+        version: an int, the version of buffer that was saved.
+        """
+
+        self.filename = os.path.abspath(filename)
+        self.saved_version = version
+        self.key = file_key(filename)
+        if self.swap != None:
+            self.swap.saved(filename, version)
+        # Saving as 'name.py' starts highlighting the code
+        if self.syntax == None and self.loaded():
+            self._start_syntax()
+
+    def cached_search(self, pattern):
+        """Returns the (starts, ends) of the matches of a pattern in the
+        buffer, if it was searched for since the last edit, or None.
+
+        Parameters
+        ----------
+        self: Document instance.
+        pattern: a str, the pattern typed after '?'.
+        """
+
+        if (self.searches_version != self.buffer.version
+                or pattern not in self.searches):
+            return None
+        self.searches.move_to_end(pattern)
+
+        return self.searches[pattern]
+
+    def remember_search(self, pattern, starts, ends):
+        """Keeps the matches of a search of the whole buffer, for
+        cached_search() and the next session.
+
+        Parameters
+        ----------
+        self: Document instance.
+        pattern: a str, the pattern typed after '?'.
+        starts: an array with the offset of each match.
+        ends: an array with the offset after the end of each match.
+        """
+
+        if self.searches_version != self.buffer.version:
+            self.searches = OrderedDict()
+            self.searches_version = self.buffer.version
+        remember_search(self.searches, pattern, starts, ends)
+
+    def save_cache(self):
+        """Saves the format, line index, cursor and searches of the document
+        in the FileCache, if it is loaded and matches its file."""
+
+        buffer = self.buffer
+        if (self.filename == None or self.key == None or not self.loaded()
+                or self.modified() or not getattr(buffer, "done", True)):
+            return
+
+        entry = CacheEntry(self.key, self.format, len(buffer),
+                           min(self.cursor, len(buffer)))
+        if hasattr(buffer, "map"):
+            entry.lines = buffer.checkpoints
+            entry.newline_total = buffer.line_count() - 1
+        else:
+            entry.lines = buffer.line_index()
+        # Searches made since the last save hold the offsets of a text
+        # that matches the file again
+        if self.searches_version == buffer.version:
+            entry.searches = self.searches
+        save_entry(entry)
+
+    def _set_buffer(self, buffer, file_format):
+        """Makes a buffer the text of the document, with a new history, and
+        the format it is saved in."""
+
+        self.buffer = buffer
+        self.format = file_format
+        self.saved_version = buffer.version
+        self.undo_tree = UndoTree(buffer)
+        self._start_syntax()
+
+    def _start_syntax(self):
+        """Starts highlighting the buffer if its language is known. A
+        LargeFile is never highlighted, it would have to be lexed from the
+        start to show its last page."""
+
+        lexer = lexer_for(self.filename)
+        if lexer != None and hasattr(self.buffer, "listeners"):
+            self.syntax = SyntaxHighlighter(self.buffer, lexer)
+
+
+class Session():
+    """The Session class holds the documents and windows of a session.
+
+    Instance vars
+    -------------
+    documents: A list of the Documents, in the order they were opened.
+    windows: A list of the windows (tVIM or HeadlessEditor instances).
+    registers: A dict from register name to a (text, linewise) pair,
+               shared by every window like Vim's registers.
+    indexes: A dict from folder to the FileIndex of its files.
+    quickfix: The QuickFix list filled by ':vimgrep'.
+    root: The Tk root every window of the session is a Toplevel of, or
+          None for a session without Tk.
+    server: The RemoteServer taking files from '--remote' launches, or
+            None.
+    profiler: The Profiler of the last ':profile start', or None.
+    running: Whether the mainloop of root is running.
+    """
+
+    def __init__(self, root=None):
+        """Initializes an empty Session.
+
+        Parameters
+        ----------
+        self: Session instance.
+        root: a Tk root to host the windows, defaults to None.
+        """
+
+        self.documents = []
+        self.windows = []
+        self.registers = {}
+        self.indexes = {}
+        self.quickfix = QuickFix()
+        self.root = root
+        self.server = None
+        self.profiler = None
+        self.running = False
+        self._next_number = 1
+
+    def open(self, filename=None, contents=None, large_file=None):
+        """Returns the document of a file, adding it to the session unless
+        it is open already. Without a filename, adds a new document.
+
+        Parameters
+        ----------
+        self: Session instance.
+        filename: a str, the path of the file, defaults to None.
+        contents: a str, the text of a new document, defaults to None.
+        large_file: a LargeFile opened already, defaults to None.
+        """
+
+        if large_file != None:
+            filename = large_file.filename
+        if filename and contents == None:
+            document = self.find_file(filename)
+            if document != None:
+                if large_file != None and large_file is not document.buffer:
+                    large_file.close()
+                return document
+
+        buffer = large_file
+        if contents != None:
+            buffer = TextBuffer(contents)
+        elif filename == None:
+            buffer = TextBuffer()
+        document = Document(self._next_number, filename, buffer)
+        self._next_number += 1
+        self.documents.append(document)
+
+        return document
+
+    def file_index(self, folder):
+        """Returns the index of the files under a folder, made on first use.
+        A walk is started each time, so files added since are found, but
+        only folders that changed are read again.
+
+        Parameters
+        ----------
+        self: Session instance.
+        folder: a str, the path of the folder.
+        """
+
+        folder = os.path.abspath(folder)
+        if folder in self.indexes:
+            self.indexes[folder].refresh()
+        else:
+            self.indexes[folder] = FileIndex(folder)
+
+        return self.indexes[folder]
+
+    def find_file(self, filename):
+        """Returns the document of a file, or None if it is not open."""
+
+        path = os.path.abspath(filename)
+        for document in self.documents:
+            if document.filename == path:
+                return document
+
+        return None
+
+    def find_number(self, number):
+        """Returns the document with a number, or None."""
+
+        for document in self.documents:
+            if document.number == number:
+                return document
+
+        return None
+
+    def next_document(self, document, step):
+        """Returns the document step places after another one, wrapping
+        around the ends of the list like ':bn' and ':bp'.
+
+        Parameters
+        ----------
+        self: Session instance.
+        document: a Document of the session.
+        step: an int, 1 for the next document and -1 for the previous one.
+        """
+
+        index = self.documents.index(document)
+
+        return self.documents[(index + step) % len(self.documents)]
+
+    def show(self, window, document):
+        """Makes a window show a document, loading it if needed, and
+        releases the document it showed before.
+
+        Parameters
+        ----------
+        self: Session instance.
+        window: a tVIM or HeadlessEditor instance.
+        document: a Document of the session.
+        """
+
+        document.load()
+        old = window.document
+        window.document = document
+        document.windows += 1
+        window.buffer = document.buffer
+        window.undo_tree = document.undo_tree
+        window.filename = document.filename
+        if old != None:
+            self.release(old)
+
+    def release(self, document):
+        """Takes note that a window stopped showing a document, and unloads
+        the document if no window shows it and it can be read again."""
+
+        document.windows -= 1
+        if (document.windows == 0 and document.filename != None
+                and not document.modified()):
+            document.unload()
+
+    def window_closed(self, window):
+        """Removes a closed window from the session. Once the last window
+        is closed, every document is unloaded and the grep workers stop.
+
+        Parameters
+        ----------
+        self: Session instance.
+        window: a tVIM or HeadlessEditor instance.
+        """
+
+        if window in self.windows:
+            self.windows.remove(window)
+        if window.document != None:
+            self.release(window.document)
+            window.document = None
+        if not self.windows:
+            for document in self.documents:
+                document.unload()
+            self.documents = []
+            if self.quickfix.job != None:
+                self.quickfix.job.cancel()
+            close_pool()
+
+    def listing(self, current=None):
+        """Returns the list of documents shown by ':ls', one per line. Like
+        Vim, '%' marks the current document, 'a' the ones shown in a window,
+        'h' the hidden ones still loaded and '+' the modified ones.
+
+        Parameters
+        ----------
+        self: Session instance.
+        current: the Document of the window asking, defaults to None.
+        """
+
+        lines = []
+        for document in self.documents:
+            flags = "%" if document is current else " "
+            if document.windows:
+                flags += "a"
+            elif document.loaded():
+                flags += "h"
+            else:
+                flags += " "
+            flags += "+" if document.modified() else " "
+            lines.append('%3d %s "%s"' % (document.number, flags,
+                                          document.name()))
+
+        return "\n".join(lines)
+
+    def run(self):
+        """Runs the mainloop of root, unless it is running already."""
+
+        if self.root != None and not self.running:
+            self.running = True
+            try:
+                self.root.mainloop()
+            finally:
+                self.running = False
@@ -2,6 +2,12 @@
 
 QUIT_QUESTION = "Are you sure you want to quit?"
 
+RECOVER_QUESTION = "A swap file with unsaved changes was found, left behind \
+by a tVIM window that did not close properly.\nRecover the changes?"
+
+RECOVER_CHANGED_WARNING = "\nThe file has been changed since, so the \
+recovered text may be garbled."
+
 ABOUT_MESSAGE = "A Text Editor with basic Vim functionality.\n Implemented by \
 Titan Ngo."
 
@@ -13,15 +19,106 @@ G    -> move cursor to end of file\n\
 o    -> create a new line below the cursor and enter insert \t\tmode\n\
 O    -> create a new line below the cursor and enter insert \t\tmode\n\
 i    -> enter insert mode at the cursor\n\
+a    -> enter insert mode after the cursor\n\
 I    -> enter insert mode at the beginning of this line\n\
 A    -> enter insert mode at the end of this line\n\
+x    -> delete the char under the cursor\n\
+p/P  -> paste after/before the cursor\n\
+u    -> undo the last change\n\
+qa ... q -> record the keys typed into register 'a'\n\
+@a   -> replay the keys in register 'a', @@ the last one\n\
+Ctrl-R -> redo the last change that was undone\n\
+h j k l 0 $ w b -> move the cursor\n\
+d/y/c + motion -> delete/copy/change up to the motion \t\t(dd, yy and cc work on lines)\n\
+5j, 3dd, 10G -> a count repeats a command or picks a line\n\
+:123 -> move cursor to line 123\n\
 :w   -> save as\n\
 :wq  -> save as and quit\n\
 :q   -> quit without saving\n\
-?pattern  -> search for the 'pattern' in this file"            
+:q!  -> quit without saving or asking\n\
+:e file -> edit another file in this window\n\
+:bn/:bp -> show the next/previous open file\n\
+:b N -> show the open file numbered N\n\
+:ls  -> list the open files\n\
+:find name -> open the file whose path best matches \t\t'name'\n\
+:vimgrep /pattern/ files -> search 'files' (like **/*.py) \t\tfor the 'pattern'\n\
+:cn/:cp -> jump to the next/previous hit of :vimgrep\n\
+:%!cmd -> replace the file with what 'cmd' prints when \t\tgiven it\n\
+:5,9!cmd -> the same for lines 5 to 9, Ctrl-C stops 'cmd'\n\
+:copen/:cclose -> show/hide the hits of :vimgrep\n\
+:profile start/stop -> start/stop timing commands and Tk \t\tcalls\n\
+:profile -> show the p50/p99 time of each command\n\
+:profile dump file.json -> save the times as a Chrome \t\ttrace\n\
+:follow -> append what is written to the end of this \t\tfile, like tail -f\n\
+:follow 1000 -> the same, keeping only the last 1000 lines\n\
+:follow stop -> stop following, the file can be edited again\n\
+n    -> move to the next match of the last search\n\
+N    -> move to the previous match of the last search\n\
+?pattern  -> search for the 'pattern' in this file\n\
+?\\vpattern -> search for the regular expression 'pattern'\n\
+?pattern\\c -> search for the 'pattern', ignoring case"            
 
 CMD_ERROR = "Command not recognized."
 
 ERROR_TITLE = "Oh no, an error!"
 
+READ_ONLY_ERROR = "This file is too large to edit, it was opened read-only."
+
+SAVE_ERROR = "The file could not be saved."
+
+PATTERN_ERROR = "The pattern is not a valid regular expression."
+
 PATTERN_NOT_FOUND = "No patterns in this file match the specified pattern."
+
+NO_FILE_NAME_ERROR = "This file has no name yet, use ':w filename'."
+
+OPEN_ERROR = "The file could not be opened."
+
+NO_BUFFER_ERROR = "No open file has that number, see ':ls'."
+
+NO_MATCH_ERROR = "No file under this folder matches."
+
+NO_GREP_PATTERN_ERROR = "Use ':vimgrep /pattern/ files'."
+
+NO_GREP_FILES_ERROR = "No files match the file names given to ':vimgrep'."
+
+NO_GREP_MATCH = "No patterns in these files match the specified pattern."
+
+GREP_ERROR = "The files could not be searched."
+
+NO_MORE_HITS_ERROR = "There are no more hits, run ':vimgrep' again."
+
+NO_FILTER_COMMAND_ERROR = "Type a command after '!', like ':%!sort'."
+
+FILTER_ERROR = "The command failed, the text was left as it was."
+
+FILTER_CHANGED_ERROR = "The text changed while it was being filtered, the \
+output was dropped."
+
+FILTER_RUNNING_ERROR = "A filter is running already, Ctrl-C stops it."
+
+FILTER_APPLYING_ERROR = "The output of the filter is being put in the \
+text, wait for it to finish."
+
+NO_PROFILE_ERROR = "Nothing was profiled, run ':profile start' first."
+
+PROFILE_USAGE_ERROR = "Use ':profile start', ':profile stop', ':profile' or \
+':profile dump file.json'."
+
+PROFILE_DUMP_ERROR = "The trace could not be saved."
+
+NO_MACRO_ERROR = "This register holds no keys, record some with 'q' first."
+
+FOLLOW_USAGE_ERROR = "Use ':follow', ':follow 1000' to keep only the last \
+1000 lines, or ':follow stop'."
+
+FOLLOW_EDIT_ERROR = "This file is being followed, use ':follow stop' to \
+edit it."
+
+FOLLOW_FILE_ERROR = "Only a file saved on disk, not compressed and not too \
+large to edit, can be followed."
+
+FOLLOW_MODIFIED_ERROR = "This file has unsaved changes, save them before \
+following it."
+
+FOLLOW_ERROR = "The file could not be followed any more."
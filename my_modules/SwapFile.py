@@ -0,0 +1,407 @@
+"""This module keeps a swap file for each tVIM window, so unsaved work can be
+recovered after a crash.
+
+Like Vim's, the swap file sits next to the file being edited as
+'.name.swp' (windows with no file keep theirs in SWAP_FOLDER). It starts with
+a header describing the file on disk, followed by an append-only log of the
+edits made since then. Each record is length-prefixed and checksummed, so a
+record torn by a crash is simply where the replay stops.
+
+An edit only adds a tuple to a list, so the cost per keystroke does not grow
+with the document. A worker thread writes the list to the log every
+SWAP_INTERVAL ms. Once the log outgrows the document it is compacted: it is
+rewritten as one copy of the text, which new edits are logged after.
+"""
+
+import glob
+import json
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+
+# The swap file of a window with no file is kept in this folder
+SWAP_FOLDER = os.path.join(os.path.expanduser("~"), ".tvim", "swap")
+
+# How often (in ms) the worker thread writes the edits to the log
+SWAP_INTERVAL = 1000
+
+# The log is compacted once it holds more chars than the document, but
+# never before it holds this many
+SWAP_COMPACT = 1 << 20
+
+# What a record costs on top of its text, counted towards compaction
+RECORD_COST = 25
+
+# The size of the records the text is written in when the log is compacted
+TEXT_CHUNK = 1 << 20
+
+# The first bytes of every swap file
+SWAP_MAGIC = b"tVIMswp1"
+
+# The suffixes tried in turn when a swap file is in use by another window
+SWAP_SUFFIXES = ("swp", "swo", "swn", "swm")
+
+# A record is its length and checksum, then a kind, an offset, the number of
+# chars deleted there and the UTF-8 text inserted there
+RECORD_HEAD = struct.Struct("<II")
+RECORD_BODY = struct.Struct("<BqQ")
+EDIT, CLEAR = 0, 1
+
+
+def swap_name(filename, suffix="swp"):
+    """Returns the path of the swap file of a file, or of a new window with
+    no file if filename is None.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file being edited, or None.
+    suffix: a str, one of SWAP_SUFFIXES, defaults to "swp".
+    """
+
+    if filename == None:
+        return os.path.join(SWAP_FOLDER, "untitled-%d-%d.%s" % (
+            os.getpid(), id(object()), suffix))
+
+    folder, name = os.path.split(os.path.abspath(filename))
+
+    return os.path.join(folder, ".%s.%s" % (name, suffix))
+
+
+def process_alive(pid):
+    """Returns whether a process is running. Only POSIX can tell, elsewhere
+    every other process is taken to have stopped."""
+
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def read_header(path):
+    """Returns the header of a swap file as a dict, or None if the file is
+    not a swap file."""
+
+    try:
+        with open(path, "rb") as file:
+            if file.read(len(SWAP_MAGIC)) != SWAP_MAGIC:
+                return None
+            size, = struct.unpack("<I", file.read(4))
+            return json.loads(file.read(size).decode("utf-8"))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def orphaned_swaps(filename):
+    """Returns the swap files left behind by windows that are gone, newest
+    first. For a filename of None, those of windows with no file.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file being opened, or None.
+    """
+
+    if filename == None:
+        paths = glob.glob(os.path.join(SWAP_FOLDER, "untitled-*"))
+    else:
+        paths = [swap_name(filename, suffix) for suffix in SWAP_SUFFIXES]
+
+    orphans = []
+    for path in paths:
+        header = read_header(path)
+        if header != None and not process_alive(header["pid"]):
+            orphans.append(path)
+
+    return sorted(orphans, key=os.path.getmtime, reverse=True)
+
+
+def free_swap_name(filename):
+    """Returns the first swap file name of a file that no running window is
+    using, or None if they are all in use."""
+
+    if filename == None:
+        return swap_name(None)
+
+    for suffix in SWAP_SUFFIXES:
+        path = swap_name(filename, suffix)
+        header = read_header(path)
+        if header == None or not process_alive(header["pid"]):
+            return path
+
+    return None
+
+
+def recover_swap(path, buffer):
+    """Replays the log of a swap file onto a buffer holding the file it was
+    made for. A record torn by a crash ends the replay.
+
+    Parameters
+    ----------
+    path: a str, the path of the swap file.
+    buffer: a TextBuffer with the text of the file on disk.
+
+    Returns
+    -------
+    The number of records replayed.
+    """
+
+    count = 0
+    with open(path, "rb") as file:
+        file.read(len(SWAP_MAGIC))
+        size, = struct.unpack("<I", file.read(4))
+        file.seek(size, 1)
+
+        while True:
+            head = file.read(RECORD_HEAD.size)
+            if len(head) < RECORD_HEAD.size:
+                break
+            length, checksum = RECORD_HEAD.unpack(head)
+            body = file.read(length)
+            if len(body) < length or zlib.crc32(body) != checksum:
+                break
+
+            kind, offset, deleted = RECORD_BODY.unpack_from(body)
+            text = body[RECORD_BODY.size:].decode("utf-8", "surrogatepass")
+            if kind == CLEAR:
+                buffer.delete(0, len(buffer))
+            else:
+                buffer.delete(offset, deleted)
+                buffer.insert(offset, text)
+            count += 1
+
+    return count
+
+
+def encode_record(kind, offset, deleted, text):
+    """Returns the bytes of one record of the log."""
+
+    body = (RECORD_BODY.pack(kind, offset, deleted)
+            + text.encode("utf-8", "surrogatepass"))
+
+    return RECORD_HEAD.pack(len(body), zlib.crc32(body)) + body
+
+
+class SwapFile():
+    """The SwapFile class logs the edits of a TextBuffer to a swap file on a
+    worker thread.
+
+    Instance vars
+    -------------
+    buffer: The TextBuffer whose edits are logged.
+    path: The path of the swap file.
+    filename: The path of the file being edited, or None.
+    error: The last exception raised while writing the swap file, or None.
+    _pending: A list of the records not written yet, each an (offset,
+              deleted, inserted) edit or a (path, header, snapshot)
+              rewrite of the whole swap file.
+    _logged: The number of chars (plus RECORD_COST per record) of the edits
+             logged since the swap file was last rewritten.
+    _file: The swap file, open for appending, or None.
+    """
+
+    def __init__(self, buffer, path, filename=None, modified=False):
+        """Creates the swap file of a buffer and starts logging its edits.
+
+        Parameters
+        ----------
+        self: SwapFile instance.
+        buffer: a TextBuffer.
+        path: a str, the path of the swap file, from free_swap_name.
+        filename: a str, the path of the file being edited, defaults to None.
+        modified: a bool, whether buffer no longer matches the file on disk,
+                  like after a recovery, defaults to False.
+
+        Raises
+        ------
+        OSError if the swap file can not be created, like in a folder that
+        can not be written.
+        """
+
+        self.buffer = buffer
+        self.path = None
+        self.filename = filename
+        self.error = None
+        self._pending = []
+        self._logged = 0
+        self._file = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+
+        self._rewrite(path, modified)
+        buffer.listeners.append(self.record)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, offset, deleted, inserted):
+        """Queues an edit of the buffer. Called by the buffer on every edit.
+
+        Parameters
+        ----------
+        self: SwapFile instance.
+        offset: an int, where the edit was made.
+        deleted: the str that was deleted there.
+        inserted: the str that was inserted there.
+        """
+
+        with self._lock:
+            self._pending.append((offset, len(deleted), inserted))
+        self._logged += len(inserted) + RECORD_COST
+
+        # Rewriting the log costs as much as the text, so it is only done
+        # once the log has grown at least as large
+        if self._logged > max(SWAP_COMPACT, len(self.buffer)):
+            self._rewrite(self.path, True)
+
+    def saved(self, filename, version):
+        """Starts a new log once the buffer has been saved, moving the swap
+        file along if the file was saved under a new name.
+
+        Parameters
+        ----------
+        self: SwapFile instance.
+        filename: a str, the path the buffer was saved to.
+        version: an int, the version of the buffer that was saved.
+        """
+
+        path = self.path
+        if os.path.abspath(filename) != self.filename:
+            path = free_swap_name(filename) or self.path
+        self.filename = os.path.abspath(filename)
+        # Edits made while the file was being written are not in it
+        self._rewrite(path, self.buffer.version != version)
+
+    def flush(self):
+        """Writes the queued records right away."""
+
+        self._write_pending()
+
+    def close(self, delete=True):
+        """Stops logging, and deletes the swap file unless told otherwise.
+
+        Parameters
+        ----------
+        self: SwapFile instance.
+        delete: a bool, whether to delete the swap file, defaults to True.
+        """
+
+        if self.record in self.buffer.listeners:
+            self.buffer.listeners.remove(self.record)
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._write_pending()
+        if self._file != None:
+            self._file.close()
+            self._file = None
+        if delete and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _rewrite(self, path, modified):
+        """Queues a rewrite of the swap file, with the file on disk as its
+        base and the text of the buffer logged if it differs from it."""
+
+        header = {"filename": self.filename, "pid": os.getpid()}
+        if self.filename != None and os.path.exists(self.filename):
+            stat = os.stat(self.filename)
+            header["size"] = stat.st_size
+            header["mtime"] = stat.st_mtime_ns
+        # Untitled windows have no file, so their text is always logged
+        if self.filename == None:
+            modified = True
+        snapshot = self.buffer.snapshot() if modified else None
+
+        with self._lock:
+            self._pending.append((path, header, snapshot))
+        self._logged = 0
+        if self.path == None:
+            self.path = path
+            self._write_pending()
+            # With no log open, no edit could be written after this
+            if self._file == None:
+                raise self.error
+        self.path = path
+
+    def _run(self):
+        """Writes the queued records every SWAP_INTERVAL ms. Runs on its own
+        thread."""
+
+        while not self._closed:
+            self._wake.wait(SWAP_INTERVAL / 1000)
+            self._write_pending()
+
+    def _write_pending(self):
+        """Writes the queued records to the swap file and syncs it."""
+
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            try:
+                chunks = []
+                for record in pending:
+                    if isinstance(record[0], str):
+                        self._write_chunks(chunks)
+                        self._start_log(*record)
+                    else:
+                        chunks.append(encode_record(EDIT, *record))
+                self._write_chunks(chunks)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except (OSError, ValueError) as error:
+                self.error = error
+
+    def _write_chunks(self, chunks):
+        """Appends encoded records to the swap file."""
+
+        if chunks:
+            self._file.write(b"".join(chunks))
+            chunks.clear()
+
+    def _start_log(self, path, header, snapshot):
+        """Replaces the swap file with a new one holding a header and, if
+        given, the text of a snapshot. Runs on the worker thread."""
+
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=".tvim-", suffix=".tmp",
+                                         dir=folder)
+        file = os.fdopen(fd, "wb")
+        try:
+            meta = json.dumps(header).encode("utf-8")
+            file.write(SWAP_MAGIC + struct.pack("<I", len(meta)) + meta)
+            if snapshot != None:
+                file.write(encode_record(CLEAR, 0, 0, ""))
+                offset = 0
+                for chunk in snapshot.iter_chunks(size=TEXT_CHUNK):
+                    file.write(encode_record(EDIT, offset, 0, chunk))
+                    offset += len(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+            os.replace(temp_name, path)
+        except BaseException:
+            file.close()
+            os.remove(temp_name)
+            raise
+
+        # The old swap file is gone once the new one is in place
+        if self._file != None:
+            old_path = self._file.name
+            self._file.close()
+            if old_path != path and os.path.exists(old_path):
+                os.remove(old_path)
+        file.close()
+        self._file = open(path, "ab")
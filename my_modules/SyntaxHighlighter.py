@@ -0,0 +1,306 @@
+"""This module highlights the syntax of the code in view.
+
+A RegexLexer splits one line at a time into tokens, and the state it ends a
+line in (like being inside a triple-quoted string) is all it needs to carry
+on with the next line. Its rules are laid out like the token table of a
+Pygments RegexLexer: each state is a list of (pattern, kind, next state).
+
+A SyntaxHighlighter caches that state for every line of a buffer. After an
+edit, lines are lexed again from the edited one only until a line ends in the
+same state as before, since the lines after it can not have changed. Lexing
+is lazy too: lines are only lexed up to the end of the view, and the
+HighlightManager only tags the tokens in view.
+"""
+
+import builtins
+import keyword
+import os
+import re
+from bisect import bisect_left, bisect_right
+
+
+# The color of each kind of token, tagged as "syntax_" + kind
+SYNTAX_COLORS = {
+    "keyword": "#0000c0",
+    "builtin": "#7030a0",
+    "definition": "#006080",
+    "decorator": "#a05000",
+    "string": "#008000",
+    "number": "#c00000",
+    "comment": "#808080",
+}
+SYNTAX_TAGS = tuple("syntax_" + kind for kind in SYNTAX_COLORS)
+
+# The lines are read from the buffer in blocks, from this many lines up to
+# LEX_BLOCK, so lexing a few lines after an edit reads a few lines
+FIRST_BLOCK = 16
+LEX_BLOCK = 4096
+
+
+def words(names):
+    """Returns a pattern matching any of a list of whole words."""
+
+    return r'\b(?:%s)\b' % "|".join(sorted(names, key=len, reverse=True))
+
+
+class RegexLexer():
+    """The RegexLexer class splits lines into tokens with a table of regular
+    expressions per state.
+
+    Instance vars
+    -------------
+    name: The name of the language.
+    _rules: The dict of rules the lexer was made with.
+    _states: A dict from state name to a (regex, rules) pair. regex joins
+             the patterns of the state as named groups 'r0', 'r1'... and
+             rules holds the (kind, next state) of each of them. It is only
+             compiled on the first call of lex, so a language that is never
+             shown costs nothing at startup.
+    """
+
+    def __init__(self, name, rules):
+        """Initializes a RegexLexer.
+
+        Parameters
+        ----------
+        self: RegexLexer instance.
+        name: a str, the name of the language.
+        rules: a dict from state name to a list of (pattern, kind, next
+               state) tuples, tried in order. A kind of None leaves the
+               match untagged and a next state of None stays in the state.
+               Lexing starts in the "root" state.
+        """
+
+        self.name = name
+        self._rules = rules
+        self._states = None
+
+    def _compile(self):
+        """Compiles the patterns of each state."""
+
+        self._states = {}
+        for state, state_rules in self._rules.items():
+            pattern = "|".join("(?P<r%d>%s)" % (i, rule[0])
+                               for i, rule in enumerate(state_rules))
+            self._states[state] = (re.compile(pattern),
+                                   [rule[1:] for rule in state_rules])
+
+    def lex(self, line, state="root"):
+        """Splits a line into tokens.
+
+        Parameters
+        ----------
+        self: RegexLexer instance.
+        line: a str, the text of the line without its newline char.
+        state: a str, the state the previous line ended in.
+
+        Returns
+        -------
+        A (tokens, state) pair: a list of the (start, end, kind) tuples of
+        the tokens, and the state the line ends in.
+        """
+
+        if self._states == None:
+            self._compile()
+        tokens = []
+        regex, rules = self._states[state]
+        pos = 0
+        while pos < len(line):
+            match = regex.search(line, pos)
+            if match is None:
+                break
+            kind, next_state = rules[int(match.lastgroup[1:])]
+            start, end = match.span()
+            if kind != None and end > start:
+                tokens.append((start, end, kind))
+            if next_state != None and next_state != state:
+                state = next_state
+                regex, rules = self._states[state]
+            # An empty match still moves on
+            pos = end if end > start else end + 1
+
+        return tokens, state
+
+
+# Strings may start with up to two of the r, b, u and f prefixes
+STRING_PREFIX = r'(?i:[rbuf]{0,2})'
+
+PYTHON_LEXER = RegexLexer("Python", {
+    "root": [
+        (r'#.*', "comment", None),
+        (STRING_PREFIX + r'"""', "string", 'string"""'),
+        (STRING_PREFIX + r"'''", "string", "string'''"),
+        (STRING_PREFIX + r'"(?:[^"\\]|\\.)*"?', "string", None),
+        (STRING_PREFIX + r"'(?:[^'\\]|\\.)*'?", "string", None),
+        (r'@[A-Za-z_][\w.]*', "decorator", None),
+        (r'(?<=\bdef )\w+|(?<=\bclass )\w+', "definition", None),
+        (words(keyword.kwlist), "keyword", None),
+        (words(name for name in dir(builtins) if not name.startswith("_")),
+         "builtin", None),
+        (r'\b(?:0[xXoObB][\da-fA-F_]+|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?j?)',
+         "number", None),
+        # Other names are skipped whole, so no keyword is found inside one
+        (r'\w+', None, None),
+    ],
+    'string"""': [
+        (r'(?:[^"\\]|\\.|"(?!""))*"""', "string", "root"),
+        (r'.+', "string", None),
+    ],
+    "string'''": [
+        (r"(?:[^'\\]|\\.|'(?!''))*'''", "string", "root"),
+        (r'.+', "string", None),
+    ],
+})
+
+# Maps a file extension to the lexer of its language
+LEXERS = {
+    ".py": PYTHON_LEXER,
+    ".pyw": PYTHON_LEXER,
+}
+
+
+def lexer_for(filename):
+    """Returns the lexer for a file, or None if its language is unknown.
+
+    Parameters
+    ----------
+    filename: a str, the path of the file, or None.
+    """
+
+    if filename == None:
+        return None
+
+    return LEXERS.get(os.path.splitext(filename)[1].lower())
+
+
+class SyntaxHighlighter():
+    """The SyntaxHighlighter class keeps the state of the lexer at the end of
+    each line of a TextBuffer, so any line can be lexed on its own.
+
+    Instance vars
+    -------------
+    buffer: The TextBuffer being highlighted.
+    lexer: The RegexLexer of the language of buffer.
+    _states: A list with the state the lexer ends each line in (line 1 at
+             index 0), or None for the lines not lexed since they changed.
+    _stale: A sorted list of the indices of the lines from which _states
+            must be lexed again, since the state before them changed.
+    """
+
+    def __init__(self, buffer, lexer):
+        """Initializes a SyntaxHighlighter and starts following the edits
+        of a buffer. Nothing is lexed until tokens are asked for.
+
+        Parameters
+        ----------
+        self: SyntaxHighlighter instance.
+        buffer: a TextBuffer.
+        lexer: a RegexLexer.
+        """
+
+        self.buffer = buffer
+        self.lexer = lexer
+        self._states = [None] * buffer.line_count()
+        self._stale = [0]
+
+        buffer.listeners.append(self.record)
+
+    def close(self):
+        """Stops following the edits of the buffer."""
+
+        if self.record in self.buffer.listeners:
+            self.buffer.listeners.remove(self.record)
+
+    def record(self, offset, deleted, inserted):
+        """Forgets the states of the lines an edit changed. Called by the
+        buffer on every edit.
+
+        Parameters
+        ----------
+        self: SyntaxHighlighter instance.
+        offset: an int, where the edit was made.
+        deleted: the str that was deleted there.
+        inserted: the str that was inserted there.
+        """
+
+        first = self.buffer.line_of(offset) - 1
+        removed = deleted.count('\n')
+        added = inserted.count('\n')
+        self._states[first:first + removed + 1] = [None] * (added + 1)
+
+        # The stale lines after the edited ones move with them, the ones in
+        # between are lexed again from first anyway
+        stale = self._stale
+        later = [line + added - removed
+                 for line in stale[bisect_right(stale, first + removed):]]
+        stale[bisect_left(stale, first):] = [first] + later
+
+    def tokens(self, first, last):
+        """Returns the tokens of a range of lines.
+
+        Parameters
+        ----------
+        self: SyntaxHighlighter instance.
+        first: an int, the number of the first line (starting at 1).
+        last: an int, the number of the last line.
+
+        Returns
+        -------
+        A list of (line, start, end, kind) tuples, where start and end are
+        the columns of the token.
+        """
+
+        first = max(first, 1)
+        last = min(last, len(self._states))
+        if first > last:
+            return []
+        self._lex_to(last - 1)
+
+        result = []
+        state = self._states[first - 2] if first > 1 else "root"
+        for line, text in enumerate(self._lines(first - 1, last), first):
+            tokens, state = self.lexer.lex(text, state)
+            result.extend((line, start, end, kind)
+                          for start, end, kind in tokens)
+
+        return result
+
+    def _lex_to(self, last):
+        """Lexes the stale lines up to the line at index last, so the states
+        of every line up to it are known."""
+
+        states = self._states
+        stale = self._stale
+        while stale and stale[0] <= last:
+            line = stale.pop(0)
+            state = states[line - 1] if line > 0 else "root"
+            for text in self._lines(line, len(states)):
+                # Lexing through another stale line takes care of it
+                if stale and stale[0] == line:
+                    stale.pop(0)
+                old = states[line]
+                state = self.lexer.lex(text, state)[1]
+                states[line] = state
+                line += 1
+
+                # The lines after one that ends as it did are unchanged
+                if state == old:
+                    break
+                # The rest is lexed when it comes into view
+                if line > last and line < len(states):
+                    if not stale or stale[0] != line:
+                        stale.insert(0, line)
+                    break
+
+    def _lines(self, start, stop):
+        """Yields the text of the lines from index start up to index stop,
+        read from the buffer in growing blocks."""
+
+        size = FIRST_BLOCK
+        while start < stop:
+            end = min(start + size, stop)
+            text = self.buffer.get_text(self.buffer.line_start(start + 1),
+                                        self.buffer.line_end(end))
+            yield from text.split('\n')
+            start = end
+            size = min(size * 2, LEX_BLOCK)
@@ -1,21 +1,1333 @@
-"""This module writes a test for our program."""
-
-# Import Tkinter objects (GIU package)
-import tkinter as tk
-import tkinter.scrolledtext as scroll 
-from tkinter import messagebox
-from tkinter import filedialog 
-from tkinter import *
-
-# Import our modules
-from my_modules.MainModule import * # Provides main functionality of our program
-from my_modules.ParseCommands import * # Provides functionaltiy for commands
-from my_modules.StringConstants import * # Defines string constants 
-
-
-def test_tVIM():
-    """Tests tVIM class."""
-
-    this_tVIM = tVIM()
-
-    print("tVIM opened and closed.")
+"""This module writes a test for our program."""
+
+# Import Tkinter objects (GIU package)
+import tkinter as tk
+import tkinter.scrolledtext as scroll 
+from tkinter import messagebox
+from tkinter import filedialog 
+from tkinter import *
+
+import io
+import json
+import os
+import random
+import tempfile
+
+# Import our modules
+from my_modules.MainModule import * # Provides main functionality of our program
+from my_modules.ParseCommands import * # Provides functionaltiy for commands
+from my_modules.StringConstants import * # Defines string constants 
+from my_modules.Headless import * # Runs the commands without a window
+from my_modules.SyntaxHighlighter import * # Lexes the code in view
+from my_modules.Remote import * # Sends files to a running tVIM
+from my_modules.Gutter import * # Draws the line numbers and status line
+from my_modules.Filter import * # Pipes lines through ':%!cmd'
+from my_modules.Profiler import * # Times the hot paths for ':profile'
+from my_modules.FileFormat import * # Keeps the encoding and line endings
+from my_modules.Follow import * # Follows growing files for ':follow'
+import my_modules.FileCache # Remembers files between sessions
+import my_modules.LargeFile # Indexes the lines of large files
+import my_modules.Grep # Searches many files for ':vimgrep'
+import my_modules.Filter # Pipes lines through ':%!cmd'
+from my_modules.FrameScheduler import * # Redraws once per frame
+
+
+def test_tVIM():
+    """Tests tVIM class."""
+
+    this_tVIM = tVIM()
+
+    print("tVIM opened and closed.")
+
+
+def test_TextBuffer():
+    """Tests the TextBuffer class without opening a window."""
+
+    buffer = TextBuffer("first\nsecond\nthird")
+    assert buffer.line_count() == 3
+    assert buffer.get_line(2) == "second"
+
+    # Edits in the middle of a piece split it
+    buffer.insert(buffer.line_end(1), "\nnew")
+    buffer.insert(buffer.line_end(2), " line")
+    assert buffer.get_text() == "first\nnew line\nsecond\nthird"
+    assert buffer.delete(buffer.line_start(3), 7) == "second\n"
+    assert buffer.get_text() == "first\nnew line\nthird"
+
+    # Offsets and Tkinter-style (line, column) pairs map onto each other
+    assert buffer.offset_to_index(len(buffer)) == (3, 5)
+    assert buffer.index_to_offset(2, 99) == buffer.line_end(2)
+
+    print("TextBuffer edits and line lookups checked.")
+
+
+def test_LargeFile():
+    """Tests that a LargeFile finds the same lines as splitting the file, as
+    it is indexed and once it is, and that a PagedView reads whole lines
+    across the edge of a page."""
+
+    from array import array
+
+    class PageText():
+        # Keeps the text of the page, like the Text widget of a window
+        def __init__(self):
+            self.text = ""
+            self.vbar = self
+            self.marks = {}
+        def config(self, **options):
+            pass
+        def delete(self, start, end):
+            self.text = ""
+        def insert(self, index, text):
+            self.text = text
+        def index(self, index):
+            return self.marks.get(index, index)
+        def mark_set(self, name, index):
+            self.marks[name] = index
+        def see(self, index):
+            pass
+
+    # Lines of every length, some empty, one longer than a chunk, and
+    # chars of two bytes so byte offsets and columns differ
+    rng = random.Random(2)
+    lines = ["caf\xe9 " * rng.randrange(4) + "x" * rng.randrange(30)
+             for _ in range(1500)]
+    lines[100] = "y" * 3000
+    data = "\n".join(lines).encode("utf-8") + b"\n"
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, "big.log")
+    with open(filename, "wb") as file:
+        file.write(data)
+    starts = [0]
+    for line in data.split(b"\n")[:-1]:
+        starts.append(starts[-1] + len(line) + 1)
+
+    def check_lines(large_file):
+        for line in range(1, len(starts) + 1):
+            assert large_file.line_start(line) == starts[line - 1]
+        for offset in list(range(0, len(data), 7)) + [len(data)]:
+            assert (large_file.line_of(offset)
+                    == data.count(b"\n", 0, offset) + 1)
+
+    # Indexed on its own thread, the file has every line of a split
+    large_file = LargeFile(filename)
+    large_file._thread.join()
+    assert large_file.done
+    assert large_file.line_count() == len(starts) == 1501
+    assert large_file.get_line(1500) == lines[-1]
+    check_lines(large_file)
+    large_file.close()
+
+    # While it is indexed, the lines found so far are counted and the
+    # lines past them are still found, in chunks too small for some lines
+    saved_chunk = my_modules.LargeFile.INDEX_CHUNK
+    my_modules.LargeFile.INDEX_CHUNK = 256
+    try:
+        large_file = LargeFile(filename, index=(array('q', [0]), 0))
+        large_file.done = False
+        assert large_file.line_count() == 1
+        check_lines(large_file)
+        large_file._build_index()
+    finally:
+        my_modules.LargeFile.INDEX_CHUNK = saved_chunk
+    assert large_file.done and large_file.line_count() == 1501
+    checkpoints = large_file.checkpoints
+    assert list(checkpoints) == starts[::INDEX_STEP]
+    large_file.checkpoints = checkpoints[:3]
+    large_file.done = False
+    assert large_file.line_count() == 2 * INDEX_STEP + 1
+    check_lines(large_file)
+    large_file.checkpoints = checkpoints
+    large_file.done = True
+
+    # A page holds PAGE_LINES whole lines, wherever it starts
+    widget = PageText()
+    view = PagedView(widget, large_file)
+    assert widget.text == "\n".join(lines[:PAGE_LINES])
+    view.render(1450)
+    assert widget.text == "\n".join(lines[1449:])
+
+    # Moving the cursor past the edge of the page loads the page around it
+    offset = starts[699] + len("caf\xe9 ".encode("utf-8"))
+    view.set_cursor(offset)
+    assert view.top == 700 - PAGE_LINES // 2
+    assert view.loaded_range() == (starts[view.top - 1],
+                                   starts[view.top - 1 + PAGE_LINES])
+    assert widget.text.split("\n")[700 - view.top] == lines[699]
+    assert view.cursor() == offset
+    assert view.offset(view.index(starts[1000] - 1)) == starts[1000] - 1
+    large_file.close()
+
+    print("LargeFile line index and PagedView pages checked.")
+
+
+def test_SearchEngine():
+    """Tests the SearchEngine class without opening a window."""
+
+    buffer = TextBuffer("Foo bar\nfoo baz\nFOO\n")
+    engine = SearchEngine()
+
+    # Literal, case-insensitive and regular expression patterns
+    assert engine.search(buffer, "foo") == 1
+    assert engine.search(buffer, "foo\\c") == 3
+    assert engine.search(buffer, "\\vba[rz]") == 2
+    assert list(engine.starts) == [4, 12]
+
+    # 'n' and 'N' wrap around the ends of the file
+    assert engine.next_match(4) == 1
+    assert engine.next_match(12) == 0
+    assert engine.prev_match(4) == 1
+
+    # Narrowing an extended literal pattern finds what a new search would,
+    # even matches that start inside an old one
+    for text, old, new, expected in (("xaaab", "aa", "aab", [2]),
+                                     ("aaaa", "a", "aa", [0, 2]),
+                                     ("Abab aB", "a\\c", "ab\\c", [0, 2, 5])):
+        buffer = TextBuffer(text)
+        engine.search(buffer, old)
+        assert engine.narrow(buffer, new)
+        assert list(engine.starts) == expected
+        assert engine.search(buffer, new) == len(expected)
+    generator = random.Random(4)
+    for _ in range(200):
+        buffer = TextBuffer("".join(generator.choice("ab\n")
+                                    for _ in range(60)))
+        old = "".join(generator.choice("ab") for _ in range(2))
+        new = old + "".join(generator.choice("ab") for _ in range(2))
+        engine.search(buffer, old)
+        engine.narrow(buffer, new)
+        narrowed = (list(engine.starts), list(engine.ends))
+        engine.search(buffer, new)
+        assert narrowed == (list(engine.starts), list(engine.ends))
+    assert not engine.narrow(buffer, "\\vab")
+
+    print("SearchEngine matches and navigation checked.")
+
+
+def test_IncrementalSearch():
+    """Tests that an IncrementalSearch highlights what a full search finds
+    while the pattern is typed, narrowing the matches it has when the
+    pattern is extended."""
+
+    class WholeView(HeadlessView):
+        # The whole buffer is in view
+        def offset(self, index):
+            if index.startswith("@"):
+                return 0 if index == "@0,0" else len(self.buffer)
+            return HeadlessView.offset(self, index)
+
+    class ScrollWindow():
+        def winfo_height(self):
+            return 400
+
+    window = HeadlessEditor("xaaab aaaa\nab aab\n" * 50)
+    buffer = window.buffer
+    window.view = WholeView(buffer)
+    window.root = HeadlessRoot()
+    window.scroll_window = ScrollWindow()
+    search = IncrementalSearch(window)
+    expected = SearchEngine()
+
+    # Each prefix is scanned or narrowed, and matches a full search
+    for pattern in ("a", "aa", "aab", "aab "):
+        search.update(pattern)
+        window.root.run_idle()
+        expected.search(buffer, pattern)
+        assert window.search_engine.complete
+        assert list(window.search_engine.starts) == list(expected.starts)
+        assert list(window.highlights.ranges["highlight"][0]) == list(
+            expected.starts)
+
+    # A key typed before the scan finished starts it over, and finish()
+    # scans the rest at once
+    search.update("b")
+    search.update("ba")
+    search.finish()
+    assert window.search_engine.complete and not window.root.calls
+    assert len(window.search_engine) == expected.search(buffer, "ba")
+
+    # An invalid regular expression clears the highlights
+    search.update("\\v(")
+    assert "highlight" not in window.highlights.ranges
+
+    print("IncrementalSearch narrowing and slices checked.")
+
+
+def test_HighlightManager():
+    """Tests that only the ranges in view are tagged, and that after an edit
+    a range with a regex is found again while one without is dropped."""
+
+    import re
+
+    class TagText():
+        # Keeps the tags added, like the Text widget of a window
+        def __init__(self):
+            self.tags = {}
+
+        def config(self, **options):
+            pass
+
+        def bind(self, sequence, function, add=None):
+            pass
+
+        def winfo_width(self):
+            return 600
+
+        def winfo_height(self):
+            return 400
+
+        def tag_add(self, tag, *indices):
+            self.tags.setdefault(tag, []).extend(indices)
+
+        def tag_ranges(self, tag):
+            return tuple(self.tags.get(tag, ()))
+
+        def tag_remove(self, tag, *indices):
+            self.tags.pop(tag, None)
+
+    class LinesView(HeadlessView):
+        # Lines top to top + 9 are in view
+        top = 10
+
+        def offset(self, index):
+            if index.startswith("@"):
+                line = self.top if index == "@0,0" else self.top + 9
+                return self.buffer.line_start(line)
+            return HeadlessView.offset(self, index)
+
+    # The frames are run by the test
+    window = HeadlessEditor("".join("line %d match\n" % i for i in range(100)))
+    buffer = window.buffer
+    window.view = LinesView(buffer)
+    window.scroll_window = TagText()
+    window.scheduler = FrameScheduler(HeadlessRoot())
+    highlights = HighlightManager(window)
+    highlights.watch(buffer)
+
+    regex = re.compile("match")
+    starts = array('q', (match.start() for match
+                         in regex.finditer(buffer.get_text())))
+    ends = array('q', (start + 5 for start in starts))
+    highlights.set_ranges("highlight", starts, ends, regex)
+    cursor = buffer.line_start(15)
+    highlights.set_ranges("cursor", [cursor], [cursor + 4])
+    highlights.set_ranges("far", [0], [4])
+    window.scheduler.run_frame(None)
+
+    # Only the ranges on lines 10 to 19 are tagged
+    tags = window.scroll_window.tags
+    rows = sorted({int(index.split(".")[0]) for index in tags["highlight"]})
+    assert rows == list(range(10, 20))
+    assert tags["cursor"] == ["15.0", "15.4"]
+    assert "far" not in tags
+
+    # Scrolling tags the ranges now in view instead
+    window.view.top = 50
+    highlights.refresh()
+    assert tags["highlight"][:2] == ["50.%d" % (len("line 49 ")),
+                                     "50.%d" % (len("line 49 match"))]
+    assert "cursor" not in tags
+
+    # After an edit, the matches in view are found again where they moved
+    # to, and the cursor range, which has no regex, is dropped
+    window.view.top = 10
+    buffer.insert(buffer.line_start(12), "match ")
+    assert "highlights" in window.scheduler
+    window.scheduler.run_frame(None)
+    assert tags["highlight"].count("12.0") == 1
+    assert "12.%d" % len("match line 11 ") in tags["highlight"]
+    assert len(tags["highlight"]) == 2 * 11
+    assert "cursor" not in tags
+    highlights.set_ranges("cursor", [cursor], [cursor + 4])
+    highlights.refresh()
+    assert "cursor" in tags
+
+    print("HighlightManager ranges in view checked.")
+
+def test_KeyParser():
+    """Tests that the KeyParser turns keys into actions."""
+
+    parser = KeyParser(NORMAL_COMMANDS, MOTIONS, OPERATORS)
+
+    # Counts, multi-key commands and motions
+    assert parser.feed("g") == None
+    assert parser.feed("g") == ("command", goto_first_line, None)
+    assert [parser.feed(key) for key in "12j"][-1] == ("motion", down_motion, 12)
+    assert parser.feed("0") == ("motion", line_start_motion, None)
+
+    # Operators with a motion, a count, or doubled
+    assert [parser.feed(key) for key in "2d3w"][-1] == (
+        "operator", delete_operator, word_motion, 6, False)
+    assert [parser.feed(key) for key in "yy"][-1] == (
+        "operator", yank_operator, None, None, True)
+    assert parser.feed("z") == False and parser.pending == ""
+
+    print("KeyParser counts, operators and motions checked.")
+
+
+def test_HeadlessEditor():
+    """Tests the commands on a HeadlessEditor, without opening a window."""
+
+    editor = HeadlessEditor("first\nsecond")
+
+    # Insert mode, Esc, and commands with counts and operators
+    editor.keys("Gothird\x1b")
+    editor.keys("ggddp")
+    assert editor.text() == "second\nfirst\nthird"
+    editor.keys("gg2x")
+    assert editor.text() == "cond\nfirst\nthird"
+
+    # '?' lines, 'n', and errors raised instead of shown
+    editor.keys("?ir\r")
+    assert editor.highlights.ranges["highlight"][0].tolist() == [6, 13]
+    editor.keys("n")
+    assert editor.view.cursor() == 6
+    try:
+        editor.line("?missing")
+        assert False
+    except CommandError as error:
+        assert str(error) == PATTERN_NOT_FOUND
+
+    # 'n' after an edit, or in another document, searches the text again
+    editor = HeadlessEditor("one two\nfoo bar\n")
+    editor.line("?foo")
+    editor.keys("ggIadded \x1b")
+    editor.keys("ggn")
+    assert editor.view.cursor() == editor.text().index("foo")
+    other = editor.session.open(contents="no match\nbut foo here\nfoo\n")
+    editor.switch_to(other)
+    editor.keys("ggn")
+    assert editor.view.cursor() == editor.text().index("foo")
+    editor.keys("n")
+    assert editor.view.cursor() == editor.text().rindex("foo")
+
+    # A '!' after ':w', ':wq' and ':q' is a flag, not the name of a file
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, "bang.txt")
+    editor = HeadlessEditor("text\n")
+    editor.line(":w! " + filename)
+    editor.line(":w!")
+    assert os.listdir(folder) == ["bang.txt"]
+    editor.keys("x")
+    editor.line(":wq!")
+    assert editor.closed
+    with open(filename) as file:
+        assert file.read() == "ext\n"
+    editor = HeadlessEditor("text\n")
+    editor.line(":q!")
+    assert editor.closed
+    try:
+        editor.line(":ls!")
+        assert False
+    except CommandError as error:
+        assert str(error) == CMD_ERROR
+
+    print("HeadlessEditor keys, lines and errors checked.")
+
+
+def test_UndoTree():
+    """Tests 'u' and Ctrl-R on a HeadlessEditor."""
+
+    editor = HeadlessEditor("one\ntwo")
+
+    # Typing is one change, merged into one delta with its backspaces
+    editor.keys("Aa\x08bc\x1bjdd")
+    assert editor.text() == "onebc"
+    assert editor.undo_tree.current.parent.deltas == [(3, "", "bc")]
+    editor.keys("u")
+    assert editor.text() == "onebc\ntwo"
+    editor.keys("u")
+    assert editor.text() == "one\ntwo"
+    editor.keys("2\x12")
+    assert editor.text() == "onebc"
+
+    # The oldest changes are forgotten once the limit is reached
+    editor.undo_tree.limit = 1000
+    editor.keys("ohello\x1b" * 50)
+    assert editor.undo_tree.size <= 1000
+    editor.keys("u" * 50)
+    assert "hello" in editor.text()
+
+    print("UndoTree changes, merges and limit checked.")
+
+
+def test_SwapFile():
+    """Tests that a swap file replays the edits made since the last save."""
+
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, "test.txt")
+    with open(filename, "wt") as file:
+        file.write("one\ntwo\n")
+
+    editor = HeadlessEditor.open(filename)
+    swap = SwapFile(editor.buffer, free_swap_name(filename), editor.filename)
+    editor.keys("ddpAend\x1bu")
+    swap.flush()
+
+    # Replaying the log onto the file on disk gives the edited text
+    buffer = TextBuffer("one\ntwo\n")
+    assert recover_swap(swap.path, buffer) > 0
+    assert buffer.get_text() == editor.text() == "two\none\n"
+
+    # A torn record at the end is where the replay stops
+    with open(swap.path, "ab") as file:
+        file.write(encode_record(EDIT, 0, 0, "lost")[:-2])
+    buffer = TextBuffer("one\ntwo\n")
+    recover_swap(swap.path, buffer)
+    assert buffer.get_text() == "two\none\n"
+
+    # Closing the window normally deletes the swap file
+    swap.close()
+    assert os.listdir(folder) == ["test.txt"]
+
+    # A swap file that can not be created is an OSError, not a log that
+    # fails on every edit. A file stands in for the folder, which even root
+    # can not write into
+    path = os.path.join(filename, ".test.txt.swp")
+    listeners = list(editor.buffer.listeners)
+    try:
+        SwapFile(editor.buffer, path, editor.filename)
+        assert False, "SwapFile created in a folder that can not be written"
+    except OSError:
+        pass
+    assert editor.buffer.listeners == listeners
+    editor.keys("x")
+
+    print("SwapFile logging and recovery checked.")
+
+
+def test_SaveJob():
+    """Tests that a save writes a temporary file, syncs it and renames it
+    over the file, keeping its mode, that a failed save leaves the file as
+    it was, and that a finished save marks the document it was started for,
+    even when the window shows another one by then."""
+
+    import stat
+
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, "a.txt")
+    with open(filename, "wb") as file:
+        file.write(b"old\n")
+    os.chmod(filename, 0o640)
+
+    # The text goes to a temporary file, which is synced then renamed over
+    # the file
+    calls = []
+    saved_fsync, saved_replace = os.fsync, os.replace
+    def fsync(fd):
+        calls.append(("fsync", os.fstat(fd).st_ino))
+        saved_fsync(fd)
+    def replace(source, target):
+        calls.append(("replace", source, target))
+        saved_replace(source, target)
+    os.fsync, os.replace = fsync, replace
+    try:
+        job = SaveJob(TextBuffer("new\n"), filename)
+        job.wait()
+    finally:
+        os.fsync, os.replace = saved_fsync, saved_replace
+    assert job.error == None and job.done
+    replaced = [call for call in calls if call[0] == "replace"]
+    assert len(replaced) == 1
+    _, temp_name, target = replaced[0]
+    assert target == filename
+    assert os.path.dirname(temp_name) == folder
+    assert os.path.basename(temp_name).startswith(".a.txt.")
+    # The file synced before the rename is the one that replaced the file
+    synced = calls[calls.index(replaced[0]) - 1]
+    assert synced == ("fsync", os.stat(filename).st_ino)
+    with open(filename, "rb") as file:
+        assert file.read() == b"new\n"
+    # The file keeps its mode, and no temporary file is left behind
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+    assert os.listdir(folder) == ["a.txt"]
+
+    # A save that fails part way leaves the file as it was
+    text = "x" * SAVE_CHUNK + "caf\xe9\n"
+    job = SaveJob(TextBuffer(text), filename, FileFormat("ascii"))
+    job.wait()
+    assert isinstance(job.error, UnicodeEncodeError)
+    with open(filename, "rb") as file:
+        assert file.read() == b"new\n"
+    assert os.listdir(folder) == ["a.txt"]
+
+    # A new document is saved as a file, and the window shows another
+    # document before the save is done
+    filename = os.path.join(folder, "b.txt")
+    session = Session()
+    saved = session.open(contents="a\n")
+    other = session.open(contents="b\n")
+    other.buffer.insert(0, "c")
+
+    job = SaveJob(saved.buffer, filename, saved.format, saved)
+    job.wait()
+    window = HeadlessEditor(session=session)
+    window.switch_to(other)
+    window.root = HeadlessRoot()
+    tVIM.poll_save(window, job, None)
+    assert not saved.modified() and saved.filename == filename
+    assert other.modified() and other.filename == None
+    assert window.filename == None
+
+    print("SaveJob checked.")
+
+def test_Session():
+    """Tests switching between the documents of a session."""
+
+    folder = tempfile.mkdtemp()
+    names = [os.path.join(folder, name) for name in ("a.txt", "b.txt")]
+    for name in names:
+        with open(name, "wt") as file:
+            file.write(os.path.basename(name) + "\n")
+
+    editor = HeadlessEditor.open(names[0])
+    editor.keys("yy:e %s\r" % names[1])
+    assert editor.text() == "b.txt\n"
+    first = editor.session.find_file(names[0])
+
+    # A hidden document with no changes is unloaded, registers are shared
+    assert not first.loaded()
+    editor.keys("p")
+    assert editor.text() == "b.txt\na.txt\n"
+
+    # A modified document stays loaded while hidden, and keeps its cursor
+    editor.line(":bn")
+    assert editor.document is first and first.loaded()
+    second = editor.session.find_file(names[1])
+    assert second.loaded() and second.modified()
+    editor.line(":b 2")
+    assert editor.text() == "b.txt\na.txt\n"
+    assert editor.view.cursor() == 6
+
+    # Opening a file twice gives the same document
+    other = HeadlessEditor.open(names[1], editor.session)
+    assert other.document is second and second.windows == 2
+    editor.line(":ls")
+    assert editor.messages[-1] == ('  1     "%s"\n  2 %%a+ "%s"'
+                                   % (names[0], names[1]))
+
+    try:
+        editor.line(":b 3")
+        assert False
+    except CommandError as error:
+        assert str(error) == NO_BUFFER_ERROR
+
+    # Closing the last editor unloads everything
+    editor.close()
+    other.close()
+    assert editor.session.documents == [] and not second.loaded()
+
+    print("Session documents, registers and unloading checked.")
+
+
+def test_SyntaxHighlighter():
+    """Tests that an edit only lexes the lines whose state changed."""
+
+    tokens, state = PYTHON_LEXER.lex('def f(x): return "a" # note')
+    assert [kind for _, _, kind in tokens] == ["keyword", "definition",
+                                               "keyword", "string", "comment"]
+    assert state == "root"
+    assert PYTHON_LEXER.lex('s = """open')[1] == 'string"""'
+
+    class CountingLexer():
+        """Counts the lines lexed by the Python lexer."""
+        lines = 0
+        def lex(self, line, state):
+            self.lines += 1
+            return PYTHON_LEXER.lex(line, state)
+
+    buffer = TextBuffer("x = 1\n" * 1000)
+    lexer = CountingLexer()
+    syntax = SyntaxHighlighter(buffer, lexer)
+
+    # Only the lines up to the view are lexed, then the view itself
+    assert syntax.tokens(10, 12) == [(line, 4, 5, "number")
+                                     for line in (10, 11, 12)]
+    assert lexer.lines == 12 + 3
+
+    # An edit that leaves the state as it was only lexes the edited lines
+    # and the line after them
+    lexer.lines = 0
+    buffer.insert(buffer.line_start(5), "y = 2\n")
+    syntax.tokens(10, 12)
+    assert lexer.lines == 3 + 3
+
+    # Opening a string changes every line after it, but only the ones up
+    # to the view are lexed
+    lexer.lines = 0
+    buffer.insert(buffer.line_start(5), '"""')
+    assert syntax.tokens(5, 6)[-1] == (6, 0, 5, "string")
+    assert lexer.lines == 2 + 2
+    assert syntax.tokens(1001, 1001) == [(1001, 0, 5, "string")]
+
+    print("SyntaxHighlighter lexing and caching checked.")
+
+
+def test_FileIndex():
+    """Tests finding files by the chars of their path."""
+
+    folder = tempfile.mkdtemp()
+    for name in ("src/main.py", "src/util/string_helpers.py",
+                 "docs/maintenance.txt", ".git/objects/main"):
+        os.makedirs(os.path.dirname(os.path.join(folder, name)),
+                    exist_ok=True)
+        open(os.path.join(folder, name), "w").close()
+
+    index = FileIndex(folder, saved=False)
+    index.wait()
+    assert len(index) == 3
+    assert index.search("main") == [os.path.join(folder, "src", "main.py"),
+                                    os.path.join(folder, "docs", "maintenance.txt")]
+    assert index.search("strhelp")[0].endswith("string_helpers.py")
+    assert index.search("xyz") == []
+
+    # A new file is found by the next walk
+    open(os.path.join(folder, "src", "mainloop.py"), "w").close()
+    index.refresh()
+    index.wait()
+    assert len(index) == 4
+    assert index.search("mainloop")[0].endswith("mainloop.py")
+
+    # Every match is ranked, the best one sorting after hundreds of worse
+    # ones is still first
+    folder = tempfile.mkdtemp()
+    os.makedirs(os.path.join(folder, "a"))
+    for i in range(600):
+        open(os.path.join(folder, "a", "m_x_a_y_i_z_n_%04d.txt" % i),
+             "w").close()
+    open(os.path.join(folder, "main.py"), "w").close()
+    index = FileIndex(folder, saved=False)
+    index.wait()
+    results = index.search("main")
+    assert results[0] == os.path.join(folder, "main.py")
+    assert len(results) == RESULT_COUNT
+    assert index.search("main", limit=3)[1:] == [
+        os.path.join(folder, "a", "m_x_a_y_i_z_n_%04d.txt" % i)
+        for i in (0, 1)]
+
+    print("FileIndex walking and ranking checked.")
+
+
+def test_Grep():
+    """Tests ':vimgrep' and jumping through its hits with ':cn' and ':cp'."""
+
+    import concurrent.futures
+    import time
+
+    folder = tempfile.mkdtemp()
+    files = {"a.py": "import os\nos.sep  # os twice\n",
+             "sub/b.py": "x = 1\nprint(os)\n",
+             "sub/c.bin": "os\0binary\n",
+             "d.txt": "no hits here\n"}
+    for name, text in files.items():
+        os.makedirs(os.path.dirname(os.path.join(folder, name)),
+                    exist_ok=True)
+        with open(os.path.join(folder, name), "wt") as file:
+            file.write(text)
+
+    # Binary files are skipped and each line is one hit
+    editor = HeadlessEditor()
+    editor.line(":vimgrep /os/ %s" % folder)
+    entries = sorted(editor.session.quickfix.entries)
+    assert [entry[1:] for entry in entries] == [
+        (1, 7, "import os"), (2, 0, "os.sep  # os twice"),
+        (2, 6, "print(os)")]
+    assert editor.filename == editor.session.quickfix.entries[0][0]
+
+    # A glob only searches the files it names, and ':cn' goes through them
+    editor.line(":vim /\\vos\\.\\w+/j %s" % os.path.join(folder, "**", "*.py"))
+    assert editor.session.quickfix.entries == [
+        (os.path.join(folder, "a.py"), 2, 0, "os.sep  # os twice")]
+    editor.line(":vimgrep print %s" % os.path.join(folder, "sub", "*"))
+    editor.line(":vimgrep os %s" % os.path.join(folder, "*.py"))
+    assert editor.view.cursor() == 7
+    editor.line(":cn")
+    assert editor.view.cursor() == 10
+    try:
+        editor.line(":cn")
+        assert False
+    except CommandError as error:
+        assert str(error) == NO_MORE_HITS_ERROR
+    editor.line(":cp")
+    assert editor.view.cursor() == 7
+
+    # The hits are in the order of the files, though the batches are done
+    # last to first
+    class ReversePool():
+        # Stands in for the pool, running the batches when told to
+        def __init__(self):
+            self.batches = []
+
+        def submit(self, function, *args):
+            future = concurrent.futures.Future()
+            self.batches.append((future, function, args))
+            return future
+
+    names = [os.path.join(folder, "many", "%03d.txt" % i)
+             for i in range(4 * GREP_BATCH)]
+    os.makedirs(os.path.dirname(names[0]))
+    for name in names:
+        with open(name, "wt") as file:
+            file.write("hit\n")
+    saved_pool = my_modules.Grep.POOL
+    my_modules.Grep.POOL = pool = ReversePool()
+    try:
+        job = GrepJob("hit", names)
+        while len(pool.batches) < 4:
+            time.sleep(0.01)
+        for future, function, args in reversed(pool.batches):
+            future.set_result(function(*args))
+        job.wait()
+    finally:
+        my_modules.Grep.POOL = saved_pool
+    assert [hit[0] for hit in job.results] == names
+    assert job.searched == len(names)
+
+    try:
+        editor.line(":vimgrep /zzz/ %s" % folder)
+        assert False
+    except CommandError as error:
+        assert str(error) == NO_GREP_MATCH
+    editor.close()
+
+    print("Grep over worker processes and the quickfix list checked.")
+
+
+def test_Remote():
+    """Tests sending files to a running tVIM, without a window."""
+
+    name = "test-%d" % os.getpid()
+    assert not send_files(["a.txt"], name)
+
+    server = RemoteServer(name)
+    assert send_files(["a.txt", "/tmp/b.txt"], name)
+    assert server.pending() == [[os.path.abspath("a.txt"), "/tmp/b.txt"]]
+    assert server.pending() == []
+
+    # A second server under the same name is refused
+    try:
+        RemoteServer(name)
+        assert False
+    except OSError:
+        pass
+
+    server.close()
+    assert not send_files(["a.txt"], name)
+    assert not os.path.exists(server_path(name))
+
+    # The socket of a tVIM that crashed is taken over
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(server_path(name))
+    stale.close()
+    server = RemoteServer(name)
+    assert send_files(["c.txt"], name)
+    server.close()
+
+    print("Remote server and launches checked.")
+
+
+def test_Gutter():
+    """Tests ':N' and the status line on a HeadlessEditor."""
+
+    editor = HeadlessEditor("one\ntwo\nthree\nfour")
+
+    # ':N' moves to a line found in the line index, past the end to the last
+    editor.line(":3")
+    assert editor.view.cursor() == 8
+    assert status_text(editor) == '"[No Name]" [+]  4 lines  3,1'
+    editor.keys("ll")
+    assert status_text(editor).endswith("4 lines  3,3")
+    editor.line(":99")
+    assert editor.view.cursor() == 14
+    editor.keys("Gofive\x1b")
+    assert status_text(editor).endswith("5 lines  5,5")
+
+    print("Line numbers and the status line checked.")
+
+
+def test_Filter():
+    """Tests ':%!cmd' and ':a,b!cmd' on a HeadlessEditor."""
+
+    editor = HeadlessEditor("pear\napple\nfig")
+
+    # The whole file, its last line has no newline and gets none back
+    editor.line(":%!sort")
+    assert editor.text() == "apple\nfig\npear"
+    editor.line(":2,$!tr a-z A-Z")
+    assert editor.text() == "apple\nFIG\nPEAR"
+    assert editor.view.cursor() == 6
+
+    # Each filter is undone in one step
+    editor.keys("u")
+    assert editor.text() == "apple\nfig\npear"
+    editor.keys("u")
+    assert editor.text() == "pear\napple\nfig"
+
+    # A failing command leaves the text as it was
+    for line, message in ((":%!exit 3", FILTER_ERROR + "\nexit status 3"),
+                          (":%! ", NO_FILTER_COMMAND_ERROR)):
+        try:
+            editor.line(line)
+            assert False
+        except CommandError as error:
+            assert str(error) == message
+    assert editor.text() == "pear\napple\nfig"
+
+    # Output much larger than a pipe streams through without blocking
+    editor = HeadlessEditor("x\n" * 200000)
+    editor.line(":%!cat")
+    assert editor.buffer.line_count() == 200001
+
+    # A cancelled command is stopped and its output dropped
+    job = FilterJob(editor.buffer, 0, len(editor.buffer), "cat; sleep 30")
+    job.cancel()
+    job.wait()
+    assert job.cancelled and job.chunks == []
+
+    # The output is put in a slice per frame, and undone in one step
+    text = "".join("%d\n" % i for i in range(300))
+    editor = HeadlessEditor(text)
+    editor.root = HeadlessRoot()
+    budget = my_modules.Filter.APPLY_BUDGET
+    chunk = my_modules.Filter.APPLY_CHUNK
+    my_modules.Filter.APPLY_BUDGET, my_modules.Filter.APPLY_CHUNK = 0, 64
+    try:
+        job = FilterJob(editor.buffer, 0, len(editor.buffer), "tac")
+        job.wait()
+        applying = apply_filter(editor, job)
+        applying.start()
+        frames, progress = 0, 0
+        while editor.root.calls:
+            editor.root.run_idle(once=True)
+            frames += 1
+            assert applying.progress() >= progress
+            progress = applying.progress()
+            if not applying.done:
+                # Keys typed meanwhile close the undo entry and edit nothing
+                editor.undo_tree.close()
+                try:
+                    editor.keys("x")
+                    assert False
+                except CommandError as error:
+                    assert str(error) == FILTER_APPLYING_ERROR
+    finally:
+        my_modules.Filter.APPLY_BUDGET = budget
+        my_modules.Filter.APPLY_CHUNK = chunk
+    assert frames > 10 and progress == 1.0 and editor.filter_apply == None
+    assert editor.text() == "".join("%d\n" % i for i in range(299, -1, -1))
+    editor.keys("u")
+    assert editor.text() == text
+
+    print("Filters through shell commands checked.")
+
+
+def test_Profiler():
+    """Tests ':profile' on a HeadlessEditor."""
+
+    editor = HeadlessEditor("one\ntwo\nthree")
+    try:
+        editor.line(":profile")
+        assert False
+    except CommandError as error:
+        assert str(error) == NO_PROFILE_ERROR
+
+    # Keys, lines and searches are timed while profiling is on
+    editor.line(":profile start")
+    editor.keys("jjdd")
+    editor.line("?one")
+    editor.line(":profile stop")
+    editor.keys("gg")
+    latencies = editor.session.profiler.latencies
+    assert len(latencies["down_motion"]) == 2
+    assert set(latencies) >= {"delete_operator lines", "?", "search"}
+    assert "goto_first_line" not in latencies
+
+    editor.line(":profile")
+    assert editor.messages[-1].split()[:6] == ["span", "count", "total",
+                                               "ms", "p50", "us"]
+    trace = os.path.join(tempfile.mkdtemp(), "trace.json")
+    editor.line(":profile dump " + trace)
+    with open(trace) as file:
+        events = json.load(file)["traceEvents"]
+    assert {"X"} == {event["ph"] for event in events}
+    assert percentile([1, 2, 3, 4], 50) == 3
+
+    print("Profiler spans, report and trace checked.")
+
+
+def test_Macro():
+    """Tests recording and replaying macros on a HeadlessEditor."""
+
+    editor = HeadlessEditor("\n".join("line %d" % i for i in range(1, 6)))
+
+    # Keys typed in command mode, insert mode and ':' lines are recorded
+    editor.keys("qaI- \x1bjq")
+    assert editor.registers["a"] == ("I- \x1bj", False)
+    assert status_text(editor).endswith("2,3")
+    editor.keys("3@a")
+    assert editor.text() == "- line 1\n- line 2\n- line 3\n- line 4\nline 5"
+    editor.keys("@@")
+    assert editor.text().endswith("- line 5")
+
+    # A replay is not recorded again, but the '@' keys are
+    editor.keys("ggqbx@aq")
+    assert editor.registers["b"] == ("x@a", False)
+    editor.keys("qc:2\rq")
+    editor.keys("G@c")
+    assert editor.view.cursor() == editor.buffer.line_start(2)
+
+    try:
+        editor.keys("@z")
+        assert False
+    except CommandError as error:
+        assert str(error) == NO_MACRO_ERROR
+
+    print("Macro recording and replay checked.")
+
+
+def test_FileFormat():
+    """Tests that files are saved back in the encoding and line endings
+    they were read with, byte for byte."""
+
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, "test.txt")
+    samples = [b"one\r\ntwo\r\n", b"caf\xe9\nna\xefve\n", b"\xef\xbb\xbfbom\n",
+               "\ufeffutf-16\r\n".encode("utf-16-le"), b"old\rmac\r",
+               b"mixed\r\nends\n", b"ok\n" * SNIFF_SIZE + b"bad \xff\xfe\n"]
+    for data in samples:
+        with open(filename, "wb") as file:
+            file.write(data)
+        editor = HeadlessEditor.open(filename)
+        assert "\r" not in editor.text() or data == samples[5]
+        editor.save_file(filename)
+        with open(filename, "rb") as file:
+            assert file.read() == data
+        editor.close()
+
+    # Edits are written in the format of the file
+    with open(filename, "wb") as file:
+        file.write(b"caf\xe9\r\n")
+    editor = HeadlessEditor.open(filename)
+    assert editor.text() == "caf\xe9\n"
+    assert status_text(editor).startswith('"%s" [latin-1] [dos]' % filename)
+    editor.keys("yyp")
+    editor.save_file(filename)
+    with open(filename, "rb") as file:
+        assert file.read() == b"caf\xe9\r\ncaf\xe9\r\n"
+
+    # A '\r\n' split between two chunks is still one line ending
+    with open(filename, "wb") as file:
+        file.write(b"a" * (READ_CHUNK - 1) + b"\r\nb\r\n")
+    with open(filename, "rb") as file:
+        data = file.read()
+    text, file_format = read_text(lambda: io.BytesIO(data),
+                                  sniff_format(b"a\r\n"))
+    assert text == "a" * (READ_CHUNK - 1) + "\nb\n"
+    assert file_format.newline == "\r\n"
+
+    # Bytes that start like a UTF-32 byte order mark but are not UTF-32 are
+    # read as FALLBACK_ENCODING, and saved back the same
+    data = b"\xff\xfe\x00\x00\xff\xff\xff\xff"
+    file_format = sniff_format(data)
+    assert file_format.encoding == FALLBACK_ENCODING and file_format.bom == b""
+    with open(filename, "wb") as file:
+        file.write(data)
+    editor = HeadlessEditor.open(filename)
+    assert editor.text() == data.decode(FALLBACK_ENCODING)
+    editor.save_file(filename)
+    with open(filename, "rb") as file:
+        assert file.read() == data
+    editor.close()
+    large_file = LargeFile(filename)
+    assert large_file.get_line(1) == data.decode(FALLBACK_ENCODING)
+    large_file.close()
+
+    # A LargeFile decodes in the format of the file too
+    with open(filename, "wb") as file:
+        file.write(b"\xef\xbb\xbfcaf\xc3\xa9\r\nb\r\n")
+    large_file = LargeFile(filename)
+    assert large_file.get_line(1) == "caf\xe9"
+    assert large_file.get_text(large_file.line_start(2)) == "b\n"
+    assert large_file.index_to_offset(1, 4) == 8
+    large_file.close()
+
+    print("FileFormat sniffing and round trips checked.")
+
+
+def test_Compression():
+    """Tests that compressed files are opened as their text and saved back
+    compressed the same way."""
+
+    import bz2, gzip, lzma
+
+    folder = tempfile.mkdtemp()
+    data = b"".join(b"line %d caf\xe9\r\n" % i for i in range(1000))
+    for name, module in (("log.gz", gzip), ("log.xz", lzma),
+                         ("log.bz2", bz2)):
+        filename = os.path.join(folder, name)
+        with open(filename, "wb") as file:
+            file.write(module.compress(data))
+        editor = HeadlessEditor.open(filename)
+        assert editor.text() == data.decode("latin-1").replace("\r\n", "\n")
+        compression = sniff_compression(filename)
+        assert status_text(editor).startswith(
+            '"%s" [%s] [latin-1] [dos]' % (filename, compression))
+        editor.keys("ggdd")
+        editor.save_file(filename)
+        with open(filename, "rb") as file:
+            assert module.decompress(file.read()) == data[data.index(b"\n") + 1:]
+        assert sniff_compression(filename) == compression
+        editor.close()
+
+    # Text that only looks like the start of a bz2 file is not compressed
+    filename = os.path.join(folder, "plain.txt")
+    with open(filename, "wb") as file:
+        file.write(b"BZh is not bz2\n")
+    assert sniff_compression(filename) == None
+
+    # The codecs are only imported once a compressed file is opened, and
+    # zstd files need the zstandard package
+    import subprocess, sys
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, my_modules.Compression; "
+         "print(sorted({'bz2', 'gzip', 'lzma', 'zstandard'} "
+         "& set(sys.modules)))"],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert loaded.stdout.strip() == "[]"
+    try:
+        import zstandard
+    except ImportError:
+        for function in (decompressed, compressed):
+            try:
+                function(io.BytesIO(), "zstd")
+                assert False
+            except OSError as error:
+                assert str(error) == NO_ZSTANDARD_ERROR
+
+    # A LoadJob reads on its own thread and can be cancelled
+    job = LoadJob(os.path.join(folder, "log.gz"))
+    job.wait()
+    assert job.error == None and job.progress() == 1.0
+    assert job.result[0].line_count() == 1000
+    job = LoadJob(os.path.join(folder, "log.xz"))
+    job.cancel()
+    job.wait()
+    assert job.result == None and job.error == None
+
+    print("Compressed files checked.")
+
+
+def test_Follow():
+    """Tests that ':follow' appends what is written to a file, keeping only
+    the last lines if asked to, and that the file can not be edited
+    meanwhile."""
+
+    import time
+
+    def wait_for(editor):
+        # Waits for the Follower to read the file, then takes a frame
+        deadline = time.time() + 10
+        while editor.follower.offset != os.path.getsize(filename):
+            assert time.time() < deadline
+            time.sleep(0.01)
+        editor.poll_follow()
+
+    buffer = TextBuffer("a" * 1000 + "\nb\n")
+    buffer.delete(0, 1001)
+    buffer.insert(len(buffer), "c\n")
+    buffer.compact()
+    assert buffer.get_text() == "b\nc\n" and buffer.line_count() == 3
+    buffer.insert(0, "a\n")
+    assert buffer.get_text() == "a\nb\nc\n" and buffer.line_of(4) == 3
+
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, "app.log")
+    with open(filename, "wb") as file:
+        file.write(b"start\r\n")
+    editor = HeadlessEditor.open(filename)
+    for argument in ("0", "x"):
+        try:
+            editor.line(":follow " + argument)
+            assert False
+        except CommandError as error:
+            assert str(error) == FOLLOW_USAGE_ERROR
+
+    editor.keys("G")
+    editor.line(":follow 3")
+    assert status_text(editor).startswith('"%s" [dos] [follow]' % filename)
+    with open(filename, "ab") as file:
+        file.write(b"".join(b"line %d\r\n" % i for i in range(10)))
+        file.write(b"partial\r")
+    wait_for(editor)
+    with open(filename, "ab") as file:
+        file.write(b"\n")
+    wait_for(editor)
+    assert editor.text() == "line 8\nline 9\npartial\n"
+    assert not editor.document.modified()
+    assert editor.view.cursor() == len(editor.buffer)
+    for keys in ("kx", "u", "i"):
+        try:
+            editor.keys(keys)
+            assert False
+        except CommandError as error:
+            assert str(error) == FOLLOW_EDIT_ERROR
+
+    # A truncated file is followed from its start again
+    with open(filename, "wb") as file:
+        file.write(b"rotated\r\n")
+    wait_for(editor)
+    assert editor.text().endswith("partial\nrotated\n")
+
+    # Following again goes on where it stopped, though the first lines were
+    # dropped since, and what was read but not shown yet is read again
+    editor.line(":follow stop")
+    with open(filename, "ab") as file:
+        file.write(b"more\r\n")
+    editor.line(":follow 3")
+    wait_for(editor)
+    assert editor.text() == "partial\nrotated\nmore\n"
+    with open(filename, "ab") as file:
+        file.write(b"late\r")
+    deadline = time.time() + 10
+    while editor.follower.offset != os.path.getsize(filename):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    editor.line(":follow stop")
+    with open(filename, "ab") as file:
+        file.write(b"\n")
+    editor.line(":follow 3")
+    wait_for(editor)
+    assert editor.text() == "rotated\nmore\nlate\n"
+
+    editor.line(":follow stop")
+    assert editor.follower == None
+    editor.keys("ggx")
+    assert editor.text().startswith("otated")
+    editor.close()
+
+    print("Followed files checked.")
+
+
+def test_FileCache():
+    """Tests that a file opened again unchanged gets its format, line index,
+    cursor and searches from the cache, and that the cache drops the
+    entries used least recently."""
+
+    import time
+
+    saved_folder = my_modules.FileCache.CACHE_FOLDER
+    my_modules.FileCache.CACHE_FOLDER = tempfile.mkdtemp()
+    try:
+        folder = tempfile.mkdtemp()
+        filename = os.path.join(folder, "notes.txt")
+        with open(filename, "wb") as file:
+            file.write(b"".join(b"line %d caf\xe9\r\n" % i for i in range(20)))
+
+        editor = HeadlessEditor.open(filename)
+        editor.line("?line 1")
+        editor.keys("5G")
+        cursor = editor.view.cursor()
+        editor.close()
+        entry = load_entry(filename)
+        assert entry.format.encoding == "latin-1"
+        assert entry.format.newline == "\r\n"
+        assert entry.lines == find_newlines(editor.buffer.get_text())
+        assert entry.cursor == cursor
+        assert list(entry.searches) == ["line 1"]
+
+        # Opened again, nothing is sniffed, indexed or searched again
+        editor = HeadlessEditor.open(filename)
+        assert editor.buffer.line_index() == entry.lines
+        assert editor.document.format.flags() == " [latin-1] [dos]"
+        assert editor.view.cursor() == cursor
+        editor.search_engine.scan = None
+        editor.line("?line 1")
+        assert list(editor.search_engine.starts) == list(
+            entry.searches["line 1"][0])
+        assert len(editor.search_engine) == 11
+        del editor.search_engine.scan
+
+        # An edit forgets the searches, saving makes the entry stale
+        editor.keys("ggx")
+        assert editor.document.cached_search("line 1") == None
+        editor.save_file(filename)
+        assert load_entry(filename) == None
+        editor.line("?line 2")
+        editor.close()
+        entry = load_entry(filename)
+        assert entry.lines == None and list(entry.searches) == ["line 2"]
+        with open(filename, "ab") as file:
+            file.write(b"more\r\n")
+        assert load_entry(filename) == None
+
+        # A LargeFile takes the index of an earlier session
+        large_file = LargeFile(filename)
+        while not large_file.done:
+            time.sleep(0.01)
+        indexed = LargeFile(filename, large_file.format,
+                            (large_file.checkpoints,
+                             large_file.line_count() - 1))
+        assert indexed.done and indexed.line_count() == 22
+        assert indexed.line_start(21) == large_file.line_start(21)
+        large_file.close()
+        indexed.close()
+
+        # Only the most recent searches are kept
+        searches = OrderedDict()
+        for i in range(SEARCH_LIMIT + 2):
+            remember_search(searches, str(i), array('q', [i]), array('q', [i]))
+        assert list(searches)[0] == "2" and len(searches) == SEARCH_LIMIT
+
+        # Past the limit, the entry used least recently is dropped
+        paths = []
+        for name in ("old.txt", "new.txt"):
+            path = os.path.join(folder, name)
+            with open(path, "wt") as file:
+                file.write("text\n")
+            save_entry(CacheEntry(file_key(path), FileFormat(), 5))
+            paths.append(entry_path(path))
+        os.utime(paths[0], ns=(0, 0))
+        evict(os.path.getsize(paths[1]))
+        assert not os.path.exists(paths[0]) and os.path.exists(paths[1])
+    finally:
+        my_modules.FileCache.CACHE_FOLDER = saved_folder
+
+    print("File cache checked.")
+
+
+def test_FrameScheduler():
+    """Tests that the tasks queued on a FrameScheduler run once per frame,
+    in order, and that a frame over its budget leaves the rest to the
+    next one."""
+
+    import time
+
+    root = HeadlessRoot()
+    scheduler = FrameScheduler(root)
+    ran = []
+    for key in "jjjj":
+        scheduler.schedule("highlights", ran.append, "highlights " + key)
+        scheduler.schedule("status", ran.append, "status")
+    scheduler.schedule("highlights", ran.append, "highlights k")
+    assert len(root.calls) == 1 and len(scheduler) == 2
+    root.run_idle(once=True)
+    assert ran == ["highlights k", "status"] and len(scheduler) == 0
+
+    # A task over the budget leaves the others to the next frame
+    ran.clear()
+    scheduler.schedule("slow", lambda: time.sleep(0.02) or ran.append("slow"))
+    scheduler.schedule("gutter", ran.append, "gutter")
+    root.run_idle(once=True)
+    assert ran == ["slow"] and "gutter" in scheduler
+    root.run_idle(once=True)
+    assert ran == ["slow", "gutter"]
+
+    scheduler.schedule("status", ran.append, "late")
+    scheduler.cancel("status")
+    scheduler.schedule("gutter", ran.append, "closed")
+    scheduler.clear()
+    root.run_idle(once=True)
+    assert ran == ["slow", "gutter"] and len(scheduler) == 0
+
+    print("FrameScheduler frames checked.")
@@ -0,0 +1,496 @@
+"""This module defines the text buffer that holds the document of a tVIM window.
+
+The buffer is a piece table: the original text and every inserted string are
+kept in read-only buffers, and the document is described by a list of pieces
+that point into them. Each buffer also keeps the sorted offsets of its newline
+chars, so lines can be found by bisection instead of by scanning the text.
+
+Line and column numbers follow the Tkinter convention (lines start at 1,
+columns start at 0) so that buffer positions map directly onto Text indices.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+
+# Inserts right after the previous insert are merged into its buffer
+# as long as that buffer stays below this many chars
+COALESCE_LIMIT = 4096
+
+# The size of the slices used when scanning or streaming large texts
+CHUNK_SIZE = 1 << 20
+
+
+def find_newlines(text, base=0):
+    """Finds the offsets of every newline char in a str.
+
+    Parameters
+    ----------
+    text: the str to scan.
+    base: an int added to every offset, defaults to 0.
+
+    Returns
+    -------
+    An array of ints, the sorted offsets of the newline chars.
+    """
+
+    offsets = array('q')
+
+    # Split in chunks so a huge text is never copied all at once
+    for chunk_start in range(0, len(text), CHUNK_SIZE):
+        chunk = text[chunk_start:chunk_start + CHUNK_SIZE]
+        # The lengths of the lines give the positions of the newlines
+        lines = chunk.split('\n')
+        lines.pop()
+        shift = base + chunk_start - 1
+        offsets.extend(pos + shift for pos in
+                       accumulate(len(line) + 1 for line in lines))
+
+    return offsets
+
+
+class TextBuffer():
+    """The TextBuffer class holds the text of a document as a piece table.
+
+    Lookups by offset or by line are O(log n) bisections over the pieces and
+    the newline offsets of each buffer. An edit only touches the pieces next to
+    it, so its cost depends on the number of edits made, not on the size of the
+    file that was loaded. The running totals of the pieces after an edit are
+    stale until the next lookup, which rebuilds them, so the first lookup after
+    an edit is O(pieces after it): typing near the start of a document edited
+    in many places costs more per key than typing near its end.
+
+    Instance vars
+    -------------
+    _buffers: A list of strs. The first is the original text, the others are
+              the inserted texts. Buffers are never changed in place.
+    _newlines: A list with the sorted newline offsets of each buffer.
+    _pieces: A list of (buffer, start, length, newlines) tuples that spell
+             out the document in order.
+    _starts: The offset in the document at which each piece starts.
+    _lines: The number of newlines in the document before each piece.
+    _dirty: The index of the first piece whose _starts/_lines are stale.
+    _length: The number of chars in the document.
+    _newline_total: The number of newline chars in the document.
+    version: A count of the edits made, so others can tell when the text
+             they looked at has changed.
+    listeners: A list of functions(offset, deleted, inserted) called after
+               every edit, like the UndoTree recording it.
+    """
+
+    def __init__(self, text="", newlines=None):
+        """Initializes a TextBuffer holding the inputted text.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        text: a str, the initial document, defaults to "".
+        newlines: an array with the offsets of the newline chars of text,
+                  as returned by line_index() in an earlier session, found
+                  by scanning text by default.
+        """
+
+        self._buffers = [text]
+        if newlines is None:
+            newlines = find_newlines(text)
+        self._newlines = [newlines]
+        self._pieces = []
+        self._starts = []
+        self._lines = []
+        self._dirty = 0
+        self._length = len(text)
+        self._newline_total = len(self._newlines[0])
+        self.version = 0
+        self.listeners = []
+
+        # The whole original text starts out as a single piece
+        if text:
+            self._pieces.append((0, 0, len(text), self._newline_total))
+
+    def __len__(self):
+        """Returns the number of chars in the document."""
+
+        return self._length
+
+    def line_count(self):
+        """Returns the number of lines in the document, at least 1."""
+
+        return self._newline_total + 1
+
+    def line_index(self):
+        """Returns the offsets of the newline chars of the text the buffer
+        was made with, or None once it has been edited."""
+
+        if self.version != 0:
+            return None
+
+        return self._newlines[0]
+
+    def snapshot(self):
+        """Returns a copy of this buffer that later edits will not change.
+
+        Only the list of pieces is copied; the text itself is shared, which
+        makes snapshots cheap enough to hand to a worker thread.
+        """
+
+        copy = TextBuffer.__new__(TextBuffer)
+        copy._buffers = list(self._buffers)
+        copy._newlines = list(self._newlines)
+        copy._pieces = list(self._pieces)
+        copy._starts = []
+        copy._lines = []
+        copy._dirty = 0
+        copy._length = self._length
+        copy._newline_total = self._newline_total
+        copy.version = self.version
+        copy.listeners = []
+
+        return copy
+
+    # The methods below read the document
+
+    def get_text(self, start=0, end=None):
+        """Returns the text between two offsets.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        start: an int, the offset of the first char, defaults to 0.
+        end: an int, the offset after the last char, defaults to the end.
+        """
+
+        return ''.join(self.iter_chunks(start, end))
+
+    def iter_chunks(self, start=0, end=None, size=CHUNK_SIZE):
+        """Yields the text between two offsets as a series of strs.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        start: an int, the offset of the first char, defaults to 0.
+        end: an int, the offset after the last char, defaults to the end.
+        size: an int, the largest number of chars yielded at once.
+        """
+
+        start, end = self._clamp(start, end)
+        if start >= end:
+            return
+
+        # Walk the pieces from the one holding start
+        i = self._find_piece(start)
+        while start < end:
+            buf, piece_start, length, _ = self._pieces[i]
+            skip = start - self._starts[i]
+            stop = min(length, end - self._starts[i])
+            # Split long pieces into slices of at most size chars
+            for pos in range(skip, stop, size):
+                yield self._buffers[buf][piece_start + pos:
+                                         piece_start + min(pos + size, stop)]
+            start = self._starts[i] + stop
+            i += 1
+
+    def get_line(self, line):
+        """Returns the text of a line, without its newline char.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        line: an int, the line number (starting at 1).
+        """
+
+        return self.get_text(self.line_start(line), self.line_end(line))
+
+    def line_start(self, line):
+        """Returns the offset of the first char of a line.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        line: an int, the line number (starting at 1). Lines past the end
+              of the document give the offset of the end.
+        """
+
+        if line <= 1:
+            return 0
+        if line > self.line_count():
+            return self._length
+
+        return self._newline_offset(line - 2) + 1
+
+    def line_end(self, line):
+        """Returns the offset of the newline char that ends a line, or the
+        offset of the end of the document for the last line.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        line: an int, the line number (starting at 1).
+        """
+
+        if line >= self.line_count():
+            return self._length
+
+        return self._newline_offset(max(line, 1) - 1)
+
+    def line_of(self, offset):
+        """Returns the number of the line holding an offset.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        offset: an int, an offset in the document.
+        """
+
+        offset = min(max(offset, 0), self._length)
+        if offset == self._length:
+            return self.line_count()
+
+        # Count the newlines of the piece that come before offset
+        i = self._find_piece(offset)
+        buf, piece_start, _, _ = self._pieces[i]
+        newlines = self._newlines[buf]
+        before = (bisect_left(newlines, piece_start + offset - self._starts[i])
+                  - bisect_left(newlines, piece_start))
+
+        return self._lines[i] + before + 1
+
+    def offset_to_index(self, offset):
+        """Returns the (line, column) pair of an offset.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        offset: an int, an offset in the document.
+        """
+
+        offset = min(max(offset, 0), self._length)
+        line = self.line_of(offset)
+
+        return line, offset - self.line_start(line)
+
+    def index_to_offset(self, line, column):
+        """Returns the offset of a (line, column) pair. Like Tkinter, columns
+        past the end of the line give the end of the line.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        line: an int, the line number (starting at 1).
+        column: an int, the column number (starting at 0).
+        """
+
+        if line > self.line_count():
+            return self._length
+
+        start = self.line_start(line)
+
+        return start + min(max(column, 0), self.line_end(line) - start)
+
+    # The methods below change the document
+
+    def insert(self, offset, text):
+        """Inserts text into the document.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        offset: an int, where the text is inserted.
+        text: the str that is inserted.
+        """
+
+        if not text:
+            return
+        offset = min(max(offset, 0), self._length)
+        i = self._find_piece(offset)
+
+        # Typing extends the last inserted buffer instead of adding a piece
+        if not self._extend_piece(i, offset, text):
+            buf = len(self._buffers)
+            self._buffers.append(text)
+            self._newlines.append(find_newlines(text))
+            new_piece = (buf, 0, len(text), len(self._newlines[buf]))
+
+            # Split the piece holding offset in two if needed
+            if i < len(self._pieces) and offset > self._starts[i]:
+                old_buf, old_start, old_length, _ = self._pieces[i]
+                split = offset - self._starts[i]
+                self._pieces[i:i + 1] = [
+                    self._make_piece(old_buf, old_start, split),
+                    new_piece,
+                    self._make_piece(old_buf, old_start + split,
+                                     old_length - split)]
+            else:
+                self._pieces.insert(i, new_piece)
+            self._dirty = min(self._dirty, i)
+
+        self._length += len(text)
+        self._newline_total += text.count('\n')
+        self.version += 1
+        for listener in self.listeners:
+            listener(offset, "", text)
+
+    def delete(self, offset, length):
+        """Deletes text from the document.
+
+        Parameters
+        ----------
+        self: TextBuffer instance.
+        offset: an int, the offset of the first char deleted.
+        length: an int, the number of chars deleted.
+
+        Returns
+        -------
+        The str that was deleted.
+        """
+
+        start, end = self._clamp(offset, offset + length)
+        if start >= end:
+            return ""
+        deleted = self.get_text(start, end)
+
+        # Keep the parts of the first and last pieces outside of the range
+        i = self._find_piece(start)
+        j = self._find_piece(end)
+        kept = []
+        if start > self._starts[i]:
+            buf, piece_start, _, _ = self._pieces[i]
+            kept.append(self._make_piece(buf, piece_start,
+                                         start - self._starts[i]))
+        stop = j
+        if j < len(self._pieces) and end > self._starts[j]:
+            buf, piece_start, piece_length, _ = self._pieces[j]
+            cut = end - self._starts[j]
+            kept.append(self._make_piece(buf, piece_start + cut,
+                                         piece_length - cut))
+            stop = j + 1
+        self._pieces[i:stop] = kept
+        self._dirty = min(self._dirty, i)
+
+        self._length -= len(deleted)
+        self._newline_total -= deleted.count('\n')
+        self.version += 1
+        for listener in self.listeners:
+            listener(start, deleted, "")
+
+        return deleted
+
+    def compact(self):
+        """Frees the text deleted from the document: buffers no piece uses
+        are dropped, and a buffer mostly deleted is cut down to the part its
+        piece uses, like the old lines dropped from a followed log. The
+        document is unchanged, and snapshots keep the buffers they use."""
+
+        used = {}
+        for piece in self._pieces:
+            used[piece[0]] = used.get(piece[0], 0) + 1
+        renumber = {}
+        buffers = []
+        newlines = []
+        cut = {}
+        for buf in sorted(used):
+            renumber[buf] = len(buffers)
+            text = self._buffers[buf]
+            buffers.append(text)
+            newlines.append(self._newlines[buf])
+            cut[buf] = 0
+        for i, (buf, start, length, count) in enumerate(self._pieces):
+            # Copying out the text costs less than the text it frees
+            if used[buf] == 1 and length * 2 < len(self._buffers[buf]):
+                new = renumber[buf]
+                buffers[new] = self._buffers[buf][start:start + length]
+                newlines[new] = find_newlines(buffers[new])
+                cut[buf] = start
+            self._pieces[i] = (renumber[buf], start - cut[buf], length, count)
+        self._buffers = buffers
+        self._newlines = newlines
+
+    # The methods below are helpers for the ones above
+
+    def _clamp(self, start, end):
+        """Returns the (start, end) pair limited to the document."""
+
+        if end is None or end > self._length:
+            end = self._length
+
+        return max(start, 0), end
+
+    def _make_piece(self, buf, start, length):
+        """Returns a piece tuple, counting the newlines it holds."""
+
+        newlines = self._newlines[buf]
+        count = (bisect_left(newlines, start + length)
+                 - bisect_left(newlines, start))
+
+        return (buf, start, length, count)
+
+    def _extend_piece(self, i, offset, text):
+        """Appends text to the piece ending at offset when that piece is the
+        tail of the newest buffer. Returns whether the text was appended."""
+
+        if i == 0 or len(self._buffers) == 1:
+            return False
+        buf, piece_start, length, count = self._pieces[i - 1]
+        old = self._buffers[buf]
+        if (buf != len(self._buffers) - 1 or piece_start + length != len(old)
+                or self._starts[i - 1] + length != offset
+                or len(old) + len(text) > COALESCE_LIMIT):
+            return False
+
+        # Older snapshots keep the previous str, the newline list only grows
+        self._buffers[buf] = old + text
+        self._newlines[buf].extend(find_newlines(text, len(old)))
+        self._pieces[i - 1] = (buf, piece_start, length + len(text),
+                               count + text.count('\n'))
+        self._dirty = min(self._dirty, i)
+
+        return True
+
+    def _refresh(self):
+        """Brings _starts and _lines up to date from the first stale piece.
+        This is linear in the number of pieces after it, a tree of pieces
+        would make it O(log n) but every edit would pay for rebalancing."""
+
+        count = len(self._pieces)
+        if self._dirty >= count and len(self._starts) == count:
+            return
+
+        # Rebuild the running totals from the last piece that is still valid
+        first = min(self._dirty, len(self._starts), count)
+        del self._starts[first:]
+        del self._lines[first:]
+        if first:
+            offset = self._starts[-1] + self._pieces[first - 1][2]
+            line = self._lines[-1] + self._pieces[first - 1][3]
+        else:
+            offset = line = 0
+        for _, _, length, newlines in self._pieces[first:]:
+            self._starts.append(offset)
+            self._lines.append(line)
+            offset += length
+            line += newlines
+        self._dirty = count
+
+    def _find_piece(self, offset):
+        """Returns the index of the piece holding offset, or the number of
+        pieces if offset is the end of the document."""
+
+        self._refresh()
+        if offset >= self._length:
+            return len(self._pieces)
+
+        return bisect_right(self._starts, offset) - 1
+
+    def _newline_offset(self, n):
+        """Returns the offset in the document of the nth newline char,
+        counting from 0."""
+
+        self._refresh()
+
+        # The last piece starting before the nth newline holds it
+        i = bisect_right(self._lines, n) - 1
+        buf, piece_start, _, _ = self._pieces[i]
+        newlines = self._newlines[buf]
+        pos = newlines[bisect_left(newlines, piece_start) + n - self._lines[i]]
+
+        return self._starts[i] + pos - piece_start
@@ -0,0 +1,295 @@
+"""This module keeps the undo history of a tVIM window for 'u' and Ctrl-R.
+
+Every edit of the buffer is recorded as an (offset, deleted, inserted) delta,
+so undoing or redoing a change costs as much as the change itself, never a
+copy of the document. The deltas of one command, or of one stretch of typing
+in insert mode, are grouped into a single entry, and keystrokes that extend
+the previous one are merged into a single delta.
+
+Entries form a tree: editing after an undo starts a new branch instead of
+throwing the undone entries away. The text kept by the tree is capped, and
+the oldest entries are forgotten once the cap is reached.
+"""
+
+from collections import deque
+
+
+# The number of chars (plus DELTA_COST per delta) the history may keep
+UNDO_LIMIT = 16 << 20
+
+# What a delta costs on top of its text, roughly the size of its tuple
+DELTA_COST = 64
+
+# Typed text is merged into the previous delta up to this many chars, so a
+# long insert made in chunks (like the output of ':%!cmd') is not copied
+# again with every chunk
+MERGE_LIMIT = 4096
+
+
+class UndoEntry():
+    """The UndoEntry class is one node of the undo tree, the edits of a
+    single command.
+
+    Instance vars
+    -------------
+    deltas: A list of (offset, deleted, inserted) tuples, in the order the
+            edits were made, or None once the entry has been forgotten.
+    parent: The UndoEntry before this one, or None for the root.
+    children: A list of the UndoEntrys made after this one, newest last.
+    redo_child: The child that Ctrl-R goes to, the last one undone.
+    size: The cost of the deltas, as counted against the limit.
+    """
+
+    __slots__ = ("deltas", "parent", "children", "redo_child", "size")
+
+    def __init__(self, parent):
+        """Initializes an UndoEntry with no edits under a parent."""
+
+        self.deltas = []
+        self.parent = parent
+        self.children = []
+        self.redo_child = None
+        self.size = 0
+
+
+class UndoTree():
+    """The UndoTree class records the edits of a TextBuffer and undoes or
+    redoes them through a view.
+
+    Instance vars
+    -------------
+    buffer: The TextBuffer whose edits are recorded.
+    limit: The most chars (plus DELTA_COST per delta) kept in the tree.
+    size: The cost of every entry in the tree.
+    root: The empty entry before the oldest entry kept.
+    current: The entry whose edits were the last ones applied.
+    _entries: A deque of the entries in the order they were made, for
+              forgetting the oldest first. Forgotten ones have no deltas.
+    _open: Whether new edits are added to current instead of a new entry.
+    _applying: Whether the edits being made are an undo or a redo.
+    """
+
+    def __init__(self, buffer, limit=UNDO_LIMIT):
+        """Initializes an empty UndoTree and starts recording a buffer.
+
+        Parameters
+        ----------
+        self: UndoTree instance.
+        buffer: a TextBuffer, or a LargeFile which is never edited.
+        limit: an int, the cap on the text kept, defaults to UNDO_LIMIT.
+        """
+
+        self.buffer = buffer
+        self.limit = limit
+        self.size = 0
+        self.root = UndoEntry(None)
+        self.current = self.root
+        self._entries = deque()
+        self._open = False
+        self._applying = False
+
+        if hasattr(buffer, "listeners"):
+            buffer.listeners.append(self.record)
+
+    def close(self):
+        """Ends the current entry, the next edit starts a new one. Called
+        before every command, so each command is a single entry."""
+
+        self._open = False
+
+    def resume(self, entry):
+        """Adds the next edits to an entry again, like an edit made over
+        several frames while the keys typed meanwhile closed it. Does
+        nothing unless the entry is still the current one.
+
+        Parameters
+        ----------
+        self: UndoTree instance.
+        entry: an UndoEntry, as current was after the first edit.
+        """
+
+        if entry is self.current and entry is not self.root:
+            self._open = True
+
+    def record(self, offset, deleted, inserted):
+        """Adds an edit of the buffer to the current entry, or to a new entry
+        if the current one is closed. Called by the buffer on every edit.
+
+        Parameters
+        ----------
+        self: UndoTree instance.
+        offset: an int, where the edit was made.
+        deleted: the str that was deleted there.
+        inserted: the str that was inserted there.
+        """
+
+        if self._applying:
+            return
+
+        if not self._open:
+            entry = UndoEntry(self.current)
+            self.current.children.append(entry)
+            self.current.redo_child = entry
+            self.current = entry
+            self._entries.append(entry)
+            self._open = True
+
+        entry = self.current
+        before = entry.size
+        if not (entry.deltas and self._merge(entry, offset, deleted, inserted)):
+            entry.deltas.append((offset, deleted, inserted))
+            entry.size += len(deleted) + len(inserted) + DELTA_COST
+        self.size += entry.size - before
+
+        if self.size > self.limit:
+            self._evict()
+
+    def undo(self, view):
+        """Reverts the current entry through a view.
+
+        Parameters
+        ----------
+        self: UndoTree instance.
+        view: the view of the buffer, so the window shows the change.
+
+        Returns
+        -------
+        The offset where the change was made, or None if there is nothing
+        to undo.
+        """
+
+        self.close()
+        entry = self.current
+        if entry is self.root:
+            return None
+
+        self._applying = True
+        try:
+            for offset, deleted, inserted in reversed(entry.deltas):
+                if inserted:
+                    view.delete(offset, len(inserted))
+                if deleted:
+                    view.insert(offset, deleted)
+        finally:
+            self._applying = False
+        entry.parent.redo_child = entry
+        self.current = entry.parent
+
+        return min(delta[0] for delta in entry.deltas)
+
+    def redo(self, view):
+        """Applies again the entry undone last through a view.
+
+        Parameters
+        ----------
+        self: UndoTree instance.
+        view: the view of the buffer, so the window shows the change.
+
+        Returns
+        -------
+        The offset where the change was made, or None if there is nothing
+        to redo.
+        """
+
+        self.close()
+        entry = self.current.redo_child
+        if entry is None:
+            return None
+
+        self._applying = True
+        try:
+            for offset, deleted, inserted in entry.deltas:
+                if deleted:
+                    view.delete(offset, len(deleted))
+                if inserted:
+                    view.insert(offset, inserted)
+        finally:
+            self._applying = False
+        self.current = entry
+
+        return min(delta[0] for delta in entry.deltas)
+
+    def _merge(self, entry, offset, deleted, inserted):
+        """Merges an edit into the last delta of an entry when it continues
+        it, like a typed char after the previous one or a backspace over
+        it. Returns whether the edit was merged."""
+
+        last_offset, last_deleted, last_inserted = entry.deltas[-1]
+        end = last_offset + len(last_inserted)
+
+        # Typing right after the text inserted last
+        if (not deleted and offset == end
+                and len(last_inserted) + len(inserted) <= MERGE_LIMIT):
+            entry.deltas[-1] = (last_offset, last_deleted,
+                                last_inserted + inserted)
+            entry.size += len(inserted)
+            return True
+
+        # Backspacing over the end of the text inserted last
+        if (not inserted and offset + len(deleted) == end
+                and offset >= last_offset):
+            entry.deltas[-1] = (last_offset, last_deleted,
+                                last_inserted[:offset - last_offset])
+            entry.size -= len(deleted)
+            return True
+
+        # Deleting forward from where the last delete was made
+        if not inserted and not last_inserted and offset == last_offset:
+            entry.deltas[-1] = (last_offset, last_deleted + deleted, "")
+            entry.size += len(deleted)
+            return True
+
+        return False
+
+    def _evict(self):
+        """Forgets the oldest entries until the tree is down to 3/4 of its
+        limit, so the walk up the tree is only made once in a while. The
+        entry being recorded into is always kept."""
+
+        path = []
+        entry = self.current
+        while entry is not self.root:
+            path.append(entry)
+            entry = entry.parent
+
+        while self.size > self.limit * 3 // 4 and self._entries:
+            # Entries are made after their parent, so the oldest one left
+            # is always a child of the root
+            oldest = self._entries[0]
+            if oldest.deltas is None:
+                self._entries.popleft()
+                continue
+            if oldest is self.current:
+                break
+            self._entries.popleft()
+
+            # The oldest entry leading to current becomes the new root and
+            # the branches off the old root are forgotten with it
+            if oldest is path[-1]:
+                path.pop()
+                for child in self.root.children:
+                    if child is not oldest:
+                        self._drop(child)
+                self.size -= oldest.size
+                oldest.deltas = []
+                oldest.size = 0
+                oldest.parent = None
+                self.root = oldest
+
+            # An older branch that was undone is forgotten whole
+            else:
+                self.root.children.remove(oldest)
+                if self.root.redo_child is oldest:
+                    self.root.redo_child = path[-1]
+                self._drop(oldest)
+
+    def _drop(self, entry):
+        """Forgets an entry and every entry after it."""
+
+        stack = [entry]
+        while stack:
+            entry = stack.pop()
+            self.size -= entry.size
+            entry.deltas = None
+            entry.size = 0
+            stack.extend(entry.children)